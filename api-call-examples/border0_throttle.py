@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""Client-side rate limiting and adaptive concurrency for Border0 API calls.
+
+Every request first takes a slot in an AIMD (additive increase, multiplicative decrease)
+concurrency window and then a token from a token bucket. The window starts at `max_concurrency`,
+so a caller asking for N concurrent requests gets N right away. Given a smaller
+`initial_concurrency` it instead doubles every round trip until the API pushes back. After the
+first push back it grows by one request per round trip while the recent average latency stays
+within `latency_tolerance` times the long-term average.
+A 429, 5xx or connection error halves both the window and the request rate, at most once per
+round trip so one burst of errors counts as a single throttle event. Every successful response
+then gives back 1% of the configured rate, so the rate is restored after about 100 requests.
+
+Throttle is for threads, AsyncThrottle for asyncio. Both report the current rate, window,
+in-flight count and throttle events through stats().
+
+Scripts that do not take the settings on the command line use Throttle.from_env(), configured
+with BORDER0_RATE_LIMIT (requests per second, 0 to disable) and BORDER0_MAX_CONCURRENCY.
+
+listed() unpacks the list responses of the Border0 API for the scripts that share this module.
+"""
+
+import asyncio
+import contextlib
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Iterator
+
+DEFAULT_RATE_LIMIT = 50.0
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_LATENCY_TOLERANCE = 2.0
+DEFAULT_DECREASE_FACTOR = 0.5
+
+RATE_RECOVERY = 0.01
+RECENT_LATENCY_WEIGHT = 0.3
+BASELINE_LATENCY_WEIGHT = 0.02
+
+ENV_RATE_LIMIT = "BORDER0_RATE_LIMIT"
+ENV_MAX_CONCURRENCY = "BORDER0_MAX_CONCURRENCY"
+
+# responses that mean the API is overloaded or asking us to slow down
+THROTTLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class Slot:
+    """A request in flight. Record the response status before leaving the slot, a slot left
+    without a status counts as a connection error unless its task was cancelled."""
+
+    def __init__(self) -> None:
+        self.started_at = time.monotonic()
+        self.status: int | None = None
+
+    def record(self, status: int) -> None:
+        self.status = status
+
+
+class _Controller:
+    """Token bucket and AIMD window shared by Throttle and AsyncThrottle. Not thread-safe,
+    callers hold their lock."""
+
+    def __init__(self, rate: float, burst: int | None, min_concurrency: int, initial_concurrency: int | None,
+                 max_concurrency: int, latency_tolerance: float, decrease_factor: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = float(burst or max(1, int(rate)))
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        if initial_concurrency is None:
+            initial_concurrency = self.max_concurrency
+        self.limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.slow_start = True
+        # short- and long-term moving averages: a slow endpoint raises both, queueing only the first
+        self.recent_latency: float | None = None
+        self.baseline_latency: float | None = None
+        self.last_decrease_at = float("-inf")
+
+        self.in_flight = 0
+        self.requests = 0
+        self.throttle_events = 0
+
+    def has_room(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def reserve(self) -> float:
+        """Take a token, returning how long to wait before it may be used."""
+        if self.max_rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        # tokens may go negative: later callers queue up behind earlier ones instead of racing
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self) -> None:
+        """Give back the token of a request abandoned before it was sent."""
+        if self.max_rate > 0:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+    def observe(self, status: int | None, latency: float) -> None:
+        """Adjust the window and rate to the outcome of one request."""
+        self.requests += 1
+        if status is None or status in THROTTLE_STATUS_CODES:
+            now = time.monotonic()
+            if now - self.last_decrease_at < (self.recent_latency or latency):
+                return
+            self.last_decrease_at = now
+            self.slow_start = False
+            self.throttle_events += 1
+            self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+            if self.max_rate > 0:
+                self.rate = max(min(1.0, self.max_rate), self.rate * self.decrease_factor)
+            return
+
+        if self.recent_latency is None or self.baseline_latency is None:
+            self.recent_latency = self.baseline_latency = latency
+        self.recent_latency += (latency - self.recent_latency) * RECENT_LATENCY_WEIGHT
+        self.baseline_latency += (latency - self.baseline_latency) * BASELINE_LATENCY_WEIGHT
+        if self.recent_latency > self.baseline_latency * self.latency_tolerance:
+            # queueing somewhere: hold the window where it is
+            self.slow_start = False
+            return
+        # +1 per response doubles the window every round trip, +1/limit adds one per round trip
+        self.limit = min(self.max_concurrency, self.limit + (1.0 if self.slow_start else 1.0 / self.limit))
+        if self.max_rate > 0:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "rate": round(self.rate, 2) if self.max_rate > 0 else None,
+            "concurrency_limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "latency": round(self.recent_latency, 4) if self.recent_latency is not None else None,
+            "requests": self.requests,
+            "throttle_events": self.throttle_events,
+        }
+
+
+class Throttle:
+    """Rate limiter and adaptive concurrency window shared by all threads of a client."""
+
+    def __init__(self, rate: float = DEFAULT_RATE_LIMIT, burst: int | None = None,
+                 min_concurrency: int = DEFAULT_MIN_CONCURRENCY,
+                 initial_concurrency: int | None = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 latency_tolerance: float = DEFAULT_LATENCY_TOLERANCE,
+                 decrease_factor: float = DEFAULT_DECREASE_FACTOR):
+        self.controller = _Controller(rate, burst, min_concurrency, initial_concurrency, max_concurrency,
+                                      latency_tolerance, decrease_factor)
+        self.condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls, **kwargs: Any) -> "Throttle":
+        """Build a Throttle configured by BORDER0_RATE_LIMIT and BORDER0_MAX_CONCURRENCY."""
+        return cls(rate=float(os.environ.get(ENV_RATE_LIMIT, DEFAULT_RATE_LIMIT)),
+                   max_concurrency=int(os.environ.get(ENV_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY)), **kwargs)
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[Slot]:
+        """Wait for room in the window and a token, then hold a slot for one request."""
+        with self.condition:
+            while not self.controller.has_room():
+                self.condition.wait()
+            self.controller.in_flight += 1
+            wait = self.controller.reserve()
+
+        slot = None
+        try:
+            if wait:
+                time.sleep(wait)
+            slot = Slot()
+            yield slot
+        finally:
+            with self.condition:
+                self.controller.in_flight -= 1
+                # interrupted while waiting for its token: nothing was sent, so nothing to observe
+                if slot is None:
+                    self.controller.refund()
+                else:
+                    self.controller.observe(slot.status, time.monotonic() - slot.started_at)
+                self.condition.notify_all()
+
+    def call(self, request: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Send one request, e.g. call(requests.post, url, json=...), and return its response."""
+        with self.slot() as slot:
+            response = request(*args, **kwargs)
+            slot.record(response.status_code)
+        return response
+
+    def stats(self) -> dict[str, Any]:
+        """Current rate, window, in-flight count, requests sent and throttle events."""
+        with self.condition:
+            return self.controller.stats()
+
+
+class AsyncThrottle:
+    """asyncio counterpart of Throttle, shared by all coroutines of a client."""
+
+    def __init__(self, rate: float = DEFAULT_RATE_LIMIT, burst: int | None = None,
+                 min_concurrency: int = DEFAULT_MIN_CONCURRENCY,
+                 initial_concurrency: int | None = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 latency_tolerance: float = DEFAULT_LATENCY_TOLERANCE,
+                 decrease_factor: float = DEFAULT_DECREASE_FACTOR):
+        self.controller = _Controller(rate, burst, min_concurrency, initial_concurrency, max_concurrency,
+                                      latency_tolerance, decrease_factor)
+        self.condition = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[Slot]:
+        """Wait for room in the window and a token, then hold a slot for one request."""
+        async with self.condition:
+            await self.condition.wait_for(self.controller.has_room)
+            self.controller.in_flight += 1
+            wait = self.controller.reserve()
+
+        slot = None
+        cancelled = False
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            slot = Slot()
+            yield slot
+        except asyncio.CancelledError:
+            # a request given up on says nothing about the API, unlike a connection error
+            cancelled = True
+            raise
+        finally:
+            # released without awaiting, so a second cancellation can't keep the slot
+            self.controller.in_flight -= 1
+            if slot is None:
+                self.controller.refund()
+            elif not cancelled:
+                self.controller.observe(slot.status, time.monotonic() - slot.started_at)
+            await asyncio.shield(self._notify_all())
+
+    async def _notify_all(self) -> None:
+        async with self.condition:
+            self.condition.notify_all()
+
+    def stats(self) -> dict[str, Any]:
+        """Current rate, window, in-flight count, requests sent and throttle events."""
+        return self.controller.stats()
+
+
+def listed(data: Any) -> list[Any]:
+    """Items of a list response, which is either a JSON array or an object with a "list" array."""
+    if isinstance(data, dict):
+        return data.get("list") or []
+    return data or []
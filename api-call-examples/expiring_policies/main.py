@@ -1,15 +1,24 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import json
 import time
 import requests
 
+# the throttle is shared with the other API examples one directory up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from border0_throttle import Throttle
+
 ENV_BORDER0_TOKEN = "BORDER0_TOKEN"
 ENV_BORDER0_API_URL = "BORDER0_API_URL"
 
+# client-side rate limit and adaptive concurrency, see border0_throttle.py
+THROTTLE = Throttle.from_env()
+
 def create_policy(token: str, name: str, policy_data: dict, expiry: int):
-    response = requests.post(
+    response = THROTTLE.call(
+        requests.post,
         url=f"{os.environ.get(ENV_BORDER0_API_URL, "https://api.border0.com/api/v1")}/policies",
         headers={
             "Authorization": f"Bearer {token}",
@@ -1,11 +1,29 @@
 #!/usr/bin/env python3
 
+import argparse
+import hashlib
+import itertools
+import json
 import os
+import queue
 import random
 import string
+import sys
+import threading
 import time
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+
+# the throttle lives next to this script, which may be run or imported from anywhere
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from border0_throttle import DEFAULT_MAX_CONCURRENCY, ENV_MAX_CONCURRENCY, Throttle, listed
+
+try:
+    import yaml
+except ImportError:  # only needed for YAML manifests
+    yaml = None
 
 # Ensure the token is available
 token = os.getenv("BORDER0_ADMIN_TOKEN")
@@ -20,11 +38,72 @@ if not token:
         exit(1)
 
 # Base URL and Headers
-base_url = "https://api.border0.com/api/v1"
+base_url = os.getenv("BORDER0_API_URL", "https://api.border0.com/api/v1")
 headers = {
     "accept": "application/json",
     "Authorization": f"Bearer {token}",
 }
+# (connect, read) timeouts in seconds
+timeout = (5, 30)
+# sockets created in parallel per run
+default_workers = 8
+# items per page when listing connectors and sockets
+list_page_size = 100
+
+# client-side rate limit and adaptive concurrency, see border0_throttle.py
+THROTTLE = Throttle.from_env()
+
+# one keep-alive session shared by all threads, with a connection for every request the throttle lets through
+session = requests.Session()
+session.headers.update(headers)
+adapter = HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=int(os.getenv(ENV_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY)),
+)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+
+
+class APIError(Exception):
+    """A Border0 API call that did not answer 200."""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"{status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+def api_request(method, path, data=None):
+    response = THROTTLE.call(
+        session.request, method, f"{base_url}/{path}", json=data, timeout=timeout
+    )
+    if not 200 <= response.status_code < 300:
+        raise APIError(response.status_code, response.text)
+    return response.json() if response.content else None
+
+
+def api_post(path, data):
+    return api_request("POST", path, data)
+
+
+def list_all(path, page_size=list_page_size):
+    """Every item of a list endpoint, walking the pages until a short or empty one."""
+    items = []
+    for page in itertools.count(1):
+        try:
+            batch = listed(api_request("GET", f"{path}?page={page}&page_size={page_size}"))
+        except APIError as e:
+            # past the last page, the API may answer with a 404
+            if e.status_code == 404 and page > 1:
+                break
+            raise
+        # an endpoint that ignores the paging parameters answers every page with the first one
+        if page > 1 and batch and batch[0] == items[0]:
+            break
+        items.extend(batch)
+        if len(batch) < page_size:
+            break
+    return items
 
 
 def random_string(length=10):
@@ -32,19 +111,20 @@ def random_string(length=10):
     return "".join(random.choice(letters) for i in range(length))
 
 
-def create_connector():
-    connector_data = {
-        "name": f"connector-{random_string()}",
-        "description": f"description-for-the-connector-{random_string()}",
+def connector_request(name=None, description=None):
+    return {
+        "name": name or f"connector-{random_string()}",
+        "description": description or f"description-for-the-connector-{random_string()}",
         "built_in_ssh_service_enabled": True,
     }
-    response = requests.post(
-        f"{base_url}/connector", headers=headers, json=connector_data
-    )
-    if response.status_code != 200:
-        print(f"Error creating connector: {response.text}")
+
+
+def create_connector(name=None, description=None):
+    try:
+        return api_post("connector", connector_request(name, description))["connector_id"]
+    except (APIError, requests.RequestException) as e:
+        print(f"Error creating connector: {e}")
         return None
-    return response.json()["connector_id"]
 
 
 def create_connector_token(connector_id, token_name):
@@ -62,163 +142,666 @@ def create_connector_token(connector_id, token_name):
         "name": token_name,
         "expires_at": expires_at,
     }
-    response = requests.post(
-        f"{base_url}/connector/token", headers=headers, json=token_data
-    )
-    if response.status_code != 200:
-        print(f"Error creating connector token: {response.text}")
+    try:
+        return api_post("connector/token", token_data)["token"]
+    except (APIError, requests.RequestException) as e:
+        print(f"Error creating connector token: {e}")
         return None
-    return response.json()["token"]
 
 
-def create_socket(connector_id, socket_type, socket_config):
-    socket_data = {
-        "name": f"python3-{socket_type}-{random_string()}",
+def socket_request(connector_id, socket_type, socket_config, name=None, tags=None):
+    return {
+        "name": name or f"python3-{socket_type}-{random_string()}",
         "socket_type": socket_type if "sql" not in socket_type else "database",
         "recording_enabled": False,
         "connector_authentication_enabled": False,
         "connector_id": connector_id,
         "upstream_configuration": socket_config,
-        "tags": {
+        "tags": tags
+        or {
             "origin": "python3",
             "border0_client_subcategory": "The Cloud",
             "border0_client_category": "Playground",
         },
     }
 
-    response = requests.post(f"{base_url}/socket", headers=headers, json=socket_data)
-    if response.status_code != 200:
-        print(f"Error creating {socket_type} socket: {response.text}")
-        return None, None
-    result = response.json()
-    return result["socket_id"], result["dnsname"]
 
+def create_socket(connector_id, socket_type, socket_config, name=None, tags=None):
+    """Create one socket, returning a report entry with its id and DNS name, or the error."""
+    socket_data = socket_request(connector_id, socket_type, socket_config, name, tags)
+    result = {"socket_type": socket_type, "name": socket_data["name"]}
+    started = time.monotonic()
+    try:
+        created = api_post("socket", socket_data)
+        result.update(
+            status="created", socket_id=created["socket_id"], dnsname=created["dnsname"]
+        )
+    except Exception as e:
+        result.update(status="failed", error=str(e))
+    result["seconds"] = round(time.monotonic() - started, 3)
+    return result
 
-def main():
+
+def create_sockets(executor, connector_id, socket_types):
+    """Create sockets of the given types in parallel on `executor`, results in the same order."""
+    futures = [
+        executor.submit(create_socket, connector_id, socket_type, socket_configs[socket_type])
+        for socket_type in socket_types
+    ]
+    return [future.result() for future in futures]
+
+
+def provision_playground(executor, socket_types):
+    """Create a connector with a token and a socket of every given type, returning a report of it."""
+    started = time.monotonic()
+    report = {"connector_id": None, "connector_token": None, "sockets": []}
     connector_id = create_connector()
     if not connector_id:
-        print("Failed to create connector.")
-        exit(1)
+        report["error"] = "failed to create connector"
+        return report
+    report["connector_id"] = connector_id
 
-    connector_token = create_connector_token(
-        connector_id, f"token-name-{random_string()}"
+    # the token and the sockets only need the connector, so they are all created at once
+    token_future = executor.submit(
+        create_connector_token, connector_id, f"token-name-{random_string()}"
     )
-    if not connector_token:
-        print("Failed to create connector token.")
-        exit(1)
+    report["sockets"] = create_sockets(executor, connector_id, socket_types)
+    report["connector_token"] = token_future.result()
+    if not report["connector_token"]:
+        report["error"] = "failed to create connector token"
+    report["seconds"] = round(time.monotonic() - started, 3)
+    return report
 
-    print(
-        f"To start the connector execute: \n\n BORDER0_TOKEN={connector_token} border0 connector start \n"
-    )
 
-    socket_configs = {
-        "ssh": {
-            "service_type": "ssh",
-            "ssh_service_configuration": {
-                "ssh_service_type": "standard",
-                "standard_ssh_service_configuration": {
-                    "hostname": "ssh.playground.border0.io",
-                    "port": 22,
-                    "ssh_authentication_type": "username_and_password",
-                    "username_and_password_auth_configuration": {
-                        "username": "border0",
-                        "password": "Border0<3Ssh",
-                    },
+def print_report(report):
+    if report["connector_token"]:
+        print(
+            f"To start the connector {report.get('name', '')} execute: \n\n BORDER0_TOKEN={report['connector_token']} border0 connector start \n"
+        )
+    elif report.get("error"):
+        print(f"Failed to provision connector {report.get('name') or report['connector_id'] or ''}: {report['error']}")
+
+    for result in report["sockets"]:
+        if result["status"] == "created":
+            print(
+                f"Created {result['socket_type']} socket {result['socket_id']} with DNS {result['dnsname']} attached to connector {report['connector_id']}."
+            )
+        elif result["status"] == "exists":
+            print(f"Skipped {result['socket_type']} socket {result['name']}, created by an earlier run as {result['socket_id']}.")
+        elif result["status"] == "skipped":
+            print(f"Skipped {result['socket_type']} socket {result['name']}: {result['error']}")
+        else:
+            print(f"Failed to create {result['socket_type']} socket: {result['error']}")
+
+
+# Sockets created on every playground connector, by socket type
+socket_configs = {
+    "ssh": {
+        "service_type": "ssh",
+        "ssh_service_configuration": {
+            "ssh_service_type": "standard",
+            "standard_ssh_service_configuration": {
+                "hostname": "ssh.playground.border0.io",
+                "port": 22,
+                "ssh_authentication_type": "username_and_password",
+                "username_and_password_auth_configuration": {
+                    "username": "border0",
+                    "password": "Border0<3Ssh",
                 },
             },
         },
-        "http": {
-            "service_type": "http",
-            "http_service_configuration": {
-                "http_service_type": "standard",
-                "standard_http_service_configuration": {
-                    "host_header": "localhost",
-                    "hostname": "http.playground.border0.io",
-                    "port": 80,
-                },
+    },
+    "http": {
+        "service_type": "http",
+        "http_service_configuration": {
+            "http_service_type": "standard",
+            "standard_http_service_configuration": {
+                "host_header": "localhost",
+                "hostname": "http.playground.border0.io",
+                "port": 80,
             },
         },
-        "mysql": {
-            "service_type": "database",
-            "database_service_configuration": {
-                "database_service_type": "standard",
-                "standard_database_service_configuration": {
-                    "authentication_type": "username_and_password",
-                    "hostname": "mysql.playground.border0.io",
-                    "port": 3306,
-                    "protocol": "mysql",
-                    "username_and_password_auth_configuration": {
-                        "username": "border0",
-                        "password": "Border0<3MySql",
-                    },
+    },
+    "mysql": {
+        "service_type": "database",
+        "database_service_configuration": {
+            "database_service_type": "standard",
+            "standard_database_service_configuration": {
+                "authentication_type": "username_and_password",
+                "hostname": "mysql.playground.border0.io",
+                "port": 3306,
+                "protocol": "mysql",
+                "username_and_password_auth_configuration": {
+                    "username": "border0",
+                    "password": "Border0<3MySql",
                 },
             },
         },
-        "pgsql": {
-            "service_type": "database",
-            "database_service_configuration": {
-                "database_service_type": "standard",
-                "standard_database_service_configuration": {
-                    "authentication_type": "username_and_password",
-                    "hostname": "psql.playground.border0.io",
-                    "port": 5432,
-                    "protocol": "postgres",
-                    "username_and_password_auth_configuration": {
-                        "username": "border0",
-                        "password": "Border0<3Psql",
-                    },
+    },
+    "pgsql": {
+        "service_type": "database",
+        "database_service_configuration": {
+            "database_service_type": "standard",
+            "standard_database_service_configuration": {
+                "authentication_type": "username_and_password",
+                "hostname": "psql.playground.border0.io",
+                "port": 5432,
+                "protocol": "postgres",
+                "username_and_password_auth_configuration": {
+                    "username": "border0",
+                    "password": "Border0<3Psql",
                 },
             },
         },
-        "vnc": {
-            "service_type": "vnc",
-            "vnc_service_configuration": {
-                "hostname": "vnc.playground.border0.io",
-                "port": 5900,
-                "vnc_authentication_type": "password",
-                "password_auth_configuration": {
-                    "password": "Border0<3VNC",
-                },
+    },
+    "vnc": {
+        "service_type": "vnc",
+        "vnc_service_configuration": {
+            "hostname": "vnc.playground.border0.io",
+            "port": 5900,
+            "vnc_authentication_type": "password",
+            "password_auth_configuration": {
+                "password": "Border0<3VNC",
             },
         },
-        "rdp": {
-            "service_type": "rdp",
-            "rdp_service_configuration": {
-                "hostname": "rdp.playground.border0.io",
-                "port": 3389,
-                "rdp_authentication_type": "password",
-                "password_auth_configuration": {
-                    "password": "Border0<3RDP",
-                },
+    },
+    "rdp": {
+        "service_type": "rdp",
+        "rdp_service_configuration": {
+            "hostname": "rdp.playground.border0.io",
+            "port": 3389,
+            "rdp_authentication_type": "password",
+            "password_auth_configuration": {
+                "password": "Border0<3RDP",
             },
         },
-        "tls": {
-            "service_type": "tls",
-            "tls_service_configuration": {
-                "tls_service_type": "standard",
-                "standard_tls_service_configuration": {
-                    "hostname": "tls.playground.border0.io",
-                    "port": 9000,
-                },
+    },
+    "tls": {
+        "service_type": "tls",
+        "tls_service_configuration": {
+            "tls_service_type": "standard",
+            "standard_tls_service_configuration": {
+                "hostname": "tls.playground.border0.io",
+                "port": 9000,
             },
         },
-    }
+    },
+}
 
-    # Loop through all the socket types
-    socket_types = map(str.lower, socket_configs.keys())
-    for socket_type in socket_types:
-        try:
-            socket_id, socket_dns = create_socket(
-                connector_id, socket_type, socket_configs[socket_type]
-            )
-            if socket_id and socket_dns:
-                print(
-                    f"Created {socket_type} socket {socket_id} with DNS {socket_dns} attached to connector {connector_id}."
+
+# Bulk provisioning from a manifest, a YAML or JSON file like
+#
+#     connectors:
+#       - name: eu-west-1-prod
+#         description: Production, eu-west-1
+#         sockets:
+#           - name: prod-db
+#             type: pgsql
+#             upstream_configuration: {...}   # optional, defaults to socket_configs[type]
+#             tags: {team: data}              # optional, "origin: python3" is always added
+#
+# Connectors get a token unless they say `token: false`. Progress is checkpointed to a state file
+# after every object created, so a rerun skips what already exists instead of creating it twice.
+
+# follow-up work of a connector runs before connectors still waiting in the queue
+PRIORITY_FOLLOW_UP = 0
+PRIORITY_CONNECTOR = 1
+
+
+def load_manifest(path):
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ValueError("reading YAML manifests requires PyYAML, install it with: pip install pyyaml")
+            try:
+                manifest = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(f"{path} is not valid YAML: {e}")
+        else:
+            manifest = json.load(f)
+
+    connectors = manifest.get("connectors") if isinstance(manifest, dict) else None
+    if not isinstance(connectors, list):
+        raise ValueError(f"{path} must have a 'connectors' list")
+    connector_names, socket_names = set(), set()
+    for connector in connectors:
+        if not isinstance(connector, dict):
+            raise ValueError(f"every connector must be a mapping, got {connector!r}")
+        if not connector.get("name") or connector["name"] in connector_names:
+            raise ValueError(f"every connector needs a unique name, got {connector.get('name')!r}")
+        connector_names.add(connector["name"])
+        # an empty "sockets:" key in YAML is None
+        connector["sockets"] = connector.get("sockets") or []
+        if not isinstance(connector["sockets"], list):
+            raise ValueError(f"the sockets of connector {connector['name']} must be a list")
+        for socket in connector["sockets"]:
+            if not isinstance(socket, dict):
+                raise ValueError(f"every socket must be a mapping, got {socket!r}")
+            if not socket.get("name") or socket["name"] in socket_names:
+                raise ValueError(f"every socket needs a unique name, got {socket.get('name')!r}")
+            socket_names.add(socket["name"])
+            if not socket.get("type"):
+                raise ValueError(f"socket {socket['name']} has no type")
+            if "upstream_configuration" not in socket and socket["type"] not in socket_configs:
+                raise ValueError(
+                    f"socket {socket['name']} needs an upstream_configuration, there is no default for {socket['type']}"
+                )
+    return connectors
+
+
+class Checkpoint:
+    """What a manifest run created so far, by connector name, saved after every change."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connectors = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.connectors = json.load(f)["connectors"]
+
+    def connector(self, name):
+        with self.lock:
+            return dict(self.connectors.get(name, {}))
+
+    def socket(self, connector_name, socket_name):
+        with self.lock:
+            return self.connectors.get(connector_name, {}).get("sockets", {}).get(socket_name)
+
+    def record_connector(self, name, connector_id):
+        with self.lock:
+            self.connectors[name] = {"connector_id": connector_id, "token": None, "sockets": {}}
+            self._save()
+
+    def record_token(self, name, token):
+        with self.lock:
+            self.connectors[name]["token"] = token
+            self._save()
+
+    def record_socket(self, connector_name, socket_name, socket_id, dnsname):
+        with self.lock:
+            self.connectors[connector_name]["sockets"][socket_name] = {
+                "socket_id": socket_id,
+                "dnsname": dnsname,
+            }
+            self._save()
+
+    def _save(self):
+        write_private_json(self.path, {"connectors": self.connectors})
+
+
+def write_private_json(path, data):
+    """Write a file that holds connector tokens: readable by the owner only, and swapped in whole."""
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class Pipeline:
+    """Worker threads running queued tasks, which may queue follow-up tasks, until all are done."""
+
+    def __init__(self, workers):
+        self.queue = queue.PriorityQueue()
+        # keeps tasks of the same priority in order, and the tasks themselves out of comparisons
+        self.order = itertools.count()
+        self.workers = workers
+
+    def submit(self, priority, task, *args):
+        self.queue.put((priority, next(self.order), task, args))
+
+    def run(self):
+        for _ in range(self.workers):
+            threading.Thread(target=self._work, daemon=True).start()
+        self.queue.join()
+
+    def _work(self):
+        while True:
+            _, _, task, args = self.queue.get()
+            try:
+                task(*args)
+            except Exception as e:
+                print(f"An error occurred in {task.__name__}: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+
+def provision_manifest(connectors, checkpoint, workers):
+    """Create everything in the manifest that the checkpoint doesn't have yet, returning a report per connector."""
+    pipeline = Pipeline(workers)
+    reports = []
+    for connector in connectors:
+        report = {"name": connector["name"], "connector_id": None, "connector_token": None, "sockets": []}
+        reports.append(report)
+        pipeline.submit(PRIORITY_CONNECTOR, provision_connector, pipeline, checkpoint, connector, report)
+    pipeline.run()
+    return reports
+
+
+def provision_connector(pipeline, checkpoint, connector, report):
+    name = connector["name"]
+    done = checkpoint.connector(name)
+    if done:
+        report["connector_id"] = done["connector_id"]
+        report["status"] = "exists"
+    else:
+        connector_id = create_connector(name, connector.get("description", name))
+        if not connector_id:
+            report["status"] = "failed"
+            report["error"] = "failed to create connector"
+            for socket in connector["sockets"]:
+                report["sockets"].append(
+                    {"socket_type": socket["type"], "name": socket["name"], "status": "skipped",
+                     "error": "connector was not created"}
+                )
+            return
+        checkpoint.record_connector(name, connector_id)
+        report["connector_id"] = connector_id
+        report["status"] = "created"
+
+    # the token and sockets start now, not after the connectors queued behind this one
+    if connector.get("token", True):
+        pipeline.submit(PRIORITY_FOLLOW_UP, provision_connector_token, checkpoint, connector, report)
+    for socket in connector["sockets"]:
+        result = {"socket_type": socket["type"], "name": socket["name"]}
+        report["sockets"].append(result)
+        pipeline.submit(PRIORITY_FOLLOW_UP, provision_socket, checkpoint, connector, socket, report, result)
+
+
+def provision_connector_token(checkpoint, connector, report):
+    token = checkpoint.connector(connector["name"]).get("token")
+    if not token:
+        token = create_connector_token(report["connector_id"], connector.get("token_name", f"{connector['name']}-token"))
+        if not token:
+            report["error"] = "failed to create connector token"
+            return
+        checkpoint.record_token(connector["name"], token)
+    report["connector_token"] = token
+
+
+def provision_socket(checkpoint, connector, socket, report, result):
+    done = checkpoint.socket(connector["name"], socket["name"])
+    if done:
+        result.update(status="exists", **done)
+        return
+    desired = desired_socket(connector["name"], socket)
+    created = create_socket(
+        report["connector_id"],
+        desired["type"],
+        desired["upstream_configuration"],
+        name=desired["name"],
+        tags=desired["tags"],
+    )
+    result.update(created)
+    if created["status"] == "created":
+        checkpoint.record_socket(connector["name"], socket["name"], created["socket_id"], created["dnsname"])
+
+
+def desired_socket(connector_name, socket):
+    """A manifest socket as it should exist, tagged with its connector and a hash of its configuration."""
+    config = socket.get("upstream_configuration", socket_configs.get(socket["type"]))
+    tags = {"origin": "python3", "connector": connector_name, **socket.get("tags", {})}
+    # the API may not return the configuration as it was sent (e.g. without passwords), reconcile
+    # compares this hash instead
+    tags["config_hash"] = hashlib.sha256(
+        json.dumps([socket["type"], config, tags], sort_keys=True).encode()
+    ).hexdigest()[:16]
+    return {"name": socket["name"], "type": socket["type"], "upstream_configuration": config, "tags": tags}
+
+
+# Reconcile: make the connectors and sockets of a manifest (or the playground sockets of one named
+# connector) exist exactly as described. Existing connectors and sockets are listed once, then only
+# the differences are applied: missing connectors and sockets are created, sockets whose
+# configuration hash differs are updated, and sockets tagged "origin: python3" on one of the
+# connectors that are no longer described are deleted. A rerun without changes makes no write calls.
+
+
+def fetch_existing():
+    """All connectors by name, and the sockets this script created by name, listing both in parallel."""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        connectors = executor.submit(list_all, "connectors")
+        sockets = executor.submit(list_all, "sockets")
+        connectors = {c["name"]: c for c in connectors.result()}
+        sockets = {
+            s["name"]: s
+            for s in sockets.result()
+            if (s.get("tags") or {}).get("origin") == "python3"
+        }
+    return connectors, sockets
+
+
+def plan_reconcile(connectors, existing_connectors, existing_sockets):
+    """The actions that make the existing connectors and sockets match the desired ones."""
+    actions = []
+    desired_names = set()
+    for connector in connectors:
+        existing = existing_connectors.get(connector["name"])
+        sockets = [desired_socket(connector["name"], socket) for socket in connector["sockets"]]
+        desired_names.update(socket["name"] for socket in sockets)
+        if existing is None:
+            # its sockets are created once the connector exists
+            actions.append({"action": "create_connector", "connector": connector, "sockets": sockets})
+            continue
+        for socket in sockets:
+            current = existing_sockets.get(socket["name"])
+            if current is None:
+                actions.append({"action": "create_socket", "connector_id": existing["connector_id"], "socket": socket})
+            elif (current.get("tags") or {}) != socket["tags"]:
+                actions.append(
+                    {"action": "update_socket", "connector_id": existing["connector_id"], "socket": socket,
+                     "socket_id": current["socket_id"]}
+                )
+
+    managed_connectors = {connector["name"] for connector in connectors}
+    for name, current in existing_sockets.items():
+        if name not in desired_names and (current.get("tags") or {}).get("connector") in managed_connectors:
+            actions.append({"action": "delete_socket", "name": name, "socket_id": current["socket_id"]})
+    return actions
+
+
+def reconcile(connectors, workers, dry_run=False):
+    """Apply the planned actions in parallel, returning a result per action."""
+    existing_connectors, existing_sockets = fetch_existing()
+    actions = plan_reconcile(connectors, existing_connectors, existing_sockets)
+    counts = {"create": 0, "update": 0, "delete": 0}
+    for action in actions:
+        counts[action["action"].split("_")[0]] += 1 + len(action.get("sockets", []))
+    changed_sockets = sum(
+        len(action["sockets"]) if action["action"] == "create_connector" else 1
+        for action in actions
+        if action["action"] != "delete_socket"
+    )
+    unchanged = sum(len(connector["sockets"]) for connector in connectors) - changed_sockets
+    print(
+        f"{len(existing_connectors)} connectors and {len(existing_sockets)} python3 sockets exist: "
+        f"{counts['create']} to create, {counts['update']} to update, {counts['delete']} to delete, {unchanged} unchanged."
+    )
+
+    results = []
+    if dry_run:
+        for action in actions:
+            results.append({"action": action["action"], "name": action_name(action), "status": "planned"})
+        return results
+
+    pipeline = Pipeline(workers)
+    for action in actions:
+        result = {"action": action["action"], "name": action_name(action)}
+        results.append(result)
+        priority = PRIORITY_CONNECTOR if action["action"] == "create_connector" else PRIORITY_FOLLOW_UP
+        pipeline.submit(priority, apply_action, pipeline, action, result, results)
+    pipeline.run()
+    return results
+
+
+def action_name(action):
+    if action["action"] == "create_connector":
+        return action["connector"]["name"]
+    if action["action"] == "delete_socket":
+        return action["name"]
+    return action["socket"]["name"]
+
+
+def apply_action(pipeline, action, result, results):
+    try:
+        if action["action"] == "create_connector":
+            connector = action["connector"]
+            result["connector_id"] = api_post(
+                "connector", connector_request(connector["name"], connector.get("description", connector["name"]))
+            )["connector_id"]
+            if connector.get("token", True):
+                token = create_connector_token(
+                    result["connector_id"], connector.get("token_name", f"{connector['name']}-token")
                 )
+                if token:
+                    result["connector_token"] = token
+                else:
+                    # the sockets are still created, but the connector cannot start without a token
+                    result["error"] = "the connector was created, but creating its token failed"
+            for socket in action["sockets"]:
+                follow_up = {"action": "create_socket", "connector_id": result["connector_id"], "socket": socket}
+                follow_up_result = {"action": "create_socket", "name": socket["name"]}
+                results.append(follow_up_result)
+                pipeline.submit(PRIORITY_FOLLOW_UP, apply_action, pipeline, follow_up, follow_up_result, results)
+        elif action["action"] == "delete_socket":
+            api_request("DELETE", f"socket/{action['socket_id']}")
+            result["socket_id"] = action["socket_id"]
+        else:
+            socket = action["socket"]
+            data = socket_request(
+                action["connector_id"], socket["type"], socket["upstream_configuration"], socket["name"], socket["tags"]
+            )
+            if action["action"] == "create_socket":
+                result["socket_id"] = api_post("socket", data)["socket_id"]
             else:
-                print(f"Failed to create {socket_type} socket.")
-        except Exception as e:
-            print(f"An error occurred while creating {socket_type} socket: {str(e)}")
+                api_request("PUT", f"socket/{action['socket_id']}", data)
+                result["socket_id"] = action["socket_id"]
+        result["status"] = "failed" if "error" in result else "done"
+    except Exception as e:
+        result.update(status="failed", error=str(e))
+
+
+def print_reconcile(results):
+    for result in results:
+        if result["status"] == "failed":
+            print(f"Failed to {result['action'].replace('_', ' ')} {result['name']}: {result['error']}")
+        elif result["status"] == "planned":
+            print(f"Would {result['action'].replace('_', ' ')} {result['name']}")
+        else:
+            print(f"{result['action'].replace('_', ' ').capitalize()} {result['name']}: done")
+        if result.get("connector_token"):
+            print(
+                f"To start the connector {result['name']} execute: \n\n BORDER0_TOKEN={result['connector_token']} border0 connector start \n"
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Create playground connectors with a socket of every type."
+    )
+    parser.add_argument(
+        "--connectors", type=int, default=1, help="number of connectors to create (default: 1)"
+    )
+    parser.add_argument(
+        "--socket-types",
+        default=",".join(socket_configs),
+        help=f"comma separated socket types to create (default: {','.join(socket_configs)})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=default_workers,
+        help=f"API calls made in parallel (default: {default_workers})",
+    )
+    parser.add_argument("--report", help="write a JSON report of everything created to this file")
+    parser.add_argument(
+        "--manifest", help="create the connectors and sockets described in this YAML or JSON file"
+    )
+    parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="create, update and delete only what differs from the --manifest, or from the playground sockets of --connector-name",
+    )
+    parser.add_argument("--connector-name", help="connector to reconcile the playground sockets of")
+    parser.add_argument("--dry-run", action="store_true", help="with --reconcile, only print the changes")
+    parser.add_argument(
+        "--checkpoint",
+        help="state file of a --manifest run, reruns skip what it lists (default: <manifest>.state.json)",
+    )
+    args = parser.parse_args()
+    args.socket_types = [t.strip().lower() for t in args.socket_types.split(",") if t.strip()]
+    unknown = [t for t in args.socket_types if t not in socket_configs]
+    if unknown:
+        parser.error(f"unknown socket types: {', '.join(unknown)}")
+    if args.reconcile and not (args.manifest or args.connector_name):
+        parser.error("--reconcile needs a --manifest or a --connector-name")
+    return args
+
+
+def playground_manifest(args):
+    """The playground connector --connector-name with a socket of every --socket-types, as a manifest."""
+    return [
+        {
+            "name": args.connector_name,
+            "sockets": [
+                {"name": f"{args.connector_name}-{socket_type}", "type": socket_type}
+                for socket_type in args.socket_types
+            ],
+        }
+    ]
+
+
+def main():
+    args = parse_args()
+    started = time.monotonic()
+    if args.reconcile:
+        try:
+            connectors = load_manifest(args.manifest) if args.manifest else playground_manifest(args)
+        except (OSError, ValueError) as e:
+            print(f"Invalid manifest: {str(e)}")
+            sys.exit(2)
+        results = reconcile(connectors, args.workers, dry_run=args.dry_run)
+        print_reconcile(results)
+        print(f"\nReconciled in {time.monotonic() - started:.1f}s, stats: {THROTTLE.stats()}")
+        if args.report:
+            write_private_json(args.report, {"actions": results})
+        if any(result["status"] == "failed" for result in results):
+            sys.exit(1)
+        return
+
+    if args.manifest:
+        try:
+            connectors = load_manifest(args.manifest)
+        except (OSError, ValueError) as e:
+            print(f"Invalid manifest: {str(e)}")
+            sys.exit(2)
+        checkpoint = Checkpoint(args.checkpoint or f"{args.manifest}.state.json")
+        reports = provision_manifest(connectors, checkpoint, args.workers)
+    else:
+        # connectors and sockets get separate pools: a connector waits on its sockets, never the other way around
+        with ThreadPoolExecutor(max_workers=args.workers) as executor, ThreadPoolExecutor(
+            max_workers=min(args.connectors, args.workers)
+        ) as connector_executor:
+            reports = list(
+                connector_executor.map(
+                    lambda _: provision_playground(executor, args.socket_types),
+                    range(args.connectors),
+                )
+            )
+
+    for report in reports:
+        print_report(report)
+    sockets = [result for report in reports for result in report["sockets"]]
+    created = sum(result["status"] in ("created", "exists") for result in sockets)
+    failed = [report for report in reports if report.get("error")]
+    print(
+        f"\nProvisioned {len(reports) - len(failed)}/{len(reports)} connectors and {created}/{len(sockets)} sockets in {time.monotonic() - started:.1f}s, stats: {THROTTLE.stats()}"
+    )
+
+    if args.report:
+        write_private_json(args.report, {"connectors": reports})
+    if failed or created < len(sockets):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
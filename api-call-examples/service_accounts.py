@@ -2,116 +2,374 @@
 
 import os
 import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
+
+# the throttle lives next to this script, which may be run or imported from anywhere
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from border0_throttle import DEFAULT_MAX_CONCURRENCY, ENV_MAX_CONCURRENCY, Throttle, listed
 
 API_BASE_URL = "https://api.border0.com/api/v1/organizations/iam/service_accounts"
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 30)
+TOKEN_NOT_FOUND = "Token not found. Ensure BORDER0_ADMIN_TOKEN environment variable is set or ~/.border0/token file exists."
 
-def get_auth_token():
+# client-side rate limit and adaptive concurrency, see border0_throttle.py
+THROTTLE = Throttle.from_env()
+
+def read_auth_token():
     token = os.getenv("BORDER0_ADMIN_TOKEN")
     if token is None:
         try:
             with open(os.path.expanduser("~/.border0/token"), "r") as file:
                 token = file.read().strip()
         except FileNotFoundError:
-            print("Token not found. Ensure BORDER0_ADMIN_TOKEN environment variable is set or ~/.border0/token file exists.")
             return None
     return token
 
+def get_auth_token():
+    """read_auth_token(), printing a message when there is no token. Kept for existing callers."""
+    token = read_auth_token()
+    if token is None:
+        print(TOKEN_NOT_FOUND)
+    return token
+
+class ServiceAccountsClient:
+    """Service account and token API calls over one pooled keep-alive session.
+
+    The admin token is resolved once, from the `token` argument, BORDER0_ADMIN_TOKEN or
+    ~/.border0/token. Every request has a timeout and goes through the shared throttle. Failed
+    requests raise requests.RequestException (HTTP errors as requests.HTTPError), so the client can
+    be used as a library:
+
+        with ServiceAccountsClient() as client:
+            accounts = client.list_service_accounts()
+    """
+
+    def __init__(self, token=None, base_url=API_BASE_URL, timeout=DEFAULT_TIMEOUT, throttle=None,
+                 pool_size=None):
+        token = token or read_auth_token()
+        if token is None:
+            raise ValueError(TOKEN_NOT_FOUND)
+        self.base_url = base_url
+        self.timeout = timeout
+        self.throttle = throttle or THROTTLE
+        self.session = requests.Session()
+        self.session.headers.update({
+            "accept": "application/json",
+            "Authorization": token,
+        })
+        # a connection for every request the throttle may let through at once
+        pool_size = pool_size or int(os.getenv(ENV_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _request(self, method, path="", **kwargs):
+        url = f"{self.base_url}/{path}" if path else self.base_url
+        response = self.throttle.call(self.session.request, method, url, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def create_service_account(self, name, description, role):
+        payload = {
+            "description": description,
+            "name": name,
+            "role": role
+        }
+        return self._request("POST", json=payload).json()
+
+    def create_token(self, service_account_name, token_name, expires_at=0):
+        payload = {
+            "expires_at": expires_at,
+            "name": token_name
+        }
+        return self._request("POST", f"{service_account_name}/tokens", json=payload).json()
+
+    def list_service_accounts(self):
+        return self._request("GET").json()
+
+    def get_service_account(self, service_account_name):
+        return self._request("GET", service_account_name).json()
+
+    def service_account_exists(self, service_account_name):
+        try:
+            self.get_service_account(service_account_name)
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 404:
+                return False
+            raise
+        return True
+
+    def list_tokens(self, service_account_name):
+        return self._request("GET", f"{service_account_name}/tokens").json()
+
+    def delete_service_account(self, service_account_name):
+        return self._request("DELETE", service_account_name).status_code == 204
+
+    def delete_token(self, service_account_name, token_id):
+        return self._request("DELETE", f"{service_account_name}/tokens/{token_id}").status_code == 204
+
+_client = None
+_client_lock = threading.Lock()
+
+def default_client():
+    """The client shared by the functions below, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ServiceAccountsClient()
+        return _client
+
+def error_text(e):
+    # connection errors, timeouts and a missing admin token (ValueError) have no response
+    response = getattr(e, "response", None)
+    return response.text if response is not None else str(e)
+
 def create_service_account(name, description, role):
-    url = API_BASE_URL
-    payload = {
-        "description": description,
-        "name": name,
-        "role": role
-    }
-    headers = {
-        "accept": "application/json",
-        "Authorization": get_auth_token(),
-        "Content-Type": "application/json"
-    }
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error creating service account: {e.response.text}")
+        return default_client().create_service_account(name, description, role)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error creating service account: {error_text(e)}")
         return None
 
 def create_token(service_account_name, token_name, expires_at=0):
-    url = f"{API_BASE_URL}/{service_account_name}/tokens"
-    payload = {
-        "expires_at": expires_at,
-        "name": token_name
-    }
-    headers = {
-        "accept": "application/json",
-        "Authorization": get_auth_token(),
-        "Content-Type": "application/json"
-    }
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error creating token: {e.response.text}")
+        return default_client().create_token(service_account_name, token_name, expires_at)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error creating token: {error_text(e)}")
         return None
 
 def list_service_accounts():
-    headers = {
-        "accept": "application/json",
-        "Authorization": get_auth_token()
-    }
     try:
-        response = requests.get(API_BASE_URL, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error listing service accounts: {e.response.text}")
+        return default_client().list_service_accounts()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error listing service accounts: {error_text(e)}")
         return None
 
 def list_tokens(service_account_name):
-    url = f"{API_BASE_URL}/{service_account_name}/tokens"
-    headers = {
-        "accept": "application/json",
-        "Authorization": get_auth_token()
-    }
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error listing tokens: {e.response.text}")
+        return default_client().list_tokens(service_account_name)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error listing tokens: {error_text(e)}")
         return None
 
 def delete_service_account(service_account_name):
-    url = f"{API_BASE_URL}/{service_account_name}"
-    headers = {
-        "accept": "application/json",
-        "Authorization": get_auth_token()
-    }
     try:
-        response = requests.delete(url, headers=headers)
-        response.raise_for_status()
-        return response.status_code == 204
-    except requests.exceptions.RequestException as e:
-        print(f"Error deleting service account: {e.response.text}")
+        return default_client().delete_service_account(service_account_name)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error deleting service account: {error_text(e)}")
         return False
 
 def delete_token(service_account_name, token_id):
-    url = f"{API_BASE_URL}/{service_account_name}/tokens/{token_id}"
-    headers = {
-        "accept": "application/json",
-        "Authorization": get_auth_token()
-    }
     try:
-        response = requests.delete(url, headers=headers)
-        response.raise_for_status()
-        return response.status_code == 204
-    except requests.exceptions.RequestException as e:
-        print(f"Error deleting token: {e.response.text}")
+        return default_client().delete_token(service_account_name, token_id)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error deleting token: {error_text(e)}")
         return False
 
+# Batch mode: python3 service_accounts.py batch {create,rotate,list,delete} [accounts.txt]
+#
+# Accounts are read from the file, or from stdin when it is omitted or "-". Every line is an account
+# name, or a JSON object such as
+#
+#     {"name": "ci-runner", "description": "CI", "role": "member", "token_name": "ci", "expires_at": 0}
+#
+# whose fields override the command-line defaults for that account. Blank lines and lines starting
+# with # are skipped. Accounts are processed concurrently, and one JSON result per account is written
+# as soon as it is done. Work that is already done (an existing account or token, a missing account
+# to delete) is skipped, so a failed batch can simply be run again.
+
+BATCH_ACTIONS = ("create", "rotate", "list", "delete")
+DEFAULT_WORKERS = 8
+# marks the tokens created by rotate, the only ones a later rotation deletes
+ROTATED_TOKEN_MARKER = "-rot-"
+
+def read_accounts(path, defaults):
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, "r") as file:
+            lines = file.read().splitlines()
+    accounts = {}
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            try:
+                account = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}")
+            if not isinstance(account, dict) or not account.get("name"):
+                raise ValueError(f"{path}:{number}: account has no name")
+        else:
+            account = {"name": line}
+        # the last line for an account wins
+        accounts[account["name"]] = dict(defaults, **account)
+    return list(accounts.values())
+
+def batch_create(client, account, existing, options, result):
+    name = account["name"]
+    if name in existing:
+        result["skipped"].append("service account exists")
+    else:
+        if not account.get("description") or not account.get("role"):
+            raise ValueError("description and role are required to create a service account")
+        client.create_service_account(name, account["description"], account["role"])
+        result["changes"].append("created service account")
+    token_name = account.get("token_name")
+    if not token_name:
+        return
+    if name in existing and any(token.get("name") == token_name for token in listed(client.list_tokens(name))):
+        result["skipped"].append(f"token {token_name} exists")
+    else:
+        result["token"] = client.create_token(name, token_name, account.get("expires_at", 0))
+        result["changes"].append(f"created token {token_name}")
+
+def batch_rotate(client, account, existing, options, result):
+    # the new token is named after the rotation, so running the same rotation again doesn't create another
+    name = account["name"]
+    if name not in existing:
+        raise LookupError("service account does not exist")
+    prefix = f"{account.get('token_name') or name}{ROTATED_TOKEN_MARKER}"
+    token_name = f"{prefix}{options.rotation_id}"
+    tokens = listed(client.list_tokens(name))
+    if any(token.get("name") == token_name for token in tokens):
+        result["skipped"].append(f"token {token_name} exists")
+    else:
+        result["token"] = client.create_token(name, token_name, account.get("expires_at", 0))
+        result["changes"].append(f"created token {token_name}")
+    if options.keep_old:
+        return
+    # only the tokens earlier rotations created, never others the account may have
+    for token in tokens:
+        if (token.get("name") or "").startswith(prefix) and token.get("name") != token_name:
+            client.delete_token(name, token["id"])
+            result["changes"].append(f"deleted token {token['id']}")
+
+def batch_list(client, account, existing, options, result):
+    if account["name"] not in existing:
+        raise LookupError("service account does not exist")
+    result["tokens"] = listed(client.list_tokens(account["name"]))
+
+def batch_delete(client, account, existing, options, result):
+    # with a token name or ID only those tokens are deleted, as with --delete --token-name
+    name = account["name"]
+    if name not in existing:
+        result["skipped"].append("service account does not exist")
+        return
+    token_name = account.get("token_name")
+    if not token_name:
+        client.delete_service_account(name)
+        result["changes"].append("deleted service account")
+        return
+    tokens = [token for token in listed(client.list_tokens(name)) if token_name in (token.get("name"), token.get("id"))]
+    if not tokens:
+        result["skipped"].append(f"token {token_name} does not exist")
+    for token in tokens:
+        client.delete_token(name, token["id"])
+        result["changes"].append(f"deleted token {token['id']}")
+
+BATCH_HANDLERS = {
+    "create": batch_create,
+    "rotate": batch_rotate,
+    "list": batch_list,
+    "delete": batch_delete,
+}
+
+def run_batch(client, action, accounts, options, output):
+    """Run the action for all accounts, writing a JSON line per account; returns the number that failed."""
+    # one listing up front tells which accounts exist; an account missing from it may be on a page
+    # the listing didn't return, so it is looked up on its own before it is treated as missing
+    existing = {account.get("name") for account in listed(client.list_service_accounts())}
+    handler = BATCH_HANDLERS[action]
+
+    def run(account):
+        result = {"account": account["name"], "action": action, "changes": [], "skipped": []}
+        try:
+            if account["name"] not in existing and client.service_account_exists(account["name"]):
+                existing.add(account["name"])
+            handler(client, account, existing, options, result)
+            result["status"] = "ok"
+        except requests.exceptions.RequestException as e:
+            result.update(status="error", error=error_text(e))
+        except (LookupError, ValueError) as e:
+            result.update(status="error", error=str(e))
+        return result
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=options.workers) as executor:
+        for future in as_completed([executor.submit(run, account) for account in accounts]):
+            result = future.result()
+            failed += result["status"] == "error"
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    return failed
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(prog="service_accounts.py batch",
+                                     description="Create, rotate, list or delete many Border0 Service Accounts and Tokens at once")
+    parser.add_argument("action", choices=BATCH_ACTIONS,
+                        help="create accounts (and a token), rotate their tokens, list their tokens, or delete accounts (or a token)")
+    parser.add_argument("file", nargs="?", default="-", help="file with one account per line, - for stdin (default)")
+    parser.add_argument("--description", type=str, help="description of accounts to create")
+    parser.add_argument("--role", type=str, help="role of accounts to create (admin, member, client)")
+    parser.add_argument("-t", "--token-name", type=str,
+                        help="token to create or delete; with rotate, the prefix of the new token's name (default: account name)")
+    parser.add_argument("--expires-at", type=int, default=0, help="expiry of created tokens as a Unix timestamp, 0 for never")
+    parser.add_argument("--rotation-id", type=str, default=time.strftime("%Y%m%d", time.gmtime()),
+                        help="suffix of rotated token names, after -rot-; accounts that already have a token for this rotation are skipped (default: today's UTC date)")
+    parser.add_argument("--keep-old", action="store_true", help="with rotate, don't delete the previous tokens")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"accounts processed in parallel (default {DEFAULT_WORKERS})")
+    parser.add_argument("-o", "--output", type=str, help="write the JSON lines to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    defaults = {"description": args.description, "role": args.role, "token_name": args.token_name, "expires_at": args.expires_at}
+    try:
+        accounts = read_accounts(args.file, defaults)
+        client = ServiceAccountsClient()
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    start = time.monotonic()
+    # the results hold token secrets: appended to, never truncated, and readable by the owner only
+    if args.output:
+        output = os.fdopen(os.open(args.output, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600), "a")
+    else:
+        output = sys.stdout
+    try:
+        with client:
+            failed = run_batch(client, args.action, accounts, args, output)
+    except requests.exceptions.RequestException as e:
+        print(f"Error listing service accounts: {error_text(e)}", file=sys.stderr)
+        return 1
+    finally:
+        if args.output:
+            output.close()
+    print(f"{args.action}: {len(accounts) - failed}/{len(accounts)} accounts done, {failed} failed in {time.monotonic() - start:.1f}s",
+          file=sys.stderr)
+    return 1 if failed else 0
+
 def main():
+    if sys.argv[1:2] == ["batch"]:
+        sys.exit(batch_main(sys.argv[2:]))
+
     parser = argparse.ArgumentParser(description="Manage Border0 Service Accounts and Tokens")
     parser.add_argument("-c", "--create", action="store_true", help="Create a service account or token")
     parser.add_argument("-d", "--delete", action="store_true", help="Delete a service account or token")
@@ -119,7 +377,7 @@ def main():
     parser.add_argument("-t", "--token-name", type=str, help="Token name or ID")
     parser.add_argument("--description", type=str, help="Service account description")
     parser.add_argument("--role", type=str, help="Service account role (admin, member, client)")
-    
+
     args = parser.parse_args()
 
     if args.create:
@@ -144,7 +402,7 @@ def main():
         else:
             print("For creating a service account, you must provide --account-name, --description, and --role.")
             print("For creating a token, you must provide --account-name and --token-name.")
-    
+
     elif args.delete:
         if args.token_name:
             # Delete token
@@ -158,7 +416,7 @@ def main():
                 print("Service Account deleted successfully.")
             else:
                 print("Failed to delete Service Account.")
-    
+
     else:
         parser.print_help()
 
@@ -1,16 +1,71 @@
+import asyncio
 import requests
 import os
+import base64
+import bisect
+import codecs
+import contextlib
 import datetime
+import email.utils
+import enum
+import gzip
+import hashlib
 import json
+import math
+import random
+import re
+import time
 import concurrent.futures
 import pathlib
+import shutil
+import signal
+import sqlite3
+import tempfile
+import threading
+import zlib
 import argparse
+import sys
+import uuid
 from dataclasses import dataclass, field
-from typing import Dict, Any, Set, TypedDict, TypeAlias
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, AsyncIterator, Callable, IO, Iterator, TypedDict, TypeAlias
+
+try:
+    import aiohttp
+except ImportError:  # only needed for --engine async
+    aiohttp = None
+
+# the throttle is shared with the other API examples one directory up
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from border0_throttle import AsyncThrottle, Throttle
 
 BORDER0_API_TOKEN = os.environ.get("BORDER0_API_TOKEN", "")
 BORDER_API_URL = os.environ.get("BORDER_API_URL", "https://api.border0.com/api/v1")
 
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_PREFETCH_PAGES = 4
+DEFAULT_WORKERS = 10
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 60.0
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_ASYNC_CONCURRENCY = 200
+DEFAULT_RATE_LIMIT = 50.0
+DEFAULT_FSYNC_EVERY = 100
+DEFAULT_STATE_RETENTION_HOURS = 24.0
+DEFAULT_DB_FILE = "session_logs.db"
+DEFAULT_RECORDING_MEMORY_LIMIT_MB = 8.0
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_MAX_POLL_INTERVAL = 300.0
+DEFAULT_CHECKPOINT_INTERVAL = 60.0
+DEFAULT_IN_PROGRESS_POLL_FACTOR = 0.25
+DEFAULT_IN_PROGRESS_MIN_INTERVAL = 60.0
+DEFAULT_IN_PROGRESS_MAX_INTERVAL = 3600.0
+DEFAULT_IN_PROGRESS_MAX_AGE_HOURS = 168.0
+RECORDING_CHUNK_SIZE = 64 * 1024
+
+# status codes worth retrying: rate limiting and transient server-side failures
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
 SessionID: TypeAlias = str
 SessionDict: TypeAlias = Dict[str, Any]
 
@@ -23,12 +78,250 @@ class NotFoundError(Exception):
     pass
 
 
+def _parse_time(value: str | None) -> datetime.datetime | None:
+    """Parse an RFC3339 timestamp as returned by the Border0 API."""
+    if not value:
+        return None
+    # fromisoformat before 3.11 accepts neither a Z suffix nor more than 6 fractional digits
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00"))
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+class BloomFilter:
+    """Fixed size Bloom filter over byte keys."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(1, capacity)
+        self.size = max(64, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: bytes) -> Iterator[int]:
+        # double hashing: k positions derived from two 64 bit halves of one digest
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: bytes) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class _SortedRecords:
+    """Read-only sequence view of the fixed width records in a sorted blob, for bisect."""
+
+    def __init__(self, blob: bytes, width: int):
+        self.blob = blob
+        self.width = width
+
+    def __len__(self) -> int:
+        return len(self.blob) // self.width
+
+    def __getitem__(self, index: int) -> bytes:
+        return self.blob[index * self.width:(index + 1) * self.width]
+
+
+class SessionIndex:
+    """Compact set of processed session IDs, bucketed by the hour their session started.
+
+    IDs are kept as 16 byte keys: the UUID itself, or a BLAKE2 digest of any other ID.
+    Keys loaded from the state file stay in one sorted blob per bucket and are found by
+    bisection; keys added since then live in a small set until the next save. Whole
+    buckets are dropped once they fall out of the query window. With `use_bloom_filter`
+    most misses are answered by a Bloom filter without searching any bucket.
+    """
+    KEY_SIZE = 16
+    BUCKET_SECONDS = 3600
+
+    def __init__(self, use_bloom_filter: bool = False):
+        self.sorted_keys: dict[int, bytes] = {}
+        self.new_keys: dict[int, set[bytes]] = {}
+        self.use_bloom_filter = use_bloom_filter
+        self.bloom: BloomFilter | None = None
+        self._rebuild_bloom()
+
+    @classmethod
+    def _key(cls, session_id: SessionID) -> bytes:
+        try:
+            return uuid.UUID(session_id).bytes
+        except ValueError:
+            return hashlib.blake2b(session_id.encode(), digest_size=cls.KEY_SIZE).digest()
+
+    @classmethod
+    def _bucket(cls, start_time: datetime.datetime | None) -> int:
+        start_time = start_time or datetime.datetime.now(datetime.timezone.utc)
+        return int(start_time.timestamp()) // cls.BUCKET_SECONDS
+
+    @classmethod
+    def _blob_contains(cls, blob: bytes, key: bytes) -> bool:
+        # bisect over the fixed width records of the blob, without splitting it
+        records = _SortedRecords(blob, cls.KEY_SIZE)
+        position = bisect.bisect_left(records, key)
+        return position < len(records) and records[position] == key
+
+    def __len__(self) -> int:
+        return sum(len(blob) // self.KEY_SIZE for blob in self.sorted_keys.values()) + \
+            sum(len(keys) for keys in self.new_keys.values())
+
+    def _rebuild_bloom(self) -> None:
+        if not self.use_bloom_filter:
+            return
+        self.bloom = BloomFilter(max(10_000, 2 * len(self)))
+        for blob in self.sorted_keys.values():
+            for offset in range(0, len(blob), self.KEY_SIZE):
+                self.bloom.add(blob[offset:offset + self.KEY_SIZE])
+        for keys in self.new_keys.values():
+            for key in keys:
+                self.bloom.add(key)
+
+    def add(self, session_id: SessionID, start_time: datetime.datetime | None = None) -> None:
+        key = self._key(session_id)
+        self.new_keys.setdefault(self._bucket(start_time), set()).add(key)
+        if self.bloom is not None:
+            self.bloom.add(key)
+            if self.bloom.count > self.bloom.capacity:
+                self._rebuild_bloom()
+
+    def contains(self, session_id: SessionID, start_time: datetime.datetime | None = None) -> bool:
+        key = self._key(session_id)
+        if self.bloom is not None and key not in self.bloom:
+            return False
+
+        # the session's own bucket is the likely hit, the others cover IDs filed without a start time
+        buckets = self.sorted_keys.keys() | self.new_keys.keys()
+        if start_time and (own := self._bucket(start_time)) in buckets:
+            buckets = [own, *(bucket for bucket in buckets if bucket != own)]
+        for bucket in buckets:
+            if key in self.new_keys.get(bucket, ()):
+                return True
+            if (blob := self.sorted_keys.get(bucket)) and self._blob_contains(blob, key):
+                return True
+        return False
+
+    def expire(self, before: datetime.datetime) -> None:
+        """Drop every bucket whose hour ended before the given time."""
+        oldest = int(before.timestamp()) // self.BUCKET_SECONDS
+        expired = [bucket for bucket in self.sorted_keys.keys() | self.new_keys.keys() if bucket < oldest]
+        for bucket in expired:
+            self.sorted_keys.pop(bucket, None)
+            self.new_keys.pop(bucket, None)
+        if expired:
+            self._rebuild_bloom()
+
+    def dump(self) -> dict[str, str]:
+        """Serialize to {bucket: base64 of sorted keys}, merging keys added since the last load."""
+        for bucket, keys in self.new_keys.items():
+            blob = self.sorted_keys.get(bucket, b"")
+            merged = {blob[offset:offset + self.KEY_SIZE] for offset in range(0, len(blob), self.KEY_SIZE)} | keys
+            self.sorted_keys[bucket] = b"".join(sorted(merged))
+        self.new_keys.clear()
+        return {str(bucket): base64.b64encode(blob).decode() for bucket, blob in sorted(self.sorted_keys.items())}
+
+    def load(self, data: dict[str, str]) -> None:
+        self.sorted_keys = {int(bucket): base64.b64decode(blob) for bucket, blob in data.items()}
+        self.new_keys.clear()
+        self._rebuild_bloom()
+
+
+class InProgressTracker:
+    """Sessions that were still running when collected, when to poll each of them next and how
+    much of each recording has already been written.
+
+    A session is polled again after a delay proportional to its age (`poll_factor` times the time
+    since it started, clamped to [min_interval, max_interval]), so short-lived sessions are picked
+    up quickly while long-running ones cost few requests. Sessions older than `max_age` are dropped.
+    With `incremental` off no offsets are kept and completed sessions are fetched whole.
+    """
+
+    def __init__(self, poll_factor: float = DEFAULT_IN_PROGRESS_POLL_FACTOR,
+                 min_interval: float = DEFAULT_IN_PROGRESS_MIN_INTERVAL,
+                 max_interval: float = DEFAULT_IN_PROGRESS_MAX_INTERVAL,
+                 max_age: datetime.timedelta = datetime.timedelta(hours=DEFAULT_IN_PROGRESS_MAX_AGE_HOURS),
+                 incremental: bool = True):
+        self.poll_factor = poll_factor
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.max_age = max_age
+        self.incremental = incremental
+        self.sessions: dict[SessionID, dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def _next_poll_at(self, start_time: str | None, now: datetime.datetime) -> str:
+        started = _parse_time(start_time)
+        age = (now - started).total_seconds() if started else 0.0
+        delay = min(max(age * self.poll_factor, self.min_interval), self.max_interval)
+        return (now + datetime.timedelta(seconds=delay)).isoformat()
+
+    def track(self, session: SessionDict, now: datetime.datetime | None = None) -> None:
+        """Start tracking a session collected as session_started, recording what was written of it."""
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        offsets: dict[str, int] = {}
+        if self.incremental:
+            for recording in session.get("recordings", []):
+                recording_data = recording.get("recording_data")
+                if recording.get("recording_id") and recording_data is not None:
+                    # events for JSONL recordings, characters for text ones
+                    offsets[recording["recording_id"]] = recording.get("recording_offset", 0) + len(recording_data)
+        self.sessions[session["session_id"]] = {
+            "session_id": session["session_id"],
+            "socket_id": session["socket_id"],
+            "start_time": session.get("start_time"),
+            "next_poll_at": self._next_poll_at(session.get("start_time"), now),
+            "offsets": offsets,
+        }
+
+    def due(self, now: datetime.datetime | None = None) -> list[dict[str, Any]]:
+        """Return the sessions due for a poll, dropping those that ran past max_age."""
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        due = []
+        for session_id, entry in list(self.sessions.items()):
+            started = _parse_time(entry["start_time"])
+            if started and now - started > self.max_age:
+                print(f"Session {session_id} still running after {self.max_age}, no longer polling it")
+                del self.sessions[session_id]
+            elif (_parse_time(entry["next_poll_at"]) or now) <= now:
+                due.append(entry)
+        return due
+
+    def reschedule(self, session_id: SessionID, now: datetime.datetime | None = None) -> None:
+        """Push back the next poll of a session that is still running."""
+        if entry := self.sessions.get(session_id):
+            entry["next_poll_at"] = self._next_poll_at(entry["start_time"], now or datetime.datetime.now(datetime.timezone.utc))
+
+    def complete(self, session_id: SessionID) -> None:
+        """Stop tracking a session."""
+        self.sessions.pop(session_id, None)
+
+    def to_list(self) -> list[dict[str, Any]]:
+        return list(self.sessions.values())
+
+    def load(self, entries: list[dict[str, Any]]) -> None:
+        self.sessions = {entry["session_id"]: entry for entry in entries}
+
+
 @dataclass
 class StateManager:
     state_file_path: str = "app_state.json"
     last_run_time: str | None = None
-    processed_session_ids: Set[SessionID] = field(default_factory=set)
-    processed_session_ids_map: Dict[SessionID, bool] = field(default_factory=dict)
+    retention: datetime.timedelta = datetime.timedelta(hours=DEFAULT_STATE_RETENTION_HOURS)
+    use_bloom_filter: bool = False
+    in_progress: InProgressTracker = field(default_factory=InProgressTracker)
+    processed_sessions: SessionIndex = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.processed_sessions = SessionIndex(self.use_bloom_filter)
 
     def load_state(self) -> None:
         """Load application state from file if it exists."""
@@ -39,35 +332,45 @@ class StateManager:
         try:
             state_data = json.loads(state_path.read_text())
             self.last_run_time = state_data.get("last_run_time")
-            self.processed_session_ids = set(state_data.get("processed_session_ids", []))
-            self.processed_session_ids_map = {session_id: True for session_id in self.processed_session_ids}
-        except (json.JSONDecodeError, IOError) as e:
+            self.processed_sessions.load(state_data.get("processed_sessions", {}))
+            self.in_progress.load(state_data.get("in_progress_sessions", []))
+
+            # state files written before the index was bucketed: file the IDs under the last run,
+            # they expire with it
+            legacy_start_time = _parse_time(self.last_run_time)
+            for session_id in state_data.get("processed_session_ids", []):
+                self.processed_sessions.add(session_id, legacy_start_time)
+        except (json.JSONDecodeError, IOError, ValueError) as e:
             print(f"Error loading state: {e}")
 
     def save_state(self) -> None:
-        """Save current application state to file."""
+        """Save current application state to file, dropping IDs that can no longer be returned."""
+        # the next run only asks for sessions started after last_run_time, anything older than
+        # that (minus a safety margin for clock skew) cannot show up again
+        if last_run_time := _parse_time(self.last_run_time):
+            self.processed_sessions.expire(last_run_time - self.retention)
 
         state_data: dict[str, Any] = {
             "last_run_time": self.last_run_time,
-            "processed_session_ids": list(self.processed_session_ids)
+            "processed_sessions": self.processed_sessions.dump(),
+            "in_progress_sessions": self.in_progress.to_list(),
         }
         try:
             pathlib.Path(self.state_file_path).write_text(json.dumps(state_data, indent=2))
         except IOError as e:
             print(f"Error saving state: {e}")
 
-    def update_run_time(self) -> None:
-        """Update last run time to current UTC time."""
-        self.last_run_time = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    def update_run_time(self, run_time: str | None = None) -> None:
+        """Update last run time to the given time, or the current UTC time."""
+        self.last_run_time = run_time or datetime.datetime.now(datetime.timezone.utc).isoformat()
 
-    def add_processed_session(self, session_id: SessionID) -> None:
+    def add_processed_session(self, session_id: SessionID, start_time: str | None = None) -> None:
         """Mark a session as processed."""
-        self.processed_session_ids.add(session_id)
-        self.processed_session_ids_map[session_id] = True
+        self.processed_sessions.add(session_id, _parse_time(start_time))
 
-    def is_session_processed(self, session_id: SessionID) -> bool:
+    def is_session_processed(self, session_id: SessionID, start_time: str | None = None) -> bool:
         """Check if a session has been processed."""
-        return self.processed_session_ids_map.get(session_id, False)
+        return self.processed_sessions.contains(session_id, _parse_time(start_time))
 
 
 class SessionFilter(TypedDict, total=False):
@@ -77,67 +380,602 @@ class SessionFilter(TypedDict, total=False):
     finished: bool
 
 
+def _retry_delay(attempt: int, retry_after: str | None, backoff_base: float, backoff_max: float) -> float:
+    """Seconds to wait before the next attempt, honouring Retry-After (up to backoff_max) when the server sends it."""
+    if retry_after:
+        if retry_after.isdigit():
+            return min(float(retry_after), backoff_max)
+        try:
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+            return min(max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()), backoff_max)
+        except (TypeError, ValueError):
+            pass
+
+    # exponential backoff with full jitter
+    return random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+
+
+def _check_status(status_code: int, text: str) -> None:
+    """Raise the matching exception for a non-200 Border0 API response."""
+    match status_code:
+        case 200:
+            return
+        case 500:
+            raise APIError(f"Server error (500): {text}")
+        case 404:
+            raise NotFoundError(f"Not found: {text}")
+        case _:
+            raise APIError(f"API request failed with status code {status_code}: {text}")
+
+
+def _session_params(page: int, page_size: int, filters: SessionFilter | None) -> dict[str, Any]:
+    """Build the query parameters for a page of the sessions endpoint."""
+    params: dict[str, Any] = {
+        "page": page,
+        "page_size": page_size,
+    }
+
+    if filters:
+        params |= {k: v for k, v in filters.items() if v is not None}
+
+        if finished := filters.get("finished"):
+            match finished:
+                case "true":
+                    params["finished"] = True
+                case "false":
+                    params["finished"] = False
+
+    return params
+
+
+def _can_prefetch(pages: dict[int, concurrent.futures.Future[list[SessionDict]] | asyncio.Future[list[SessionDict]]],
+                  next_page: int, page_size: int) -> bool:
+    """Whether more pages are worth requesting: the last page requested came back full, and no page
+    came back short, empty or failed."""
+    for page, fetch in pages.items():
+        if fetch.done() and (fetch.cancelled() or fetch.exception() is not None or len(fetch.result()) < page_size):
+            return False
+    # pages already consumed were full, iteration stops at the first that isn't
+    last = pages.get(next_page - 1)
+    return last is None or last.done()
+
+
+def _recording_params(recording_id: str | None, format: str | None, offset: int = 0) -> dict[str, Any]:
+    """Build the query parameters for a session recording request."""
+    params: dict[str, Any] = {}
+    if recording_id:
+        params["recording_id"] = recording_id
+    if format:
+        params["format"] = format
+    if offset:
+        params["offset"] = offset
+    return params
+
+
+class RecordingEvents:
+    """Parsed events of one recording, held in memory up to `memory_limit` bytes of JSON.
+
+    Past that limit all events are moved to a temporary JSONL file in `spill_dir`, so memory
+    stays bounded however long the recording is. With `max_events` set, later events are
+    dropped and `truncated` is set instead.
+    """
+
+    def __init__(self, memory_limit: int, max_events: int | None = None, spill_dir: str | None = None):
+        self.memory_limit = memory_limit
+        self.max_events = max_events
+        self.spill_dir = spill_dir
+        self.events: list[Any] = []
+        self.memory_size = 0
+        self.count = 0
+        self.truncated = False
+        self.spill_file: IO[str] | None = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, event: Any, line: str) -> bool:
+        """Add an event parsed from `line`. Returns False once the event cap is reached."""
+        if self.max_events and self.count >= self.max_events:
+            self.truncated = True
+            return False
+
+        self.count += 1
+        if self.spill_file is not None:
+            self.spill_file.write(line + "\n")
+            return True
+
+        self.events.append(event)
+        self.memory_size += len(line)
+        if self.memory_size > self.memory_limit:
+            self.spill_file = tempfile.TemporaryFile("w+", encoding="utf-8", prefix="recording-", dir=self.spill_dir)
+            for held in self.events:
+                self.spill_file.write(json.dumps(held, separators=(",", ":")) + "\n")
+            self.events = []
+            self.memory_size = 0
+        return True
+
+    def iter_json(self) -> Iterator[str]:
+        """Yield each event as compact JSON text, reading spilled events back from disk."""
+        if self.spill_file is None:
+            for event in self.events:
+                yield json.dumps(event, separators=(",", ":"))
+            return
+
+        self.spill_file.flush()
+        self.spill_file.seek(0)
+        for line in self.spill_file:
+            yield line.rstrip("\n")
+
+    def to_list(self) -> list[Any]:
+        """Materialize all events in memory."""
+        if self.spill_file is None:
+            return list(self.events)
+        return [json.loads(line) for line in self.iter_json()]
+
+    def close(self) -> None:
+        """Release the spill file, if any."""
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+
+
+class RecordingText:
+    """Text of one recording (asciinema), held in memory up to `memory_limit` characters.
+
+    Past that limit the text is moved to a temporary file in `spill_dir`, as with RecordingEvents.
+    """
+
+    def __init__(self, memory_limit: int, spill_dir: str | None = None):
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self.parts: list[str] = []
+        self.memory_size = 0
+        self.length = 0
+        self.spill_file: IO[str] | None = None
+
+    def __len__(self) -> int:
+        return self.length
+
+    def append(self, text: str) -> None:
+        self.length += len(text)
+        if self.spill_file is not None:
+            self.spill_file.write(text)
+            return
+
+        self.parts.append(text)
+        self.memory_size += len(text)
+        if self.memory_size > self.memory_limit:
+            # newline="" keeps the carriage returns of terminal output as they are
+            self.spill_file = tempfile.TemporaryFile("w+", encoding="utf-8", newline="", prefix="recording-",
+                                                     dir=self.spill_dir)
+            for part in self.parts:
+                self.spill_file.write(part)
+            self.parts = []
+            self.memory_size = 0
+
+    def iter_text(self) -> Iterator[str]:
+        """Yield the text in chunks, reading spilled text back from disk."""
+        if self.spill_file is None:
+            yield from self.parts
+            return
+
+        self.spill_file.flush()
+        self.spill_file.seek(0)
+        while chunk := self.spill_file.read(RECORDING_CHUNK_SIZE):
+            yield chunk
+
+    def to_str(self) -> str:
+        """Materialize the whole text in memory."""
+        return "".join(self.iter_text())
+
+    def close(self) -> None:
+        """Release the spill file, if any."""
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+
+
+class RecordingStreamParser:
+    """Incrementally parse a JSONL recording body, fed as raw chunks, into RecordingEvents.
+
+    The API returns the JSONL document wrapped in a JSON string. The string is unescaped
+    chunk by chunk, so neither the body nor the unescaped document is ever held whole. A
+    body that is plain JSONL is parsed as is. The first `skip` events are discarded.
+    """
+    ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self, events: RecordingEvents | None, skip: int = 0):
+        self.events = events
+        self.skip = skip
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.quoted: bool | None = None
+        self.finished = False
+        self.escape = ""
+        self.partial_line = ""
+
+    def _unescape(self, text: str) -> str:
+        text = self.escape + text
+        self.escape = ""
+        out = []
+        position = 0
+        while position < len(text) and not self.finished:
+            backslash = text.find("\\", position)
+            plain = text[position:] if backslash < 0 else text[position:backslash]
+            # an unescaped quote can only be the one closing the string
+            if (quote := plain.find('"')) >= 0:
+                out.append(plain[:quote])
+                self.finished = True
+                break
+            out.append(plain)
+            if backslash < 0:
+                break
+
+            # keep an escape sequence split across chunks for the next one
+            if backslash + 1 >= len(text) or (text[backslash + 1] == "u" and backslash + 6 > len(text)):
+                self.escape = text[backslash:]
+                break
+            if text[backslash + 1] != "u":
+                out.append(self.ESCAPES.get(text[backslash + 1], text[backslash + 1]))
+                position = backslash + 2
+                continue
+
+            code = int(text[backslash + 2:backslash + 6], 16)
+            position = backslash + 6
+            if 0xD800 <= code < 0xDC00:
+                if position + 6 > len(text):
+                    self.escape = text[backslash:]
+                    break
+                if text[position:position + 2] == "\\u":
+                    low = int(text[position + 2:position + 6], 16)
+                    code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                    position += 6
+            out.append(chr(code))
+        return "".join(out)
+
+    def _feed_text(self, text: str) -> bool:
+        lines = (self.partial_line + text).split("\n")
+        self.partial_line = lines.pop()
+        for line in lines:
+            if not self._add_line(line):
+                return False
+        return True
+
+    def _add_line(self, line: str) -> bool:
+        line = line.strip()
+        if not line:
+            return True
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"Error parsing JSON line: {e}")
+            return True
+        # events before the offset were already collected
+        if self.skip:
+            self.skip -= 1
+            return True
+        return self.events.append(event, line)
+
+    def feed(self, data: bytes | str) -> bool:
+        """Parse the next chunk of the body. Returns False once no more data is wanted."""
+        text = self.decoder.decode(data) if isinstance(data, bytes) else data
+        if self.quoted is None:
+            stripped = text.lstrip()
+            if not stripped:
+                return True
+            self.quoted = stripped.startswith('"')
+            text = stripped[1:] if self.quoted else stripped
+        if self.quoted:
+            if self.finished:
+                return False
+            text = self._unescape(text)
+        return self._feed_text(text) and not (self.quoted and self.finished)
+
+    def close(self) -> RecordingEvents:
+        """Flush the last line and return the parsed events."""
+        self._feed_text(self.decoder.decode(b"", final=True) if self.quoted is not None else "")
+        if self.partial_line:
+            self._add_line(self.partial_line)
+            self.partial_line = ""
+        return self.events
+
+
+class RecordingTextParser(RecordingStreamParser):
+    """Incrementally unescape a text recording body, a JSON string fed as raw chunks, into RecordingText.
+
+    The first `skip` characters are discarded. A body that is any other JSON value is small,
+    it is kept and decoded whole.
+    """
+
+    def __init__(self, text: RecordingText, skip: int = 0):
+        super().__init__(None, skip)
+        self.text = text
+        self.other: list[str] = []
+
+    def _feed_text(self, text: str) -> bool:
+        if not self.quoted:
+            self.other.append(text)
+            return True
+        # characters before the offset were already collected
+        if self.skip:
+            skipped = min(self.skip, len(text))
+            self.skip -= skipped
+            text = text[skipped:]
+        if text:
+            self.text.append(text)
+        return True
+
+    def close(self) -> RecordingText | Any:
+        """Return the text, or the decoded body if it was not a JSON string."""
+        remainder = self.decoder.decode(b"", final=True) if self.quoted is not None else ""
+        if remainder and not self.finished:
+            self._feed_text(self._unescape(remainder) if self.quoted else remainder)
+        if self.quoted is False:
+            return json.loads("".join(self.other))
+        return self.text
+
+
+# recording data that is streamed to and from disk rather than held as plain values
+STREAMED_RECORDINGS = (RecordingEvents, RecordingText)
+
+
+def _iter_session_json(session: SessionDict) -> Iterator[str]:
+    """Serialize a session as compact JSON in pieces, streaming RecordingEvents and RecordingText values."""
+    streams: dict[str, RecordingEvents | RecordingText] = {}
+
+    def placeholder(value: Any) -> str:
+        if not isinstance(value, STREAMED_RECORDINGS):
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+        marker = f"recording-data-{uuid.uuid4().hex}"
+        streams[json.dumps(marker)] = value
+        return marker
+
+    text = json.dumps(session, separators=(",", ":"), default=placeholder)
+    for marker, recording_data in streams.items():
+        before, text = text.split(marker, 1)
+        yield before
+        yield from _iter_recording_json(recording_data)
+    yield text
+
+
+def _iter_recording_json(recording_data: RecordingEvents | RecordingText) -> Iterator[str]:
+    if isinstance(recording_data, RecordingText):
+        return _iter_text_json(recording_data)
+    return _iter_events_json(recording_data)
+
+
+def _iter_events_json(events: RecordingEvents) -> Iterator[str]:
+    """Serialize recording events as a JSON array, one event at a time."""
+    yield "["
+    for index, event in enumerate(events.iter_json()):
+        yield ("," if index else "") + event
+    yield "]"
+
+
+def _iter_text_json(text: RecordingText) -> Iterator[str]:
+    """Serialize a text recording as a JSON string, one chunk at a time."""
+    yield '"'
+    for chunk in text.iter_text():
+        yield json.dumps(chunk)[1:-1]
+    yield '"'
+
+
+def _skip_text(recording: Any, offset: int) -> Any:
+    """Drop the first `offset` characters of a text recording that were already collected."""
+    return recording[offset:] if offset and isinstance(recording, str) else recording
+
+
+def _attach_recording_events(recording: dict[str, Any], events: RecordingEvents | list) -> None:
+    recording["recording_data"] = events
+    if isinstance(events, RecordingEvents) and events.truncated:
+        recording["recording_truncated"] = True
+
+
+def _recording_text(text: RecordingText | Any) -> RecordingText | Any:
+    # an empty recording is stored as an empty list, as it always was
+    if isinstance(text, RecordingText) and not text:
+        text.close()
+        return []
+    return text or []
+
+
+def _materialize_recordings(session: SessionDict) -> None:
+    """Replace RecordingEvents and RecordingText in a session with plain values and release their spill files."""
+    for recording in session.get("recordings", []):
+        recording_data = recording.get("recording_data")
+        if isinstance(recording_data, RecordingEvents):
+            recording["recording_data"] = recording_data.to_list()
+            recording_data.close()
+        elif isinstance(recording_data, RecordingText):
+            recording["recording_data"] = recording_data.to_str()
+            recording_data.close()
+
+
+def _release_recordings(session: SessionDict) -> None:
+    for recording in session.get("recordings", []):
+        if isinstance(recording_data := recording.get("recording_data"), STREAMED_RECORDINGS):
+            recording_data.close()
+
+
 class Border0API:
-    def __init__(self, token: str, border0_api_url: str | None = None):
+    def __init__(self, token: str, border0_api_url: str | None = None, pool_size: int = DEFAULT_WORKERS,
+                 timeout: tuple[float, float] = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+                 max_retries: int = DEFAULT_MAX_RETRIES, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 recording_memory_limit: int = int(DEFAULT_RECORDING_MEMORY_LIMIT_MB * 1024 * 1024),
+                 max_recording_events: int | None = None, spill_dir: str | None = None,
+                 recording_offsets: bool = False, rate_limit: float = DEFAULT_RATE_LIMIT):
         self.token = token
         self.border0_api_url = border0_api_url or BORDER_API_URL
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.recording_memory_limit = recording_memory_limit
+        self.max_recording_events = max_recording_events
+        self.spill_dir = spill_dir
+        # whether the API honours an offset parameter on recordings, otherwise seen events are skipped client side
+        self.recording_offsets = recording_offsets
 
-    def api_request(self, endpoint: str, params: dict[str, Any] | None = None) -> dict[str, Any]:
-        """Make a request to the Border0 API."""
-        url = f"{self.border0_api_url}/{endpoint}"
-        headers = {
+        # one keep-alive connection per worker thread, shared across all requests
+        self.session = requests.Session()
+        self.session.headers.update({
             "x-access-token": self.token,
             "accept": "application/json",
-        }
-        response = requests.get(url, headers=headers, params=params)
-
-        match response.status_code:
-            case 200:
-                return response.json()
-            case 500:
-                raise APIError(f"Server error (500): {response.text}")
-            case 404:
-                raise NotFoundError(f"Not found: {response.text}")
-            case _:
-                raise APIError(f"API request failed with status code {response.status_code}: {response.text}")
+            "accept-encoding": "gzip, deflate",
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # the window never grows past the pool, more requests would only queue for a connection
+        self.throttle = Throttle(rate=rate_limit, max_concurrency=pool_size)
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        self.session.close()
+
+    def __enter__(self) -> "Border0API":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _get(self, endpoint: str, params: dict[str, Any] | None = None, stream: bool = False) -> requests.Response:
+        """GET an endpoint, retrying on rate limiting and transient errors, and check the final status."""
+        url = f"{self.border0_api_url}/{endpoint}"
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                # a streamed body is read after the slot is released, the window bounds time to first byte
+                with self.throttle.slot() as slot:
+                    response = self.session.get(url, params=params, timeout=self.timeout, stream=stream)
+                    slot.record(response.status_code)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise APIError(f"API request to {endpoint} failed: {e}") from e
+                time.sleep(_retry_delay(attempt, None, self.backoff_base, self.backoff_max))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                response.close()
+                time.sleep(_retry_delay(attempt, response.headers.get("Retry-After"), self.backoff_base, self.backoff_max))
+                continue
+            break
+
+        if response.status_code != 200:
+            with response:
+                _check_status(response.status_code, response.text)
+        return response
+
+    def api_request(self, endpoint: str, params: dict[str, Any] | None = None) -> dict[str, Any]:
+        """Make a request to the Border0 API, retrying on rate limiting and transient errors."""
+        return self._get(endpoint, params).json()
 
     def get_sessions(self, page: int, page_size: int, filters: SessionFilter | None = None) -> list[SessionDict]:
         """Get a list of sessions with optional filtering."""
         endpoint = "sessions"
-        params: dict[str, Any] = {
-            "page": page,
-            "page_size": page_size,
-        }
-
-        if filters:
-            params |= {k: v for k, v in filters.items() if v is not None}
-
-            if finished := filters.get("finished"):
-                match finished:
-                    case "true":
-                        params["finished"] = True
-                    case "false":
-                        params["finished"] = False
+        params = _session_params(page, page_size, filters)
 
         response_data = self.api_request(endpoint, params)
         return response_data.get("session_logs", [])
 
-    def get_session_recording(self, socket_id: str, session_id: str, recording_id: str | None = None, format: str | None = None) -> dict[str, Any] | None:
-        """Get recording data for a session."""
+    def iter_sessions(self, page_size: int = DEFAULT_PAGE_SIZE, filters: SessionFilter | None = None,
+                      prefetch: int = DEFAULT_PREFETCH_PAGES) -> Iterator[SessionDict]:
+        """Iterate over every session matching the filters, walking all pages.
+
+        Pages are requested in batches, the next one once the last page requested came back full: one
+        page first, then twice as many each time up to `prefetch`. Only pages past the end in the
+        batch holding the last page are requested in vain, none for a listing of one page, and
+        iteration stops at the first short or empty page.
+        """
+        prefetch = max(1, prefetch)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=prefetch) as executor:
+            pending: dict[int, concurrent.futures.Future[list[SessionDict]]] = {}
+            next_page = 1
+            current_page = 1
+            window = 1
+            try:
+                while True:
+                    if _can_prefetch(pending, next_page, page_size):
+                        while len(pending) < window:
+                            pending[next_page] = executor.submit(self.get_sessions, next_page, page_size, filters)
+                            next_page += 1
+
+                    try:
+                        sessions = pending.pop(current_page).result()
+                    except NotFoundError:
+                        # past the last page, the API answers with a 404
+                        if current_page == 1:
+                            raise
+                        return
+
+                    yield from sessions
+
+                    if len(sessions) < page_size:
+                        return
+                    current_page += 1
+                    window = min(prefetch, window * 2)
+            finally:
+                for future in pending.values():
+                    future.cancel()
+
+    def get_session(self, socket_id: str, session_id: str) -> SessionDict:
+        """Get the current state of a single session."""
+        response_data = self.api_request(f"session/{socket_id}/{session_id}")
+        return response_data.get("session_log", response_data)
+
+    def get_session_recording(self, socket_id: str, session_id: str, recording_id: str | None = None, format: str | None = None,
+                              offset: int = 0) -> dict[str, Any] | None:
+        """Get recording data for a session, starting `offset` characters in."""
         endpoint = f"session/{socket_id}/{session_id}/session_log"
-        params = {}
-        if recording_id:
-            params["recording_id"] = recording_id
-        if format:
-            params["format"] = format
+        params = _recording_params(recording_id, format, offset if self.recording_offsets else 0)
 
         if params:
             endpoint += f"?{requests.compat.urlencode(params)}"
 
         try:
-            return self.api_request(endpoint)
+            recording = self.api_request(endpoint)
         except Exception:
             return None
+        return _skip_text(recording, 0 if self.recording_offsets else offset)
+
+    def get_recording_events(self, socket_id: str, session_id: str, recording_id: str | None = None,
+                             format: str | None = None, offset: int = 0) -> RecordingEvents | list:
+        """Stream a JSONL recording, parsing events as the body arrives instead of buffering it.
+
+        Only events after the first `offset` are returned.
+        """
+        endpoint = f"session/{socket_id}/{session_id}/session_log"
+        events = RecordingEvents(self.recording_memory_limit, self.max_recording_events, self.spill_dir)
+        parser = RecordingStreamParser(events, skip=0 if self.recording_offsets else offset)
+        params = _recording_params(recording_id, format, offset if self.recording_offsets else 0)
+        try:
+            with self._get(endpoint, params, stream=True) as response:
+                for chunk in response.iter_content(RECORDING_CHUNK_SIZE):
+                    if not parser.feed(chunk):
+                        break
+            return parser.close()
+        except Exception:
+            events.close()
+            return []
+
+    def get_recording_text(self, socket_id: str, session_id: str, recording_id: str | None = None,
+                           format: str | None = None, offset: int = 0) -> RecordingText | Any:
+        """Stream a text recording, unescaping it as the body arrives instead of buffering it.
+
+        Only the text after the first `offset` characters is returned.
+        """
+        endpoint = f"session/{socket_id}/{session_id}/session_log"
+        text = RecordingText(self.recording_memory_limit, self.spill_dir)
+        parser = RecordingTextParser(text, skip=0 if self.recording_offsets else offset)
+        params = _recording_params(recording_id, format, offset if self.recording_offsets else 0)
+        try:
+            with self._get(endpoint, params, stream=True) as response:
+                for chunk in response.iter_content(RECORDING_CHUNK_SIZE):
+                    if not parser.feed(chunk):
+                        break
+            return _recording_text(parser.close())
+        except Exception:
+            text.close()
+            return []
 
 
 def parse_jsonl_recording_data(recording: str) -> list[dict]:
@@ -145,21 +983,32 @@ def parse_jsonl_recording_data(recording: str) -> list[dict]:
     if not recording:
         return []
 
-    recording_list = []
-    for line in recording.strip().split("\n"):
-        if not line:
-            continue
+    parser = RecordingStreamParser(RecordingEvents(memory_limit=len(recording) + 1))
+    parser.feed(recording)
+    return parser.close().to_list()
+
+
+def _recording_format(recording: dict[str, Any]) -> str:
+    """Return the format to request a recording in."""
+    # return the text format if the recording type is asciinema
+    return "text" if recording.get("recording_type") == "asciinema" else ""
 
-        try:
-            recording_list.append(json.loads(line))
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON line: {e}")
 
-    return recording_list
+def _set_recording_offset(recording: dict[str, Any], offsets: dict[str, int] | None) -> int:
+    """Look up how much of a recording was already collected, noting it on the recording."""
+    offset = (offsets or {}).get(recording["recording_id"], 0)
+    if offset:
+        recording["recording_offset"] = offset
+    return offset
 
 
-def fetch_session_recordings(border0_api: Border0API, session: SessionDict) -> SessionDict:
-    """Fetch recordings for a single session."""
+def _session_log_type(session: SessionDict) -> str:
+    return "session_started" if session.get("end_time", "") == "" else "session_completed"
+
+
+def fetch_session_recordings(border0_api: Border0API, session: SessionDict,
+                             offsets: dict[str, int] | None = None) -> SessionDict:
+    """Fetch recordings for a single session, skipping data already collected up to `offsets`."""
     socket_id = session["socket_id"]
     session_id = session["session_id"]
     recordings = session.get("recordings", [])
@@ -169,21 +1018,356 @@ def fetch_session_recordings(border0_api: Border0API, session: SessionDict) -> S
         recording_id = recording.get("recording_id")
         if not recording_id:
             continue
-        # return the text format if the recording type is asciinema
-        session_format = "text" if recording.get("recording_type") == "asciinema" else ""
-
-        if recording_data := border0_api.get_session_recording(socket_id, session_id, recording_id, session_format):
-            # Don't try to parse if the session format is text
-            if session_format == "text":
-                recording["recording_data"] = recording_data
-            else:
-                recording["recording_data"] = parse_jsonl_recording_data(recording_data)
+        session_format = _recording_format(recording)
+        offset = _set_recording_offset(recording, offsets)
+        # Don't try to parse if the session format is text
+        if session_format == "text":
+            recording["recording_data"] = border0_api.get_recording_text(socket_id, session_id, recording_id, session_format, offset)
         else:
-            recording["recording_data"] = []
+            _attach_recording_events(recording, border0_api.get_recording_events(socket_id, session_id, recording_id, session_format, offset))
 
     return session_copy
 
 
+def collect_sessions(border0_api: Border0API, state_manager: StateManager, filters: SessionFilter,
+                     page_size: int, prefetch: int, workers: int,
+                     on_session: Callable[[SessionDict], None]) -> None:
+    """Fetch recordings of every new session on a thread pool, passing each session to on_session as soon as it is done."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: dict[concurrent.futures.Future[SessionDict], SessionID] = {}
+
+        def drain(block: bool) -> None:
+            # hand finished sessions on right away, so their recordings and spill files are released
+            done, _ = concurrent.futures.wait(pending, timeout=None if block else 0,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                session_id = pending.pop(future)
+                # one failed session must neither hide a listing error nor stop the others from being written
+                try:
+                    updated_session = future.result()
+                except Exception as e:
+                    print(f"Error fetching recordings of session {session_id}: {e}")
+                    continue
+                if updated_session:
+                    on_session(updated_session)
+
+        try:
+            # recordings start downloading while the following pages are still being fetched
+            for session in border0_api.iter_sessions(page_size=page_size, filters=filters, prefetch=prefetch):
+                if state_manager.is_session_processed(session["session_id"], session.get("start_time")):
+                    continue
+                session["session_log_type"] = _session_log_type(session)
+                pending[executor.submit(fetch_session_recordings, border0_api, session)] = session["session_id"]
+                drain(block=len(pending) >= 2 * workers)
+        finally:
+            # sessions already submitted are finished even if listing fails part way, then the
+            # listing error is raised
+            while pending:
+                drain(block=True)
+
+
+class PollResult(enum.Enum):
+    """Outcome of polling an in-progress session."""
+    RUNNING = "running"  # still running, or the poll failed: poll it again later
+    GONE = "gone"  # no longer known to the API: stop tracking it
+    COMPLETED = "completed"  # ended: write it as session_completed
+
+
+def refresh_in_progress(border0_api: Border0API, tracker: InProgressTracker, workers: int,
+                        on_session: Callable[[SessionDict], None]) -> None:
+    """Poll the in-progress sessions that are due, passing those that have ended to on_session
+    as session_completed with only the recording data not written before."""
+
+    def refresh(entry: dict[str, Any]) -> tuple[dict[str, Any], PollResult, SessionDict | None]:
+        try:
+            session = border0_api.get_session(entry["socket_id"], entry["session_id"])
+        except NotFoundError:
+            return entry, PollResult.GONE, None
+        except APIError as e:
+            print(f"Error polling session {entry['session_id']}: {e}")
+            return entry, PollResult.RUNNING, None
+        if _session_log_type(session) == "session_started":
+            return entry, PollResult.RUNNING, None
+        session["session_log_type"] = "session_completed"
+        return entry, PollResult.COMPLETED, fetch_session_recordings(border0_api, session, entry["offsets"])
+
+    due = tracker.due()
+    if not due:
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in concurrent.futures.as_completed([executor.submit(refresh, entry) for entry in due]):
+            entry, result, session = future.result()
+            match result:
+                case PollResult.RUNNING:
+                    tracker.reschedule(entry["session_id"])
+                case PollResult.GONE:
+                    tracker.complete(entry["session_id"])
+                case PollResult.COMPLETED:
+                    tracker.complete(entry["session_id"])
+                    on_session(session)
+
+
+class AsyncBorder0API:
+    """asyncio counterpart of Border0API, sharing one aiohttp session between all coroutines."""
+
+    def __init__(self, token: str, border0_api_url: str | None = None,
+                 concurrency: int = DEFAULT_ASYNC_CONCURRENCY, rate_limit: float = DEFAULT_RATE_LIMIT,
+                 timeout: tuple[float, float] = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+                 max_retries: int = DEFAULT_MAX_RETRIES, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 recording_memory_limit: int = int(DEFAULT_RECORDING_MEMORY_LIMIT_MB * 1024 * 1024),
+                 max_recording_events: int | None = None, spill_dir: str | None = None,
+                 recording_offsets: bool = False):
+        if aiohttp is None:
+            raise RuntimeError("The async engine requires aiohttp, install it with: pip install aiohttp")
+
+        self.token = token
+        self.border0_api_url = border0_api_url or BORDER_API_URL
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.recording_memory_limit = recording_memory_limit
+        self.max_recording_events = max_recording_events
+        self.spill_dir = spill_dir
+        # whether the API honours an offset parameter on recordings, otherwise seen events are skipped client side
+        self.recording_offsets = recording_offsets
+        self.throttle = AsyncThrottle(rate=rate_limit, max_concurrency=concurrency)
+        self.session: "aiohttp.ClientSession | None" = None
+
+    async def __aenter__(self) -> "AsyncBorder0API":
+        self.session = aiohttp.ClientSession(
+            headers={
+                "x-access-token": self.token,
+                "accept": "application/json",
+                "accept-encoding": "gzip, deflate",
+            },
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1]),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        if self.session is not None:
+            await self.session.close()
+
+    @contextlib.asynccontextmanager
+    async def _get(self, endpoint: str, params: dict[str, Any] | None = None) -> AsyncIterator["aiohttp.ClientResponse"]:
+        """GET an endpoint, retrying on rate limiting and transient errors, and check the final status."""
+        url = f"{self.border0_api_url}/{endpoint}"
+        if params:
+            # aiohttp only accepts str, int and float query values
+            params = {k: str(v).lower() if isinstance(v, bool) else v for k, v in params.items()}
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.throttle.slot() as slot:
+                    response = await self.session.get(url, params=params)
+                    slot.record(response.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    raise APIError(f"API request to {endpoint} failed: {e}") from e
+                await asyncio.sleep(_retry_delay(attempt, None, self.backoff_base, self.backoff_max))
+                continue
+
+            if response.status in RETRY_STATUS_CODES and attempt < self.max_retries:
+                response.release()
+                await asyncio.sleep(_retry_delay(attempt, response.headers.get("Retry-After"), self.backoff_base, self.backoff_max))
+                continue
+            break
+
+        try:
+            if response.status != 200:
+                _check_status(response.status, await response.text())
+            yield response
+        finally:
+            response.release()
+
+    async def api_request(self, endpoint: str, params: dict[str, Any] | None = None) -> Any:
+        """Make a request to the Border0 API, retrying on rate limiting and transient errors."""
+        async with self._get(endpoint, params) as response:
+            return json.loads(await response.text())
+
+    async def get_sessions(self, page: int, page_size: int, filters: SessionFilter | None = None) -> list[SessionDict]:
+        """Get a list of sessions with optional filtering."""
+        response_data = await self.api_request("sessions", _session_params(page, page_size, filters))
+        return response_data.get("session_logs", [])
+
+    async def iter_sessions(self, page_size: int = DEFAULT_PAGE_SIZE, filters: SessionFilter | None = None,
+                            prefetch: int = DEFAULT_PREFETCH_PAGES) -> AsyncIterator[SessionDict]:
+        """Iterate over every session matching the filters, fetching up to `prefetch` pages ahead.
+
+        Pages are requested in growing batches as in Border0API.iter_sessions.
+        """
+        prefetch = max(1, prefetch)
+        pending: dict[int, asyncio.Task[list[SessionDict]]] = {}
+        next_page = 1
+        current_page = 1
+        window = 1
+        try:
+            while True:
+                if _can_prefetch(pending, next_page, page_size):
+                    while len(pending) < window:
+                        pending[next_page] = asyncio.create_task(self.get_sessions(next_page, page_size, filters))
+                        next_page += 1
+
+                try:
+                    sessions = await pending.pop(current_page)
+                except NotFoundError:
+                    if current_page == 1:
+                        raise
+                    return
+
+                for session in sessions:
+                    yield session
+
+                if len(sessions) < page_size:
+                    return
+                current_page += 1
+                window = min(prefetch, window * 2)
+        finally:
+            # fetches already sent are awaited rather than cancelled, so they leave the throttle normally
+            if pending:
+                await asyncio.shield(asyncio.gather(*pending.values(), return_exceptions=True))
+
+    async def get_session(self, socket_id: str, session_id: str) -> SessionDict:
+        """Get the current state of a single session."""
+        response_data = await self.api_request(f"session/{socket_id}/{session_id}")
+        return response_data.get("session_log", response_data)
+
+    async def get_session_recording(self, socket_id: str, session_id: str, recording_id: str | None = None, format: str | None = None,
+                                    offset: int = 0) -> Any:
+        """Get recording data for a session, starting `offset` characters in."""
+        endpoint = f"session/{socket_id}/{session_id}/session_log"
+        params = _recording_params(recording_id, format, offset if self.recording_offsets else 0)
+        try:
+            recording = await self.api_request(endpoint, params)
+        except Exception:
+            return None
+        return _skip_text(recording, 0 if self.recording_offsets else offset)
+
+    async def get_recording_events(self, socket_id: str, session_id: str, recording_id: str | None = None,
+                                   format: str | None = None, offset: int = 0) -> RecordingEvents | list:
+        """Stream a JSONL recording, parsing events as the body arrives instead of buffering it.
+
+        Only events after the first `offset` are returned.
+        """
+        endpoint = f"session/{socket_id}/{session_id}/session_log"
+        events = RecordingEvents(self.recording_memory_limit, self.max_recording_events, self.spill_dir)
+        parser = RecordingStreamParser(events, skip=0 if self.recording_offsets else offset)
+        params = _recording_params(recording_id, format, offset if self.recording_offsets else 0)
+        try:
+            async with self._get(endpoint, params) as response:
+                async for chunk in response.content.iter_chunked(RECORDING_CHUNK_SIZE):
+                    if not parser.feed(chunk):
+                        break
+            return parser.close()
+        except Exception:
+            events.close()
+            return []
+
+    async def get_recording_text(self, socket_id: str, session_id: str, recording_id: str | None = None,
+                                 format: str | None = None, offset: int = 0) -> RecordingText | Any:
+        """Stream a text recording, unescaping it as the body arrives instead of buffering it.
+
+        Only the text after the first `offset` characters is returned.
+        """
+        endpoint = f"session/{socket_id}/{session_id}/session_log"
+        text = RecordingText(self.recording_memory_limit, self.spill_dir)
+        parser = RecordingTextParser(text, skip=0 if self.recording_offsets else offset)
+        params = _recording_params(recording_id, format, offset if self.recording_offsets else 0)
+        try:
+            async with self._get(endpoint, params) as response:
+                async for chunk in response.content.iter_chunked(RECORDING_CHUNK_SIZE):
+                    if not parser.feed(chunk):
+                        break
+            return _recording_text(parser.close())
+        except Exception:
+            text.close()
+            return []
+
+
+async def fetch_session_recordings_async(border0_api: AsyncBorder0API, session: SessionDict,
+                                         offsets: dict[str, int] | None = None) -> SessionDict:
+    """Fetch all recordings of a single session concurrently, skipping data already collected up to `offsets`."""
+    socket_id = session["socket_id"]
+    session_id = session["session_id"]
+
+    async def fetch(recording: dict[str, Any]) -> None:
+        session_format = _recording_format(recording)
+        offset = _set_recording_offset(recording, offsets)
+        if session_format == "text":
+            recording["recording_data"] = await border0_api.get_recording_text(
+                socket_id, session_id, recording["recording_id"], session_format, offset)
+        else:
+            _attach_recording_events(recording, await border0_api.get_recording_events(
+                socket_id, session_id, recording["recording_id"], session_format, offset))
+
+    await asyncio.gather(*(fetch(recording) for recording in session.get("recordings", [])
+                           if recording.get("recording_id")))
+    return session.copy()
+
+
+async def collect_sessions_async(border0_api: AsyncBorder0API, state_manager: StateManager, filters: SessionFilter,
+                                 page_size: int, prefetch: int, concurrency: int,
+                                 on_session: Callable[[SessionDict], None]) -> None:
+    """Fetch recordings of every new session with at most `concurrency` sessions in flight,
+    passing each session to on_session as soon as it completes."""
+    semaphore = asyncio.BoundedSemaphore(concurrency)
+    tasks: set[asyncio.Task[None]] = set()
+
+    async def process(session: SessionDict) -> None:
+        async with semaphore:
+            # one failed session must neither hide a listing error nor stop the others from being written
+            try:
+                updated_session = await fetch_session_recordings_async(border0_api, session)
+            except Exception as e:
+                print(f"Error fetching recordings of session {session['session_id']}: {e}")
+                return
+        on_session(updated_session)
+
+    try:
+        async for session in border0_api.iter_sessions(page_size=page_size, filters=filters, prefetch=prefetch):
+            if state_manager.is_session_processed(session["session_id"], session.get("start_time")):
+                continue
+            session["session_log_type"] = _session_log_type(session)
+            task = asyncio.create_task(process(session))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        # sessions already started are finished even if listing fails part way, then the listing error is raised
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+async def refresh_in_progress_async(border0_api: AsyncBorder0API, tracker: InProgressTracker, concurrency: int,
+                                    on_session: Callable[[SessionDict], None]) -> None:
+    """Async counterpart of refresh_in_progress."""
+    semaphore = asyncio.BoundedSemaphore(concurrency)
+
+    async def refresh(entry: dict[str, Any]) -> None:
+        async with semaphore:
+            try:
+                session = await border0_api.get_session(entry["socket_id"], entry["session_id"])
+            except NotFoundError:
+                tracker.complete(entry["session_id"])
+                return
+            except APIError as e:
+                print(f"Error polling session {entry['session_id']}: {e}")
+                tracker.reschedule(entry["session_id"])
+                return
+            if _session_log_type(session) == "session_started":
+                tracker.reschedule(entry["session_id"])
+                return
+            session["session_log_type"] = "session_completed"
+            updated_session = await fetch_session_recordings_async(border0_api, session, entry["offsets"])
+        tracker.complete(entry["session_id"])
+        on_session(updated_session)
+
+    if due := tracker.due():
+        await asyncio.gather(*(refresh(entry) for entry in due))
+
+
 def load_processed_sessions(output_file: str) -> list[SessionDict]:
     """Load processed sessions from a JSON file."""
     path = pathlib.Path(output_file)
@@ -205,20 +1389,451 @@ def save_processed_session(sessions: list[SessionDict], output_file: str) -> Non
         print(f"Error saving processed sessions: {e}")
 
 
-def main() -> None:
-    """Main application entry point."""
-    parser = argparse.ArgumentParser(description="Border0 Session Logger")
-    parser.add_argument("--output-file", help="Path to output file for processed sessions", default=None)
-    args = parser.parse_args()
+class JSONLSessionSink:
+    """Append-only JSONL output, one session per line.
 
-    if not BORDER0_API_TOKEN:
-        raise ValueError("BORDER0_API_TOKEN environment variable is not set.")
+    Lines are fsync'd in batches of `fsync_every`. When `rotate_bytes` is set the file is
+    rotated once it grows past that size, and with `rotate_daily` whenever the UTC date
+    changes. Rotated files are gzip compressed unless `compress` is False.
+    """
+
+    def __init__(self, output_file: str, fsync_every: int = DEFAULT_FSYNC_EVERY, rotate_bytes: int | None = None,
+                 rotate_daily: bool = False, compress: bool = True):
+        self.path = pathlib.Path(output_file)
+        self.fsync_every = max(1, fsync_every)
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.file: IO[str] | None = None
+        self.opened_on: datetime.date | None = None
+        self.unsynced = 0
+        self.written = 0
+
+    def __enter__(self) -> "JSONLSessionSink":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _open(self) -> IO[str]:
+        if self.file is None:
+            if self.path.exists():
+                self.opened_on = datetime.datetime.fromtimestamp(self.path.stat().st_mtime, datetime.timezone.utc).date()
+            else:
+                self.opened_on = datetime.datetime.now(datetime.timezone.utc).date()
+            self.file = self.path.open("a", encoding="utf-8")
+        return self.file
+
+    def _sync(self) -> None:
+        if self.file is not None and self.unsynced:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+
+    def _should_rotate(self) -> bool:
+        if self.file is None:
+            return False
+        if self.rotate_bytes and self.file.tell() >= self.rotate_bytes:
+            return True
+        return self.rotate_daily and self.opened_on != datetime.datetime.now(datetime.timezone.utc).date()
+
+    def _rotate(self) -> None:
+        self._sync()
+        self.file.close()
+        self.file = None
+
+        stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S")
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        sequence = 0
+        while rotated.exists() or pathlib.Path(f"{rotated}.gz").exists():
+            sequence += 1
+            rotated = self.path.with_name(f"{self.path.stem}.{stamp}-{sequence}{self.path.suffix}")
+        self.path.rename(rotated)
+        if self.compress:
+            with rotated.open("rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            rotated.unlink()
+
+    def write(self, session: SessionDict) -> None:
+        """Append a session to the output file."""
+        with self.lock:
+            if self._should_rotate():
+                self._rotate()
+            output = self._open()
+            # long recordings are written event by event, never as one string
+            for piece in _iter_session_json(session):
+                output.write(piece)
+            output.write("\n")
+            self.written += 1
+            self.unsynced += 1
+            if self.unsynced >= self.fsync_every:
+                self._sync()
+        _release_recordings(session)
+
+    def flush(self) -> None:
+        """Flush pending lines to disk."""
+        with self.lock:
+            self._sync()
+
+    def close(self) -> None:
+        """Flush pending lines to disk and close the output file."""
+        with self.lock:
+            if self.file is not None:
+                self._sync()
+                self.file.close()
+                self.file = None
+
+
+class SQLiteStore:
+    """SQLite backend, in WAL mode, for the run cursor, processed sessions and their recordings.
+
+    Sessions are buffered and written in transactions of `batch_size`. The run cursor is
+    committed in the same transaction as anything still buffered, so a crash can never leave
+    a cursor pointing past sessions that were not stored.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            socket_id TEXT,
+            start_time TEXT,
+            end_time TEXT,
+            session_log_type TEXT,
+            metadata TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sessions_socket_id_start_time ON sessions (socket_id, start_time);
+        CREATE INDEX IF NOT EXISTS sessions_start_time ON sessions (start_time);
+        CREATE TABLE IF NOT EXISTS recordings (
+            session_id TEXT NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE,
+            recording_id TEXT NOT NULL,
+            recording_type TEXT,
+            data BLOB,
+            PRIMARY KEY (session_id, recording_id)
+        );
+    """
+
+    def __init__(self, db_file: str = DEFAULT_DB_FILE, batch_size: int = DEFAULT_FSYNC_EVERY):
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(self.SCHEMA)
+        self.batch_size = max(1, batch_size)
+        self.pending: dict[SessionID, tuple[tuple[Any, ...], list[tuple[Any, ...]]]] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _normalize_time(value: str | None) -> str | None:
+        # a single UTC representation keeps start_time comparable as text
+        parsed = _parse_time(value)
+        return parsed.astimezone(datetime.timezone.utc).isoformat() if parsed else value
+
+    def _rows(self, session: SessionDict) -> tuple[tuple[Any, ...], list[tuple[Any, ...]]]:
+        """Encode a session into its sessions row and recordings rows, releasing its spill files."""
+        metadata = dict(session)
+        metadata["recordings"] = []
+        recording_rows = []
+        for recording in session.get("recordings", []):
+            recording = dict(recording)
+            if "recording_data" in recording and recording.get("recording_id"):
+                recording_data = recording.pop("recording_data")
+                if isinstance(recording_data, STREAMED_RECORDINGS):
+                    # compress the data as it is read back, the JSON is never built whole
+                    compressor = zlib.compressobj()
+                    chunks = []
+                    for piece in _iter_recording_json(recording_data):
+                        chunks.append(compressor.compress(piece.encode()))
+                    chunks.append(compressor.flush())
+                    data = b"".join(chunks)
+                    recording_data.close()
+                else:
+                    data = zlib.compress(json.dumps(recording_data).encode())
+                recording_rows.append((session["session_id"], recording["recording_id"],
+                                       recording.get("recording_type"), data))
+            metadata["recordings"].append(recording)
+
+        session_row = (session["session_id"], session.get("socket_id"),
+                       self._normalize_time(session.get("start_time")),
+                       self._normalize_time(session.get("end_time")) or None,
+                       session.get("session_log_type"), json.dumps(metadata))
+        return session_row, recording_rows
+
+    def _write_pending(self) -> None:
+        """Insert buffered sessions, inside the caller's transaction."""
+        session_rows = [session_row for session_row, _ in self.pending.values()]
+        recording_rows = [row for _, rows in self.pending.values() for row in rows]
+        # an upsert, not INSERT OR REPLACE: replacing deletes the row first, and with it (ON DELETE
+        # CASCADE) the recordings stored for the session
+        self.connection.executemany(
+            "INSERT INTO sessions (session_id, socket_id, start_time, end_time, session_log_type, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (session_id) DO UPDATE SET socket_id = excluded.socket_id, "
+            "start_time = excluded.start_time, end_time = excluded.end_time, "
+            "session_log_type = excluded.session_log_type, metadata = excluded.metadata", session_rows)
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO recordings (session_id, recording_id, recording_type, data) VALUES (?, ?, ?, ?)",
+            recording_rows)
+        self.pending.clear()
+
+    def add_session(self, session: SessionDict) -> None:
+        """Buffer a processed session, writing the buffer once it holds batch_size sessions.
+
+        Recordings are compressed right away, so buffered sessions hold no spill files.
+        """
+        rows = self._rows(session)
+        with self.lock:
+            self.pending[session["session_id"]] = rows
+            if len(self.pending) >= self.batch_size:
+                with self.connection:
+                    self._write_pending()
+
+    def has_session(self, session_id: SessionID) -> bool:
+        with self.lock:
+            if session_id in self.pending:
+                return True
+            return self.connection.execute(
+                "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is not None
+
+    def flush(self) -> None:
+        """Write all buffered sessions in one transaction."""
+        with self.lock, self.connection:
+            self._write_pending()
 
-    state_manager = StateManager()
-    state_manager.load_state()
+    def get_state(self, key: str) -> str | None:
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
 
-    border0_api = Border0API(BORDER0_API_TOKEN)
+    def save_state(self, values: dict[str, str | None]) -> None:
+        """Store state values together with all buffered sessions in one transaction."""
+        with self.lock, self.connection:
+            self._write_pending()
+            self.connection.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", values.items())
 
+    def query_sessions(self, socket_id: str | None = None, start_after: str | None = None,
+                       start_before: str | None = None) -> list[SessionDict]:
+        """Return stored session metadata, without recording data, ordered by start time."""
+        clauses = []
+        params: list[Any] = []
+        if socket_id:
+            clauses.append("socket_id = ?")
+            params.append(socket_id)
+        if start_after:
+            clauses.append("start_time >= ?")
+            params.append(self._normalize_time(start_after))
+        if start_before:
+            clauses.append("start_time < ?")
+            params.append(self._normalize_time(start_before))
+
+        query = "SELECT metadata FROM sessions"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY start_time"
+        with self.lock:
+            return [json.loads(row[0]) for row in self.connection.execute(query, params)]
+
+    def get_recording_data(self, session_id: SessionID, recording_id: str) -> Any:
+        """Return the stored data of a single recording, or None if it was not stored."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT data FROM recordings WHERE session_id = ? AND recording_id = ?",
+                (session_id, recording_id)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row and row[0] is not None else None
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+
+class SQLiteStateManager:
+    """StateManager counterpart keeping the run cursor and processed sessions in a SQLiteStore."""
+
+    def __init__(self, store: SQLiteStore, in_progress: InProgressTracker | None = None):
+        self.store = store
+        self.last_run_time: str | None = None
+        # completed sessions replace the stored row, so their recordings are fetched whole
+        self.in_progress = in_progress or InProgressTracker(incremental=False)
+
+    def load_state(self) -> None:
+        """Load the run cursor and in-progress sessions from the database."""
+        self.last_run_time = self.store.get_state("last_run_time")
+        self.in_progress.load(json.loads(self.store.get_state("in_progress_sessions") or "[]"))
+
+    def save_state(self) -> None:
+        """Commit the run cursor and in-progress sessions together with any buffered sessions."""
+        self.store.save_state({"last_run_time": self.last_run_time,
+                               "in_progress_sessions": json.dumps(self.in_progress.to_list())})
+
+    def update_run_time(self, run_time: str | None = None) -> None:
+        """Update last run time to the given time, or the current UTC time."""
+        self.last_run_time = run_time or datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+    def add_processed_session(self, session_id: SessionID, start_time: str | None = None) -> None:
+        """Nothing to do, a session counts as processed once SQLiteSessionSink stores it."""
+
+    def is_session_processed(self, session_id: SessionID, start_time: str | None = None) -> bool:
+        """Check if a session has been processed."""
+        return self.store.has_session(session_id)
+
+
+class SQLiteSessionSink:
+    """Output sink writing processed sessions and recordings to a SQLiteStore."""
+
+    def __init__(self, store: SQLiteStore):
+        self.store = store
+        self.written = 0
+
+    def write(self, session: SessionDict) -> None:
+        self.store.add_session(session)
+        self.written += 1
+
+    def flush(self) -> None:
+        self.store.flush()
+
+    def close(self) -> None:
+        self.store.flush()
+
+
+def _jsonl_session_ids(jsonl_file: str) -> set[SessionID]:
+    """IDs of the sessions already in a JSONL output file, read line by line."""
+    session_ids: set[SessionID] = set()
+    with contextlib.suppress(FileNotFoundError), open(jsonl_file, "r", encoding="utf-8") as lines:
+        for line in lines:
+            with contextlib.suppress(json.JSONDecodeError, AttributeError):
+                if session_id := json.loads(line).get("session_id"):
+                    session_ids.add(session_id)
+    return session_ids
+
+
+def convert_json_to_jsonl(json_file: str, jsonl_file: str) -> int:
+    """One-time conversion of a processed_sessions.json array into JSONL output.
+
+    The array is decoded one element at a time, so the whole file is never held in memory.
+    Sessions already in the JSONL file are skipped, so running the conversion again adds
+    nothing twice. Returns the number of sessions converted.
+    """
+    decoder = json.JSONDecoder()
+    existing = _jsonl_session_ids(jsonl_file)
+    count = 0
+
+    with open(json_file, "r", encoding="utf-8") as src, JSONLSessionSink(jsonl_file) as sink:
+        buffer = src.read(1 << 20).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{json_file} does not contain a JSON array")
+        position = 1
+        eof = False
+
+        while True:
+            # skip whitespace and separators between elements
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                break
+
+            try:
+                session, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # the element continues in the next chunk
+                chunk = src.read(1 << 20)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+
+            if session.get("session_id") in existing:
+                continue
+            sink.write(session)
+            count += 1
+
+    return count
+
+
+class SessionCollector:
+    """Runs collection passes with the configured engine, keeping its API client (and, for the
+    async engine, its event loop) open between passes."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        timeout = (DEFAULT_CONNECT_TIMEOUT, args.timeout)
+        recording_options = {
+            "recording_memory_limit": int(args.recording_memory_limit_mb * 1024 * 1024),
+            "max_recording_events": args.max_recording_events or None,
+            "spill_dir": args.spill_dir,
+            "recording_offsets": args.recording_offsets,
+        }
+        self.loop: asyncio.AbstractEventLoop | None = None
+        if args.engine == "async":
+            self.loop = asyncio.new_event_loop()
+            self.border0_api = AsyncBorder0API(BORDER0_API_TOKEN, concurrency=args.concurrency, rate_limit=args.rate_limit,
+                                               timeout=timeout, max_retries=args.max_retries, **recording_options)
+            self.loop.run_until_complete(self.border0_api.__aenter__())
+        else:
+            # pool holds a connection for every recording worker and every prefetched page
+            self.border0_api = Border0API(BORDER0_API_TOKEN, pool_size=args.workers + args.prefetch_pages,
+                                          rate_limit=args.rate_limit, timeout=timeout, max_retries=args.max_retries,
+                                          **recording_options)
+
+    def __enter__(self) -> "SessionCollector":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def collect(self, state_manager: StateManager | SQLiteStateManager, filters: SessionFilter,
+                on_session: Callable[[SessionDict], None]) -> None:
+        """Fetch every new session in the filtered window, passing each one to on_session."""
+        if self.loop is not None:
+            self.loop.run_until_complete(collect_sessions_async(
+                self.border0_api, state_manager, filters, self.args.page_size, self.args.prefetch_pages,
+                self.args.concurrency, on_session))
+        else:
+            collect_sessions(self.border0_api, state_manager, filters, self.args.page_size,
+                             self.args.prefetch_pages, self.args.workers, on_session)
+
+    def refresh(self, tracker: InProgressTracker, on_session: Callable[[SessionDict], None]) -> None:
+        """Poll the in-progress sessions that are due, passing those that have ended to on_session."""
+        if self.loop is not None:
+            self.loop.run_until_complete(refresh_in_progress_async(
+                self.border0_api, tracker, self.args.concurrency, on_session))
+        else:
+            refresh_in_progress(self.border0_api, tracker, self.args.workers, on_session)
+
+    def throttle_summary(self) -> str:
+        """One line describing the client-side rate and concurrency control."""
+        stats = self.border0_api.throttle.stats()
+        rate = f"{stats['rate']:g} requests/s" if stats["rate"] is not None else "unlimited rate"
+        return (f"API throttle: {rate}, concurrency {stats['concurrency_limit']}, {stats['in_flight']} in flight, "
+                f"{stats['requests']} requests, {stats['throttle_events']} throttle events")
+
+    def close(self) -> None:
+        if self.loop is not None:
+            self.loop.run_until_complete(self.border0_api.__aexit__(None, None, None))
+            self.loop.close()
+        else:
+            self.border0_api.close()
+
+
+def checkpoint(state_manager: StateManager | SQLiteStateManager,
+               sink: JSONLSessionSink | SQLiteSessionSink | None) -> None:
+    """Make written sessions durable, then record them and the run cursor in the state."""
+    if sink is not None:
+        sink.flush()
+    state_manager.save_state()
+
+
+def collect_once(collector: SessionCollector, state_manager: StateManager | SQLiteStateManager,
+                 sink: JSONLSessionSink | SQLiteSessionSink | None, output_file: str) -> int:
+    """Collect every new session since the last run, and every tracked in-progress session that
+    has since ended, into the sink, or the JSON output file without one, and advance the run
+    cursor. Returns the number of sessions written.
+
+    Raises APIError if listing sessions fails; the cursor is then left where it was.
+    """
     # Use last run time as start_date if available, otherwise use 1 day ago window
     yesterday = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
 
@@ -227,44 +1842,223 @@ def main() -> None:
     start_date_before = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
     filters: SessionFilter = {
-        start_date_after: start_date_after,
-        start_date_before: start_date_before
+        "start_date_after": start_date_after,
+        "start_date_before": start_date_before
     }
 
-    try:
-        sessions = border0_api.get_sessions(page=1, page_size=100, filters=filters)
-    except NotFoundError:
-        print("No sessions found")
-        return
-    except APIError as e:
-        print(f"Error fetching sessions: {e}")
-        return
-
-    new_sessions = [session for session in sessions
-                   if not state_manager.is_session_processed(session["session_id"])]
+    updated_sessions = []
+    count = 0
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        futures = list()
-        for session in new_sessions:
-            session["session_log_type"] = "session_started" if session.get("end_time", "") == "" else "session_completed"
-            futures.append(executor.submit(fetch_session_recordings, border0_api, session))
+    def on_session(session: SessionDict) -> None:
+        nonlocal count
+        count += 1
+        state_manager.add_processed_session(session["session_id"], session.get("start_time"))
+        if session.get("session_log_type") == "session_started":
+            # before the sink releases the recording data the offsets are taken from
+            state_manager.in_progress.track(session)
+        if sink is not None:
+            sink.write(session)
+        else:
+            _materialize_recordings(session)
+            updated_sessions.append(session)
 
-        updated_sessions = []
-        for future in concurrent.futures.as_completed(futures):
-            if updated_session := future.result():
-                state_manager.add_processed_session(updated_session["session_id"])
-                updated_sessions.append(updated_session)
+    # sessions that were running last time go first, they are not listed again
+    collector.refresh(state_manager.in_progress, on_session)
+    try:
+        collector.collect(state_manager, filters, on_session)
+    except NotFoundError:
+        pass
 
-    state_manager.update_run_time()
-    state_manager.save_state()
+    # the next window starts where this one ended, so sessions starting during the pass are not skipped
+    state_manager.update_run_time(start_date_before)
 
-    # Write to output file
-    output_file = args.output_file or "processed_sessions.json"
     if updated_sessions:
         sessions = load_processed_sessions(output_file)
         sessions.extend(updated_sessions)
         save_processed_session(sessions, output_file)
-        print(f"Wrote {len(updated_sessions)} new sessions to {output_file}")
+    return count
+
+
+def run_collection(args: argparse.Namespace, state_manager: StateManager | SQLiteStateManager,
+                   sink: JSONLSessionSink | SQLiteSessionSink | None, output_file: str) -> None:
+    """Run a single collection pass."""
+    with SessionCollector(args) as collector:
+        try:
+            count = collect_once(collector, state_manager, sink, output_file)
+        except APIError as e:
+            print(f"Error fetching sessions: {e}")
+            print(collector.throttle_summary())
+            # sessions already streamed to the sink must not be written again, but the
+            # run time is left alone so the rest of the window is retried next run
+            if sink is not None:
+                checkpoint(state_manager, sink)
+            return
+        print(collector.throttle_summary())
+
+    checkpoint(state_manager, sink)
+    if count:
+        print(f"Wrote {count} new sessions to {output_file}")
+    else:
+        print("No new sessions")
+
+
+def follow(args: argparse.Namespace, state_manager: StateManager | SQLiteStateManager,
+           sink: JSONLSessionSink | SQLiteSessionSink | None, output_file: str) -> None:
+    """Collect continuously until SIGTERM or SIGINT.
+
+    The poll interval drops back to --poll-interval whenever a pass finds new sessions and
+    doubles, up to --max-poll-interval, while idle. State is checkpointed every
+    --checkpoint-interval seconds and once more on shutdown.
+    """
+    stop = threading.Event()
+
+    def request_stop(signum: int, frame: Any) -> None:
+        print(f"Received {signal.Signals(signum).name}, stopping after the current pass")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    interval = args.poll_interval
+    last_checkpoint = time.monotonic()
+    with SessionCollector(args) as collector:
+        try:
+            while not stop.is_set():
+                try:
+                    count = collect_once(collector, state_manager, sink, output_file)
+                except APIError as e:
+                    print(f"Error fetching sessions: {e}")
+                    count = 0
+
+                if count:
+                    print(f"Wrote {count} new sessions to {output_file}")
+                    interval = args.poll_interval
+                else:
+                    interval = min(args.max_poll_interval, interval * 2)
+
+                if time.monotonic() - last_checkpoint >= args.checkpoint_interval:
+                    checkpoint(state_manager, sink)
+                    print(collector.throttle_summary())
+                    last_checkpoint = time.monotonic()
+
+                stop.wait(interval)
+        finally:
+            checkpoint(state_manager, sink)
+
+
+def main() -> None:
+    """Main application entry point."""
+    parser = argparse.ArgumentParser(description="Border0 Session Logger")
+    parser.add_argument("--output-file", help="Path to output file for processed sessions", default=None)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f"Number of sessions to request per page (default: {DEFAULT_PAGE_SIZE})")
+    parser.add_argument("--prefetch-pages", type=int, default=DEFAULT_PREFETCH_PAGES,
+                        help=f"Number of pages to fetch ahead concurrently (default: {DEFAULT_PREFETCH_PAGES})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Number of recordings to download concurrently (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_READ_TIMEOUT,
+                        help=f"Per-request read timeout in seconds (default: {DEFAULT_READ_TIMEOUT:g})")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help=f"Retries on 429/5xx and connection errors (default: {DEFAULT_MAX_RETRIES})")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads",
+                        help="Concurrency engine used to download recordings (default: threads)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_ASYNC_CONCURRENCY,
+                        help=f"Maximum sessions in flight with --engine async (default: {DEFAULT_ASYNC_CONCURRENCY})")
+    parser.add_argument("--rate-limit", type=float, default=DEFAULT_RATE_LIMIT,
+                        help=f"Maximum API requests per second, 0 to disable (default: {DEFAULT_RATE_LIMIT:g})")
+    parser.add_argument("--output-format", choices=["jsonl", "json"], default="jsonl",
+                        help="Append sessions as JSON lines (default) or rewrite a single JSON array each run")
+    parser.add_argument("--fsync-every", type=int, default=DEFAULT_FSYNC_EVERY,
+                        help="Number of sessions written per JSONL fsync or SQLite transaction "
+                             f"(default: {DEFAULT_FSYNC_EVERY})")
+    parser.add_argument("--rotate-size-mb", type=float, default=None,
+                        help="Rotate the JSONL output file once it exceeds this size in MB")
+    parser.add_argument("--rotate-daily", action="store_true", help="Rotate the JSONL output file when the UTC date changes")
+    parser.add_argument("--no-compress", action="store_true", help="Do not gzip rotated JSONL output files")
+    parser.add_argument("--state-retention-hours", type=float, default=DEFAULT_STATE_RETENTION_HOURS,
+                        help="How long before the last run processed session IDs are kept, as a margin for "
+                             f"clock skew (default: {DEFAULT_STATE_RETENTION_HOURS:g})")
+    parser.add_argument("--bloom-filter", action="store_true",
+                        help="Answer most processed-session lookups from an in-memory Bloom filter")
+    parser.add_argument("--recording-memory-limit-mb", type=float, default=DEFAULT_RECORDING_MEMORY_LIMIT_MB,
+                        help="Recording data held in memory per recording before it is spilled to a temporary "
+                             f"file (default: {DEFAULT_RECORDING_MEMORY_LIMIT_MB:g})")
+    parser.add_argument("--max-recording-events", type=int, default=0,
+                        help="Keep at most this many events per recording and mark it truncated, 0 for no cap (default: 0)")
+    parser.add_argument("--spill-dir", default=None,
+                        help="Directory for spilled recording data (default: the system temporary directory)")
+    parser.add_argument("--store", choices=["files", "sqlite"], default="files",
+                        help="Keep state and sessions in JSON files (default) or a SQLite database")
+    parser.add_argument("--db-file", default=DEFAULT_DB_FILE,
+                        help=f"SQLite database used with --store sqlite (default: {DEFAULT_DB_FILE})")
+    parser.add_argument("--convert-json", metavar="JSON_FILE", default=None,
+                        help="Convert an existing JSON array output file to JSONL (written to --output-file) and exit")
+    parser.add_argument("--follow", action="store_true",
+                        help="Keep running and poll for new sessions instead of exiting after one pass")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help=f"Shortest delay between polls with --follow, in seconds (default: {DEFAULT_POLL_INTERVAL:g})")
+    parser.add_argument("--max-poll-interval", type=float, default=DEFAULT_MAX_POLL_INTERVAL,
+                        help=f"Longest delay between polls while idle with --follow (default: {DEFAULT_MAX_POLL_INTERVAL:g})")
+    parser.add_argument("--checkpoint-interval", type=float, default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help=f"Seconds between state checkpoints with --follow (default: {DEFAULT_CHECKPOINT_INTERVAL:g})")
+    parser.add_argument("--in-progress-poll-factor", type=float, default=DEFAULT_IN_PROGRESS_POLL_FACTOR,
+                        help="Poll a running session again after this fraction of its age "
+                             f"(default: {DEFAULT_IN_PROGRESS_POLL_FACTOR:g})")
+    parser.add_argument("--in-progress-max-interval", type=float, default=DEFAULT_IN_PROGRESS_MAX_INTERVAL,
+                        help=f"Longest delay between polls of a running session, in seconds (default: {DEFAULT_IN_PROGRESS_MAX_INTERVAL:g})")
+    parser.add_argument("--in-progress-max-age-hours", type=float, default=DEFAULT_IN_PROGRESS_MAX_AGE_HOURS,
+                        help=f"Stop polling sessions still running after this many hours (default: {DEFAULT_IN_PROGRESS_MAX_AGE_HOURS:g})")
+    parser.add_argument("--recording-offsets", action="store_true",
+                        help="Ask the API for only the new part of a recording instead of skipping it client-side")
+    args = parser.parse_args()
+
+    if args.follow and args.store == "files" and args.output_format == "json":
+        parser.error("--follow needs an append-only output, use --output-format jsonl or --store sqlite")
+
+    if args.convert_json:
+        jsonl_file = args.output_file or str(pathlib.Path(args.convert_json).with_suffix(".jsonl"))
+        count = convert_json_to_jsonl(args.convert_json, jsonl_file)
+        print(f"Converted {count} sessions from {args.convert_json} to {jsonl_file}")
+        return
+
+    if not BORDER0_API_TOKEN:
+        raise ValueError("BORDER0_API_TOKEN environment variable is not set.")
+
+    tracker_options = {
+        "poll_factor": args.in_progress_poll_factor,
+        "max_interval": args.in_progress_max_interval,
+        "max_age": datetime.timedelta(hours=args.in_progress_max_age_hours),
+    }
+    store = None
+    if args.store == "sqlite":
+        store = SQLiteStore(args.db_file, batch_size=args.fsync_every)
+        state_manager = SQLiteStateManager(store, InProgressTracker(incremental=False, **tracker_options))
+        sink = SQLiteSessionSink(store)
+        output_file = args.db_file
+    else:
+        state_manager = StateManager(retention=datetime.timedelta(hours=args.state_retention_hours),
+                                     use_bloom_filter=args.bloom_filter,
+                                     in_progress=InProgressTracker(**tracker_options))
+        if args.output_format == "jsonl":
+            output_file = args.output_file or "processed_sessions.jsonl"
+            rotate_bytes = int(args.rotate_size_mb * 1024 * 1024) if args.rotate_size_mb else None
+            sink = JSONLSessionSink(output_file, fsync_every=args.fsync_every, rotate_bytes=rotate_bytes,
+                                    rotate_daily=args.rotate_daily, compress=not args.no_compress)
+        else:
+            output_file = args.output_file or "processed_sessions.json"
+            sink = None
+
+    try:
+        state_manager.load_state()
+        if args.follow:
+            follow(args, state_manager, sink, output_file)
+        else:
+            run_collection(args, state_manager, sink, output_file)
+    finally:
+        if sink is not None:
+            sink.close()
+        if store is not None:
+            store.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+import asyncio
+import pathlib
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import main
+
+
+def listing(total: int, page: int, page_size: int) -> list[main.SessionDict]:
+    return [{"session_id": f"s{i}"} for i in range((page - 1) * page_size, min(total, page * page_size))]
+
+
+class FakeBorder0API(main.Border0API):
+    def __init__(self, total: int, not_found_past_end: bool = False):
+        super().__init__("token")
+        self.total = total
+        self.not_found_past_end = not_found_past_end
+        self.pages: list[int] = []
+        self.lock = threading.Lock()
+
+    def get_sessions(self, page: int, page_size: int, filters: main.SessionFilter | None = None) -> list[main.SessionDict]:
+        with self.lock:
+            self.pages.append(page)
+        if self.not_found_past_end and (page - 1) * page_size >= self.total:
+            raise main.NotFoundError("Not found: page")
+        return listing(self.total, page, page_size)
+
+
+class FakeAsyncBorder0API(main.AsyncBorder0API):
+    def __init__(self, total: int):
+        super().__init__("token")
+        self.total = total
+        self.pages: list[int] = []
+        self.completed: list[int] = []
+
+    async def get_sessions(self, page: int, page_size: int, filters: main.SessionFilter | None = None) -> list[main.SessionDict]:
+        self.pages.append(page)
+        await asyncio.sleep(0.001 * page)
+        self.completed.append(page)
+        return listing(self.total, page, page_size)
+
+
+class IterSessionsTest(unittest.TestCase):
+    def iterate(self, total: int, **kwargs) -> FakeBorder0API:
+        api = FakeBorder0API(total, **kwargs)
+        sessions = list(api.iter_sessions(page_size=100, prefetch=4))
+        self.assertEqual([session["session_id"] for session in sessions], [f"s{i}" for i in range(total)])
+        api.close()
+        return api
+
+    def test_no_pages_past_a_short_one(self):
+        self.assertEqual(self.iterate(0).pages, [1])
+        self.assertEqual(self.iterate(50).pages, [1])
+        self.assertEqual(sorted(self.iterate(250).pages), [1, 2, 3])
+        self.assertEqual(sorted(self.iterate(200).pages), [1, 2, 3])
+
+    def test_long_listing_requests_at_most_one_batch_past_the_end(self):
+        pages = self.iterate(1050).pages
+        self.assertEqual(len(pages), len(set(pages)))
+        # page 11 is the last; how much of its batch was already requested depends on timing
+        self.assertIn(11, pages)
+        self.assertLess(max(pages), 11 + 4)
+
+    def test_not_found_past_the_end(self):
+        self.iterate(200, not_found_past_end=True)
+
+
+@unittest.skipIf(main.aiohttp is None, "the async engine needs aiohttp")
+class AsyncIterSessionsTest(unittest.IsolatedAsyncioTestCase):
+    async def iterate(self, total: int) -> FakeAsyncBorder0API:
+        api = FakeAsyncBorder0API(total)
+        sessions = [session async for session in api.iter_sessions(page_size=100, prefetch=4)]
+        self.assertEqual(len(sessions), total)
+        return api
+
+    async def test_no_pages_past_a_short_one(self):
+        self.assertEqual((await self.iterate(50)).pages, [1])
+        self.assertEqual(sorted((await self.iterate(250)).pages), [1, 2, 3])
+        pages = (await self.iterate(1050)).pages
+        self.assertEqual(len(pages), len(set(pages)))
+        self.assertIn(11, pages)
+        self.assertLess(max(pages), 11 + 4)
+
+    async def test_closing_early_waits_for_fetches_in_flight(self):
+        api = FakeAsyncBorder0API(1000)
+        sessions = api.iter_sessions(page_size=100, prefetch=4)
+        async for session in sessions:
+            if session["session_id"] == "s150":
+                break
+        await sessions.aclose()
+        # pages already requested were finished rather than cancelled
+        self.assertEqual(sorted(api.completed), sorted(api.pages))
+        self.assertEqual([task for task in asyncio.all_tasks() if task is not asyncio.current_task()], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import pathlib
+import sys
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import main
+
+EVENTS = [
+    {"t": 0.5, "data": "plain"},
+    {"t": 1, "data": 'quotes " and backslashes \\ and a slash /'},
+    {"t": 2, "data": "tabs\tand\r\nnewlines inside a string"},
+    {"t": 3, "data": "accents é, CJK 中文 and an emoji 😀"},
+    {"t": 4, "data": "\u0000\u001f control characters"},
+]
+JSONL = "\n".join(json.dumps(event) for event in EVENTS) + "\n"
+TEXT = 'Last login\r\n$ echo "héllo 😀" \\ done\r\n\x1b[0m'
+
+
+def chunks(body: bytes, size: int) -> list[bytes]:
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class RecordingStreamParserTest(unittest.TestCase):
+    def parse(self, body: bytes, size: int, memory_limit: int = 1 << 20, max_events: int | None = None,
+              skip: int = 0) -> main.RecordingEvents:
+        parser = main.RecordingStreamParser(main.RecordingEvents(memory_limit, max_events), skip)
+        for chunk in chunks(body, size):
+            if not parser.feed(chunk):
+                break
+        events = parser.close()
+        self.addCleanup(events.close)
+        return events
+
+    def test_quoted_body_in_chunks_of_any_size(self):
+        # the API wraps the JSONL document in a JSON string, escaped with \uXXXX and surrogate pairs
+        for ensure_ascii in (True, False):
+            body = json.dumps(JSONL, ensure_ascii=ensure_ascii).encode()
+            for size in range(1, 14):
+                with self.subTest(ensure_ascii=ensure_ascii, size=size):
+                    self.assertEqual(self.parse(body, size).to_list(), EVENTS)
+
+    def test_plain_jsonl_body(self):
+        for size in (1, 7, 4096):
+            self.assertEqual(self.parse(JSONL.encode(), size).to_list(), EVENTS)
+
+    def test_last_line_without_newline(self):
+        self.assertEqual(self.parse(json.dumps(JSONL.rstrip("\n")).encode(), 5).to_list(), EVENTS)
+
+    def test_skip(self):
+        self.assertEqual(self.parse(json.dumps(JSONL).encode(), 3, skip=2).to_list(), EVENTS[2:])
+
+    def test_max_events(self):
+        events = self.parse(json.dumps(JSONL).encode(), 3, max_events=2)
+        self.assertEqual(events.to_list(), EVENTS[:2])
+        self.assertTrue(events.truncated)
+
+    def test_spilled_events_read_back_the_same(self):
+        events = self.parse(json.dumps(JSONL).encode(), 3, memory_limit=40)
+        self.assertIsNotNone(events.spill_file)
+        self.assertEqual(len(events), len(EVENTS))
+        self.assertEqual(events.to_list(), EVENTS)
+
+
+class RecordingTextParserTest(unittest.TestCase):
+    def parse(self, body: bytes, size: int, memory_limit: int = 1 << 20, skip: int = 0) -> main.RecordingText | object:
+        parser = main.RecordingTextParser(main.RecordingText(memory_limit), skip)
+        for chunk in chunks(body, size):
+            if not parser.feed(chunk):
+                break
+        text = parser.close()
+        if isinstance(text, main.RecordingText):
+            self.addCleanup(text.close)
+        return text
+
+    def test_text_in_chunks_of_any_size(self):
+        for ensure_ascii in (True, False):
+            body = json.dumps(TEXT, ensure_ascii=ensure_ascii).encode()
+            for size in range(1, 14):
+                with self.subTest(ensure_ascii=ensure_ascii, size=size):
+                    self.assertEqual(self.parse(body, size).to_str(), TEXT)
+
+    def test_spilled_text_keeps_carriage_returns(self):
+        text = self.parse(json.dumps(TEXT).encode(), 4, memory_limit=8)
+        self.assertIsNotNone(text.spill_file)
+        self.assertEqual(len(text), len(TEXT))
+        self.assertEqual(text.to_str(), TEXT)
+
+    def test_skip(self):
+        self.assertEqual(self.parse(json.dumps(TEXT).encode(), 5, skip=12).to_str(), TEXT[12:])
+
+    def test_body_that_is_not_a_string(self):
+        self.assertEqual(self.parse(b'{"error": "no recording"}', 4), {"error": "no recording"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import datetime
+import json
+import pathlib
+import sys
+import tempfile
+import unittest
+import uuid
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import main
+
+START = datetime.datetime(2026, 10, 17, 12, 30, tzinfo=datetime.timezone.utc)
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_no_false_negatives_and_few_false_positives(self):
+        bloom = main.BloomFilter(1000, error_rate=0.01)
+        keys = [uuid.uuid4().bytes for _ in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(uuid.uuid4().bytes in bloom for _ in range(10_000))
+        self.assertLess(false_positives, 300)
+
+
+class SessionIndexTest(unittest.TestCase):
+    def test_contains_before_and_after_dump(self):
+        for use_bloom_filter in (False, True):
+            with self.subTest(use_bloom_filter=use_bloom_filter):
+                index = main.SessionIndex(use_bloom_filter)
+                ids = [str(uuid.uuid4()) for _ in range(50)] + ["not-a-uuid"]
+                for i, session_id in enumerate(ids):
+                    index.add(session_id, START + datetime.timedelta(hours=i % 3))
+                restored = main.SessionIndex(use_bloom_filter)
+                restored.load(json.loads(json.dumps(index.dump())))
+                for candidate in (index, restored):
+                    self.assertEqual(len(candidate), len(ids))
+                    self.assertTrue(all(candidate.contains(session_id, START) for session_id in ids))
+                    self.assertTrue(candidate.contains(ids[1], None))
+                    self.assertFalse(candidate.contains(str(uuid.uuid4()), START))
+
+    def test_expire_drops_whole_hours(self):
+        index = main.SessionIndex()
+        index.add("old", START - datetime.timedelta(hours=2))
+        index.add("new", START)
+        index.expire(START - datetime.timedelta(minutes=30))
+        self.assertFalse(index.contains("old"))
+        self.assertTrue(index.contains("new"))
+        self.assertEqual(len(index), 1)
+
+
+class StateManagerTest(unittest.TestCase):
+    def test_state_round_trip_and_retention(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(pathlib.Path(directory) / "state.json")
+            state = main.StateManager(path, retention=datetime.timedelta(hours=1))
+            state.add_processed_session("kept", START.isoformat())
+            state.add_processed_session("expired", (START - datetime.timedelta(hours=3)).isoformat())
+            state.update_run_time(START.isoformat())
+            state.save_state()
+
+            loaded = main.StateManager(path)
+            loaded.load_state()
+            self.assertEqual(loaded.last_run_time, START.isoformat())
+            self.assertTrue(loaded.is_session_processed("kept", START.isoformat()))
+            self.assertFalse(loaded.is_session_processed("expired"))
+
+    def test_legacy_state_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "state.json"
+            path.write_text(json.dumps({"last_run_time": START.isoformat(), "processed_session_ids": ["a", "b"]}))
+            state = main.StateManager(str(path))
+            state.load_state()
+            self.assertTrue(state.is_session_processed("a"))
+            self.assertFalse(state.is_session_processed("c"))
+
+
+if __name__ == "__main__":
+    unittest.main()
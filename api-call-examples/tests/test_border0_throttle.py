@@ -0,0 +1,135 @@
+import asyncio
+import contextlib
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from border0_throttle import AsyncThrottle, Throttle, listed
+
+
+class ThrottleTest(unittest.TestCase):
+    def test_window_starts_at_max_concurrency(self):
+        self.assertEqual(Throttle(max_concurrency=8).stats()["concurrency_limit"], 8)
+        self.assertEqual(Throttle(initial_concurrency=2, max_concurrency=8).stats()["concurrency_limit"], 2)
+
+    def test_throttle_status_halves_window_and_rate_once_per_round_trip(self):
+        throttle = Throttle(rate=100, max_concurrency=8)
+        # three overlapping requests answered with 429 at once are one burst
+        with contextlib.ExitStack() as stack:
+            slots = [stack.enter_context(throttle.slot()) for _ in range(3)]
+            time.sleep(0.05)
+            for slot in slots:
+                slot.record(429)
+        stats = throttle.stats()
+        self.assertEqual(stats["concurrency_limit"], 4)
+        self.assertEqual(stats["rate"], 50)
+        self.assertEqual(stats["throttle_events"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_exception_in_slot_counts_as_connection_error(self):
+        throttle = Throttle(rate=0, max_concurrency=8)
+        with self.assertRaises(ConnectionError):
+            with throttle.slot():
+                raise ConnectionError()
+        self.assertEqual(throttle.stats()["concurrency_limit"], 4)
+        self.assertEqual(throttle.stats()["in_flight"], 0)
+
+    def test_window_bounds_concurrent_threads(self):
+        throttle = Throttle(rate=0, max_concurrency=3)
+        peak, lock, release = [0], threading.Lock(), threading.Event()
+
+        def request():
+            with throttle.slot() as slot:
+                with lock:
+                    peak[0] = max(peak[0], throttle.controller.in_flight)
+                release.wait(1)
+                slot.record(200)
+
+        threads = [threading.Thread(target=request) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 3)
+        self.assertEqual(throttle.stats()["in_flight"], 0)
+
+
+class AsyncThrottleTest(unittest.IsolatedAsyncioTestCase):
+    async def hold_slot(self, throttle, started=None):
+        async with throttle.slot() as slot:
+            if started is not None:
+                started.set()
+            await asyncio.sleep(10)
+            slot.record(200)
+
+    async def test_cancelled_while_waiting_for_token_releases_slot(self):
+        throttle = AsyncThrottle(rate=2, burst=1, max_concurrency=4)
+        # the first takes the only token, the others wait for theirs inside the window
+        tasks = [asyncio.create_task(self.hold_slot(throttle)) for _ in range(4)]
+        await asyncio.sleep(0.05)
+        self.assertEqual(throttle.stats()["in_flight"], 4)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        stats = throttle.stats()
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertEqual(stats["throttle_events"], 0)
+        self.assertEqual(stats["concurrency_limit"], 4)
+        self.assertEqual(stats["rate"], 2)
+
+        async def request():
+            async with throttle.slot() as slot:
+                slot.record(200)
+
+        await asyncio.wait_for(request(), timeout=2)
+
+    async def test_cancelled_while_waiting_for_window_releases_nothing(self):
+        throttle = AsyncThrottle(rate=0, max_concurrency=1)
+        started = asyncio.Event()
+        holder = asyncio.create_task(self.hold_slot(throttle, started))
+        await started.wait()
+        waiter = asyncio.create_task(self.hold_slot(throttle))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        holder.cancel()
+        await asyncio.gather(holder, waiter, return_exceptions=True)
+        self.assertEqual(throttle.stats()["in_flight"], 0)
+        self.assertEqual(throttle.stats()["throttle_events"], 0)
+
+    async def test_cancelled_request_is_not_a_connection_error(self):
+        throttle = AsyncThrottle(rate=0, max_concurrency=4)
+        started = asyncio.Event()
+        task = asyncio.create_task(self.hold_slot(throttle, started))
+        await started.wait()
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        stats = throttle.stats()
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertEqual(stats["concurrency_limit"], 4)
+        self.assertEqual(stats["throttle_events"], 0)
+
+    async def test_failed_request_still_halves_window(self):
+        throttle = AsyncThrottle(rate=0, max_concurrency=4)
+        with self.assertRaises(ConnectionError):
+            async with throttle.slot():
+                raise ConnectionError()
+        self.assertEqual(throttle.stats()["concurrency_limit"], 2)
+        self.assertEqual(throttle.stats()["in_flight"], 0)
+
+
+class ListedTest(unittest.TestCase):
+    def test_listed(self):
+        self.assertEqual(listed([1, 2]), [1, 2])
+        self.assertEqual(listed({"list": [1]}), [1])
+        self.assertEqual(listed({"list": None}), [])
+        self.assertEqual(listed(None), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# the script reads its admin token on import
+os.environ.setdefault("BORDER0_ADMIN_TOKEN", "test-token")
+import playground_connector_with_sockets as playground
+
+SSH = {"name": "web-ssh", "type": "ssh", "upstream_configuration": {"hostname": "10.0.0.1", "port": 22}}
+DB = {"name": "web-db", "type": "database", "upstream_configuration": {"hostname": "10.0.0.2", "port": 5432}}
+
+
+def existing_socket(connector_name, socket, socket_id):
+    # as the API lists it: with the tags sent, but not necessarily the configuration
+    return dict(playground.desired_socket(connector_name, socket), socket_id=socket_id, upstream_configuration={})
+
+
+class PlanReconcileTest(unittest.TestCase):
+    def plan(self, connectors, existing_connectors, existing_sockets):
+        actions = playground.plan_reconcile(connectors, existing_connectors, existing_sockets)
+        return [(action["action"], playground.action_name(action)) for action in actions]
+
+    def test_missing_connector_is_created_with_its_sockets(self):
+        actions = playground.plan_reconcile([{"name": "web", "sockets": [SSH, DB]}], {}, {})
+        self.assertEqual(len(actions), 1)
+        self.assertEqual(actions[0]["action"], "create_connector")
+        self.assertEqual([socket["name"] for socket in actions[0]["sockets"]], ["web-ssh", "web-db"])
+
+    def test_unchanged_sockets_need_no_action(self):
+        existing = {"web-ssh": existing_socket("web", SSH, "s1"), "web-db": existing_socket("web", DB, "s2")}
+        plan = self.plan([{"name": "web", "sockets": [SSH, DB]}], {"web": {"connector_id": "c1"}}, existing)
+        self.assertEqual(plan, [])
+
+    def test_create_update_and_delete(self):
+        changed_db = dict(DB, upstream_configuration={"hostname": "10.0.0.3", "port": 5432})
+        existing = {
+            "web-db": existing_socket("web", DB, "s2"),
+            "web-old": existing_socket("web", {"name": "web-old", "type": "http"}, "s3"),
+            # tagged for a connector that isn't in the manifest: left alone
+            "other-ssh": existing_socket("other", {"name": "other-ssh", "type": "ssh"}, "s4"),
+        }
+        plan = self.plan([{"name": "web", "sockets": [SSH, changed_db]}], {"web": {"connector_id": "c1"}}, existing)
+        self.assertEqual(sorted(plan), [("create_socket", "web-ssh"), ("delete_socket", "web-old"),
+                                        ("update_socket", "web-db")])
+
+    def test_config_hash_covers_type_configuration_and_tags(self):
+        tags = playground.desired_socket("web", SSH)["tags"]
+        self.assertEqual(tags["origin"], "python3")
+        self.assertEqual(tags["connector"], "web")
+        self.assertEqual(playground.desired_socket("web", SSH)["tags"], tags)
+        for changed in (dict(SSH, type="http"), dict(SSH, upstream_configuration={"hostname": "x"}),
+                        dict(SSH, tags={"team": "ops"})):
+            self.assertNotEqual(playground.desired_socket("web", changed)["tags"]["config_hash"], tags["config_hash"])
+
+
+class ListAllTest(unittest.TestCase):
+    def test_pages_until_a_short_page(self):
+        items = [{"name": f"s{i}"} for i in range(5)]
+
+        def api_request(method, path, data=None):
+            page = int(path.split("page=")[1].split("&")[0])
+            return {"list": items[(page - 1) * 2:page * 2]}
+
+        with mock.patch.object(playground, "api_request", side_effect=api_request) as request:
+            self.assertEqual(playground.list_all("sockets", page_size=2), items)
+        self.assertEqual(request.call_count, 3)
+
+    def test_endpoint_without_paging(self):
+        items = [{"name": "a"}, {"name": "b"}]
+        with mock.patch.object(playground, "api_request", return_value=items) as request:
+            self.assertEqual(playground.list_all("sockets", page_size=2), items)
+        self.assertEqual(request.call_count, 2)
+
+    def test_not_found_past_the_last_page(self):
+        def api_request(method, path, data=None):
+            if "page=1&" in path:
+                return [{"name": "a"}, {"name": "b"}]
+            raise playground.APIError(404, "not found")
+
+        with mock.patch.object(playground, "api_request", side_effect=api_request):
+            self.assertEqual(len(playground.list_all("sockets", page_size=2)), 2)
+
+
+class LoadManifestTest(unittest.TestCase):
+    def load(self, text, suffix=".json"):
+        path = os.path.join(self.directory, f"manifest{suffix}")
+        with open(path, "w") as f:
+            f.write(text)
+        return playground.load_manifest(path)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_empty_sockets(self):
+        self.assertEqual(self.load('{"connectors": [{"name": "web", "sockets": null}]}')[0]["sockets"], [])
+
+    def test_invalid_manifests(self):
+        for text in ('{"connectors": [1]}', '{"connectors": [{"name": "web", "sockets": [1]}]}',
+                     '{"connectors": [{"name": "web"}, {"name": "web"}]}', "not json"):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                self.load(text)
+
+    @unittest.skipIf(playground.yaml is None, "YAML manifests need PyYAML")
+    def test_invalid_yaml(self):
+        with self.assertRaises(ValueError):
+            self.load("connectors: [a: b: c", suffix=".yaml")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import service_accounts
+
+
+class FakeClient:
+    def __init__(self, tokens):
+        self.tokens = {name: list(account_tokens) for name, account_tokens in tokens.items()}
+        self.deleted = []
+
+    def list_tokens(self, service_account_name):
+        return {"list": list(self.tokens[service_account_name])}
+
+    def create_token(self, service_account_name, token_name, expires_at=0):
+        token = {"id": f"id-{token_name}", "name": token_name}
+        self.tokens[service_account_name].append(token)
+        return token
+
+    def delete_token(self, service_account_name, token_id):
+        self.deleted.append(token_id)
+        self.tokens[service_account_name] = [t for t in self.tokens[service_account_name] if t["id"] != token_id]
+        return True
+
+
+def rotate(client, account, rotation_id="20260201", keep_old=False):
+    result = {"changes": [], "skipped": []}
+    options = argparse.Namespace(rotation_id=rotation_id, keep_old=keep_old)
+    service_accounts.batch_rotate(client, account, {account["name"]}, options, result)
+    return result
+
+
+class BatchRotateTest(unittest.TestCase):
+    def test_deletes_only_earlier_rotations(self):
+        client = FakeClient({"ci": [
+            {"id": "1", "name": "ci-rot-20260101"},
+            {"id": "2", "name": "ci-deploy"},
+            {"id": "3", "name": "ci-20260101"},
+            {"id": "4", "name": None},
+        ]})
+        result = rotate(client, {"name": "ci"})
+        self.assertEqual(result["token"]["name"], "ci-rot-20260201")
+        self.assertEqual(client.deleted, ["1"])
+
+    def test_token_name_sets_the_prefix(self):
+        client = FakeClient({"ci": [{"id": "1", "name": "ci-rot-20260101"}, {"id": "2", "name": "app-rot-20260101"}]})
+        rotate(client, {"name": "ci", "token_name": "app"})
+        self.assertEqual(client.deleted, ["2"])
+
+    def test_same_rotation_again_changes_nothing(self):
+        client = FakeClient({"ci": [{"id": "1", "name": "ci-rot-20260201"}]})
+        result = rotate(client, {"name": "ci"})
+        self.assertEqual(result["changes"], [])
+        self.assertEqual(result["skipped"], ["token ci-rot-20260201 exists"])
+
+    def test_keep_old(self):
+        client = FakeClient({"ci": [{"id": "1", "name": "ci-rot-20260101"}]})
+        rotate(client, {"name": "ci"}, keep_old=True)
+        self.assertEqual(client.deleted, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,44 +1,372 @@
 from flask import Flask, request, jsonify, abort, make_response
-from datetime import datetime
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache, wraps
 from retrying import retry
+import atexit
 import os
 import random
 import logging
+import sys
+import threading
+import time
 import pytz
 import requests
+import geoip
+import json
+import metrics
 
 # default to 'superSecret' if not set
 API_SECRET = os.environ.get('API_SECRET', 'superSecret')  
 WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY', '')  
 
+# timezone lookups: how many IPs to remember, for how long, and how long to remember a failed lookup
+TZCACHE_MAXSIZE = int(os.environ.get('TZCACHE_MAXSIZE', '100000'))
+TZCACHE_TTL = float(os.environ.get('TZCACHE_TTL', '86400'))
+TZCACHE_NEGATIVE_TTL = float(os.environ.get('TZCACHE_NEGATIVE_TTL', '60'))
+# upstream APIs, e.g. pointed at the stubs of benchmark.py
+IPAPI_URL = os.environ.get('IPAPI_URL', 'http://ip-api.com/json/{ip}')
+WEATHER_API_URL = os.environ.get('WEATHER_API_URL', 'https://api.weatherapi.com/v1/current.json')
+UPSTREAM_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', '5'))
+# weather lookups: entries are fresh for WEATHER_CACHE_TTL seconds, and are served for another
+# WEATHER_CACHE_STALE_TTL seconds while they are refreshed in the background
+WEATHER_CACHE_MAXSIZE = int(os.environ.get('WEATHER_CACHE_MAXSIZE', '10000'))
+WEATHER_CACHE_TTL = float(os.environ.get('WEATHER_CACHE_TTL', '600'))
+WEATHER_CACHE_STALE_TTL = float(os.environ.get('WEATHER_CACHE_STALE_TTL', '3600'))
+WEATHER_CACHE_NEGATIVE_TTL = float(os.environ.get('WEATHER_CACHE_NEGATIVE_TTL', '30'))
+# clock based decisions (fridayrule, businesshours) per timezone, kept until the next day or hour starts there
+DECISION_CACHE_MAXSIZE = int(os.environ.get('DECISION_CACHE_MAXSIZE', '10000'))
+# batch evaluation: most items per request, and how many lookups of a batch run in parallel
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '1000'))
+BATCH_LOOKUP_WORKERS = int(os.environ.get('BATCH_LOOKUP_WORKERS', '16'))
+# optional local geolocation database (CSV range file, its .idx, or a MaxMind .mmdb), see geoip.py
+GEOIP_DATABASE = os.environ.get('GEOIP_DATABASE', '')
+# set to 'false' to never call ip-api.com, e.g. when running offline
+GEOIP_HTTP_FALLBACK = os.environ.get('GEOIP_HTTP_FALLBACK', 'true').lower() != 'false'
+# optional snapshot of the timezone and weather caches, saved every CACHE_SNAPSHOT_INTERVAL seconds
+# and on shutdown, and loaded at startup so a restart doesn't begin with empty caches
+CACHE_SNAPSHOT_PATH = os.environ.get('CACHE_SNAPSHOT_PATH', '')
+CACHE_SNAPSHOT_INTERVAL = float(os.environ.get('CACHE_SNAPSHOT_INTERVAL', '300'))
+# optional file of known client IPs, one per line, resolved at startup before /ready says so
+WARMUP_IPS = os.environ.get('WARMUP_IPS', '')
+# upstream lookups per second of the warm-up, per worker process, so it doesn't trip ip-api.com's rate limit
+WARMUP_RATE = float(os.environ.get('WARMUP_RATE', '5'))
+WARMUP_WORKERS = 4
 
-tzcache = {}
+
+class LookupFailed(Exception):
+  """ An upstream lookup failed, or failed recently and the failure is still cached """
+  pass
+
+
+class TTLCache(object):
+  """
+  Thread safe LRU cache of at most `maxsize` entries that expire `ttl` seconds after they are set.
+  Failures can be cached too, with set_failure(), for a shorter `negative_ttl`.
+  With a `stale_ttl`, expired values are kept that much longer for get_or_stale().
+  """
+
+  def __init__(self, maxsize, ttl, negative_ttl, stale_ttl=0):
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self.negative_ttl = negative_ttl
+    self.stale_ttl = stale_ttl
+    self.data = OrderedDict()
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.stale_hits = 0
+    self.misses = 0
+    self.negative_hits = 0
+    self.evictions = 0
+    self.expirations = 0
+
+  def get(self, key):
+    """ Return the cached value, raise LookupFailed for a cached failure, or return None on a miss """
+    value, stale = self._lookup(key, allow_stale=False)
+    return value
+
+  def get_or_stale(self, key):
+    """ Like get(), but returns (value, stale), where stale values are past their ttl but not their stale_ttl """
+    return self._lookup(key, allow_stale=True)
+
+  def peek(self, key):
+    """ Like get(), but not counted as a hit or miss, for re-checking a key whose lookup was already counted """
+    with self.lock:
+      entry = self.data.get(key)
+    if entry is None:
+      return None
+    expires_at, value, failed = entry
+    if expires_at <= time.monotonic():
+      return None
+    if failed:
+      raise LookupFailed(value)
+    return value
+
+  def _lookup(self, key, allow_stale):
+    with self.lock:
+      entry = self.data.get(key)
+      if entry is None:
+        self.misses += 1
+        return None, False
+      expires_at, value, failed = entry
+      now = time.monotonic()
+      stale = expires_at <= now
+      if stale and (failed or now >= expires_at + self.stale_ttl):
+        del self.data[key]
+        self.expirations += 1
+      if stale and (failed or not allow_stale or key not in self.data):
+        self.misses += 1
+        return None, False
+      self.data.move_to_end(key)
+      if failed:
+        self.negative_hits += 1
+      elif stale:
+        self.stale_hits += 1
+      else:
+        self.hits += 1
+    if failed:
+      raise LookupFailed(value)
+    return value, stale
+
+  def _store(self, key, value, failed, ttl):
+    with self.lock:
+      self.data[key] = (time.monotonic() + ttl, value, failed)
+      self.data.move_to_end(key)
+      while len(self.data) > self.maxsize:
+        self.data.popitem(last=False)
+        self.evictions += 1
+
+  def set(self, key, value, ttl=None):
+    self._store(key, value, False, self.ttl if ttl is None else ttl)
+
+  def set_failure(self, key, error):
+    self._store(key, str(error), True, self.negative_ttl)
+
+  def dump(self):
+    """ Usable (fresh or stale) entries as [key, value, seconds until expiry], least recently used first """
+    with self.lock:
+      now = time.monotonic()
+      return [[key, value, expires_at - now] for key, (expires_at, value, failed) in self.data.items()
+              if not failed and now < expires_at + self.stale_ttl]
+
+  def load(self, entries, age=0):
+    """ Restore entries from a dump() taken `age` seconds ago, returns how many were still usable """
+    loaded = 0
+    for key, value, ttl in entries:
+      ttl -= age
+      if ttl + self.stale_ttl > 0:
+        self._store(key, value, False, ttl)
+        loaded += 1
+    return loaded
+
+  def __len__(self):
+    return len(self.data)
+
+  def stats(self):
+    with self.lock:
+      return {
+        'size': len(self.data),
+        'maxsize': self.maxsize,
+        'hits': self.hits,
+        'stale_hits': self.stale_hits,
+        'misses': self.misses,
+        'negative_hits': self.negative_hits,
+        'evictions': self.evictions,
+        'expirations': self.expirations,
+      }
+
+
+class SingleFlight(object):
+  """
+  Coalesces concurrent calls for the same key: the first caller runs the function, everyone
+  arriving while it is in flight waits for and shares its result (or exception).
+  """
+
+  class Call(object):
+    def __init__(self):
+      self.done = threading.Event()
+      self.result = None
+      self.error = None
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.calls = {}
+    self.executed = 0
+    self.coalesced = 0
+
+  def do(self, key, fn, *args):
+    with self.lock:
+      call = self.calls.get(key)
+      leader = call is None
+      if leader:
+        call = self.calls[key] = SingleFlight.Call()
+        self.executed += 1
+      else:
+        self.coalesced += 1
+
+    if not leader:
+      call.done.wait()
+      if call.error is not None:
+        raise call.error
+      return call.result
+
+    try:
+      call.result = fn(*args)
+      return call.result
+    except Exception as e:
+      call.error = e
+      raise
+    finally:
+      with self.lock:
+        del self.calls[key]
+      call.done.set()
+
+  def stats(self):
+    with self.lock:
+      return {'executed': self.executed, 'coalesced': self.coalesced, 'in_flight': len(self.calls)}
+
+
+class UpstreamStats(object):
+  """ Call and error counters for an upstream API, with the call rate over the last minute """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.calls = 0
+    self.errors = 0
+    self.recent_calls = deque()
+
+  def record(self, error=False):
+    now = time.monotonic()
+    with self.lock:
+      self.calls += 1
+      if error:
+        self.errors += 1
+      self.recent_calls.append(now)
+      self._trim(now)
+
+  def _trim(self, now):
+    while self.recent_calls and self.recent_calls[0] <= now - 60:
+      self.recent_calls.popleft()
+
+  def stats(self):
+    with self.lock:
+      self._trim(time.monotonic())
+      return {'calls': self.calls, 'errors': self.errors, 'calls_last_minute': len(self.recent_calls)}
+
+
+geoip_db = geoip.open_database(GEOIP_DATABASE) if GEOIP_DATABASE else None
+tzcache = TTLCache(TZCACHE_MAXSIZE, TZCACHE_TTL, TZCACHE_NEGATIVE_TTL)
+decisioncache = TTLCache(DECISION_CACHE_MAXSIZE, 86400, 0)
+weathercache = TTLCache(WEATHER_CACHE_MAXSIZE, WEATHER_CACHE_TTL, WEATHER_CACHE_NEGATIVE_TTL, WEATHER_CACHE_STALE_TTL)
+ipapi_stats = UpstreamStats()
+weatherapi_stats = UpstreamStats()
+# refreshes stale weather entries off the request path
+weather_refresher = ThreadPoolExecutor(max_workers=4, thread_name_prefix='weather-refresh')
+weather_refreshing = set()
+weather_refreshing_lock = threading.Lock()
+batch_lookups = ThreadPoolExecutor(max_workers=BATCH_LOOKUP_WORKERS, thread_name_prefix='batch-lookup')
+# concurrent misses for the same IP or weather location share one upstream request
+tz_lookups = SingleFlight()
+weather_lookups = SingleFlight()
 app = Flask(__name__)
 
+
+"""
+Prometheus metrics, served on /metrics (see metrics.py). Policy requests are timed as a whole and
+per phase: the timezone lookup, the weather lookup and the decision itself. Cache, upstream and
+coalesced lookup counters are read from the objects above whenever /metrics is scraped.
+"""
+
+REQUEST_LATENCY = metrics.Histogram('policy_request_duration_seconds', "Time to answer a policy request", ['policy'])
+PHASE_LATENCY = metrics.Histogram('policy_phase_duration_seconds',
+                                  "Time spent per phase (timezone, weather, decision) of a policy request",
+                                  ['policy', 'phase'])
+REQUESTS_IN_FLIGHT = metrics.Gauge('policy_requests_in_flight', "Policy requests being answered", ['policy'])
+UPSTREAM_RETRIES = metrics.Counter('upstream_retries_total', "Upstream requests retried after a network error",
+                                   ['upstream'])
+
+caches = {'timezone': tzcache, 'weather': weathercache, 'decision': decisioncache}
+upstreams = {'ip-api': ipapi_stats, 'weatherapi': weatherapi_stats}
+# asgi.py swaps in its own coalescing lookups
+lookups = {'timezone': tz_lookups, 'weather': weather_lookups}
+
+
+def cache_lookup_samples():
+  for name, cache in caches.items():
+    stats = cache.stats()
+    for result, counter in (('hit', 'hits'), ('stale_hit', 'stale_hits'), ('negative_hit', 'negative_hits'),
+                            ('miss', 'misses')):
+      yield (name, result), stats[counter]
+
+
+def cache_hit_ratio_samples():
+  for name, cache in caches.items():
+    stats = cache.stats()
+    hits = stats['hits'] + stats['stale_hits'] + stats['negative_hits']
+    lookups_total = hits + stats['misses']
+    yield (name,), hits / lookups_total if lookups_total else 0.0
+
+
+def upstream_outcomes(upstream):
+  stats = upstream.stats()
+  return [('success', stats['calls'] - stats['errors']), ('error', stats['errors'])]
+
+
+metrics.Collected('cache_lookups_total', "Cache lookups by result", 'counter', ['cache', 'result'],
+                  cache_lookup_samples)
+metrics.Collected('cache_hit_ratio', "Share of cache lookups answered from the cache, stale and failed entries included",
+                  'gauge', ['cache'], cache_hit_ratio_samples)
+metrics.Collected('cache_entries', "Entries in the cache", 'gauge', ['cache'],
+                  lambda: [((name,), len(cache)) for name, cache in caches.items()])
+metrics.Collected('cache_evictions_total', "Entries evicted to keep the cache under its maximum size", 'counter',
+                  ['cache'], lambda: [((name,), cache.stats()['evictions']) for name, cache in caches.items()])
+metrics.Collected('upstream_requests_total', "Requests sent to the upstream APIs, by outcome", 'counter',
+                  ['upstream', 'outcome'],
+                  lambda: [((name, outcome), value) for name, stats in upstreams.items()
+                           for outcome, value in upstream_outcomes(stats)])
+metrics.Collected('lookups_in_flight', "Upstream lookups waiting for an answer", 'gauge', ['lookup'],
+                  lambda: [((name,), flight.stats()['in_flight']) for name, flight in lookups.items()])
+metrics.Collected('lookups_coalesced_total', "Lookups that shared a request already in flight for the same key",
+                  'counter', ['lookup'],
+                  lambda: [((name,), flight.stats()['coalesced']) for name, flight in lookups.items()])
+
+
+def instrumented(policy):
+  """ Time a Flask view and count it as in flight while it runs """
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      with REQUESTS_IN_FLIGHT.track(policy), REQUEST_LATENCY.time(policy):
+        return view(*args, **kwargs)
+    return wrapper
+  return decorator
+
+
+
 @app.route('/fridayrule', methods=['POST'])
+@instrumented('fridayrule')
 def friday_rule_policy():
   auth_request()
-  current_day = None
   try:
     data = request.json
     ip = data['ip']
     
 
-    tz_info = get_timezone(ip)
-    current_day = datetime.now(pytz.timezone(tz_info['timezone'])).weekday()
-    app.logger.info(f"Current day: {current_day}")
+    with PHASE_LATENCY.time('fridayrule', 'timezone'):
+      tz_info = get_timezone(ip)
+    with PHASE_LATENCY.time('fridayrule', 'decision'):
+      decision = clock_decision('fridayrule', tz_info)
   except Exception as e:
     app.logger.error(f"Error occurred: {str(e)}")
     return jsonify({'error': str(e)}), 400
 
-  if current_day == 4:  # 0 is Monday, 4 is Friday  
-    return jsonify({"current_day": current_day}), 401
-  else:
-    return jsonify({"current_day": current_day}), 200
+  return app.response_class(decision.json_body, status=decision.status, mimetype='application/json')
 
 
 
 @app.route('/random', methods=['POST'])
+@instrumented('random')
 def evaluate():
   # Check for Authorization header
 
@@ -61,37 +389,22 @@ def evaluate():
   # Log details of the request, easy for debugging
   #app.logger.info(f"Received data from {get_remote_ip(request)}: {data}")
 
-  # Ok, Now we have the data, and we can make our own Policy decision!
-
-  # These are just placeholders, replace these checks with your own validation logic
-
-  # Let's not allowd HTTP services for example
-  if protocol == "http":
-    return jsonify({"confidence_score": 0}), 401
-
-  # For the remaining checks, we will just generate a random confidence score
-  # This is just a placeholder, replace it with your own logic
-  score = random.randint(60, 100)
-  app.logger.info(f"random number is : {score}")
-
-  # Return the confidence score (optional)
-  # And a 200 status code (OK) (you could use just status code for example)
-  return jsonify({"confidence_score": score}), 200
+  with PHASE_LATENCY.time('random', 'decision'):
+    body, status = random_decision(protocol)
+  return jsonify(body), status
 
 
 @app.route('/rainorshine', methods=['POST'])
+@instrumented('rainorshine')
 def rain_or_shine_policy():
   auth_request()
-  is_raining = False
 
   try:
     data = request.json
     
     ip = data['ip']
-    tz_info = get_timezone(ip)
-
-    # Get the location of the user based on the IP address
-    location = tz_info['city'] + ',' + tz_info['countryCode']
+    with PHASE_LATENCY.time('rainorshine', 'timezone'):
+      tz_info = get_timezone(ip)
 
     # WeatherAPI Key
     #https://www.weatherapi.com/my/ 
@@ -100,56 +413,262 @@ def rain_or_shine_policy():
         return jsonify({'error': "WEATHER_API_KEY not set, create one here https://www.weatherapi.com/my/"}), 400
 
 
-    # WeatherAPI endpoint
-    weather_url = f"https://api.weatherapi.com/v1/current.json?key={WEATHER_API_KEY }&q={location}"
-
     # Fetching the weather data
-    weather_data = requests.get(weather_url).json()
-
-    # Get the current condition of the weather
-    current_weather = weather_data['current']['condition']['text'].lower()
-
-    if "rain" in current_weather:
-      is_raining = True
+    with PHASE_LATENCY.time('rainorshine', 'weather'):
+      weather_data = get_weather(weather_location(tz_info))
+    with PHASE_LATENCY.time('rainorshine', 'decision'):
+      body, status = rain_or_shine_decision(weather_data)
   except Exception as e:
     app.logger.error(f"Error occurred: {str(e)}")
     return jsonify({'error': str(e)}), 400
 
-  return jsonify({"is_raining": is_raining}), 200
+  return jsonify(body), status
 
 
 @app.route('/businesshours', methods=['POST'])
+@instrumented('businesshours')
 def business_hours_policy():
   auth_request()
-  current_hour = None
-  current_day = None
   try:
     data = request.json
 
     ip = data['ip']
-    tz_info = get_timezone(ip)
-    current_time = datetime.now(pytz.timezone(tz_info['timezone']))
-    current_day = datetime.now(pytz.timezone(tz_info['timezone'])).weekday()
-    current_hour = int(current_time.hour)
-
-    """
-    Enable this to validate server side. 
-    With this disabled, you'll need to do repsonse validation in the border0 config.
-    This can be done using the following Body repsonse expression:
-    hour_of_day >= 9 and .hour_of_day < 18 and .current_day < 6
-    Which will check if the local's user time is after 9am, but before 6pm.
-    It will also check if the current day is either mon(0), Tue(1), wed(2), Thu(4) or friday(5)
-    
-    # Return 401 if it's not monday-Friday or locally it's not between 9 and 18
-    if current_day not in [0,1,2,3,4,5] or current_hour < 9 or current_hour > 17:
-      return jsonify({"hour_of_day": current_hour, "current_day": current_day, "error": "denied not in business hours"}), 401
-    """
-  
+    with PHASE_LATENCY.time('businesshours', 'timezone'):
+      tz_info = get_timezone(ip)
+    with PHASE_LATENCY.time('businesshours', 'decision'):
+      decision = clock_decision('businesshours', tz_info)
   except Exception as e:
     app.logger.error(f"Error occurred: {str(e)}")
     return jsonify({'error2': str(e)}), 400
   
-  return jsonify({"hour_of_day": current_hour, "current_day": current_day }), 200
+  return app.response_class(decision.json_body, status=decision.status, mimetype='application/json')
+
+
+@app.route('/batch', methods=['POST'])
+@instrumented('batch')
+def batch_policy():
+  auth_request()
+  try:
+    items, policies = parse_batch(request.json)
+  except Exception as e:
+    app.logger.error(f"Error occurred: {str(e)}")
+    return jsonify({'error': str(e)}), 400
+
+  # every IP and location is resolved once, however many items share it
+  with PHASE_LATENCY.time('batch', 'timezone'):
+    timezones = resolve_all(get_timezone, batch_ips(items, policies))
+  with PHASE_LATENCY.time('batch', 'weather'):
+    weather = resolve_all(get_weather, batch_locations(policies, timezones))
+  with PHASE_LATENCY.time('batch', 'decision'):
+    results = [batch_decisions(item, policies, timezones, weather) for item in items]
+  return jsonify({'results': results}), 200
+
+
+def resolve_all(lookup, keys, executor=batch_lookups):
+  """ Look up all keys in parallel, returning {key: result or the exception it raised} """
+  futures = {key: executor.submit(lookup, key) for key in keys}
+  results = {}
+  for key, future in futures.items():
+    try:
+      results[key] = future.result()
+    except Exception as e:
+      results[key] = e
+  return results
+
+
+"""
+The policy decisions themselves. They only take lookups that were already resolved and return
+a (body, status) tuple, so the Flask routes above and the async handlers in asgi.py share them.
+"""
+
+def friday_rule_decision(tz_info):
+  decision = clock_decision('fridayrule', tz_info)
+  return decision.body, decision.status
+
+
+def friday_rule_verdict(now):
+  current_day = now.weekday()
+  app.logger.info(f"Current day: {current_day}")
+
+  if current_day == 4:  # 0 is Monday, 4 is Friday  
+    return {"current_day": current_day}, 401
+  else:
+    return {"current_day": current_day}, 200
+
+
+def random_decision(protocol):
+  # Ok, Now we have the data, and we can make our own Policy decision!
+
+  # These are just placeholders, replace these checks with your own validation logic
+
+  # Let's not allowd HTTP services for example
+  if protocol == "http":
+    return {"confidence_score": 0}, 401
+
+  # For the remaining checks, we will just generate a random confidence score
+  # This is just a placeholder, replace it with your own logic
+  score = random.randint(60, 100)
+  app.logger.info(f"random number is : {score}")
+
+  # Return the confidence score (optional)
+  # And a 200 status code (OK) (you could use just status code for example)
+  return {"confidence_score": score}, 200
+
+
+def weather_location(tz_info):
+  # Get the location of the user based on the IP address
+  return tz_info['city'] + ',' + tz_info['countryCode']
+
+
+def rain_or_shine_decision(weather_data):
+  # Get the current condition of the weather
+  current_weather = weather_data['current']['condition']['text'].lower()
+  return {"is_raining": "rain" in current_weather}, 200
+
+
+def business_hours_decision(tz_info):
+  decision = clock_decision('businesshours', tz_info)
+  return decision.body, decision.status
+
+
+def business_hours_verdict(current_time):
+  current_day = current_time.weekday()
+  current_hour = int(current_time.hour)
+
+  """
+  Enable this to validate server side. 
+  With this disabled, you'll need to do repsonse validation in the border0 config.
+  This can be done using the following Body repsonse expression:
+  hour_of_day >= 9 and .hour_of_day < 18 and .current_day < 6
+  Which will check if the local's user time is after 9am, but before 6pm.
+  It will also check if the current day is either mon(0), Tue(1), wed(2), Thu(4) or friday(5)
+  
+  # Return 401 if it's not monday-Friday or locally it's not between 9 and 18
+  if current_day not in [0,1,2,3,4,5] or current_hour < 9 or current_hour > 17:
+    return {"hour_of_day": current_hour, "current_day": current_day, "error": "denied not in business hours"}, 401
+  """
+
+  return {"hour_of_day": current_hour, "current_day": current_day }, 200
+
+
+"""
+fridayrule and businesshours only depend on the local time at the user's IP, so their responses
+don't change until the next day or hour starts in that timezone. They are cached per timezone
+(users and protocols don't change the verdict) together with the encoded JSON body, so a repeat
+check does no lookups, date math or serialization at all.
+"""
+
+Decision = namedtuple('Decision', ['body', 'status', 'json_body'])
+
+# policy -> (verdict function taking the local time, when its verdict can change)
+CLOCK_POLICIES = {
+  'fridayrule': (friday_rule_verdict, 'day'),
+  'businesshours': (business_hours_verdict, 'hour'),
+}
+
+
+@lru_cache(maxsize=1024)
+def get_tzinfo(name):
+  return pytz.timezone(name)
+
+
+def clock_decision(policy, tz_info):
+  key = (policy, tz_info['timezone'])
+  decision = decisioncache.get(key)
+  if decision is not None:
+    return decision
+
+  verdict, boundary = CLOCK_POLICIES[policy]
+  tz = get_tzinfo(tz_info['timezone'])
+  now = datetime.now(tz)
+  body, status = verdict(now)
+  decision = Decision(body, status, json.dumps(body))
+  decisioncache.set(key, decision, ttl=seconds_until(boundary, tz, now))
+  return decision
+
+
+def seconds_until(boundary, tz, now):
+  """ Seconds from `now` until the next local hour or day starts in `tz` """
+  if boundary == 'hour':
+    return 3600 - (now.minute * 60 + now.second + now.microsecond / 1e6)
+  # localize midnight itself, the day may be shorter or longer than 24 hours around DST changes
+  midnight = tz.localize(datetime.combine(now.date() + timedelta(days=1), datetime.min.time()))
+  return (midnight - now).total_seconds()
+
+
+"""
+Batch evaluation, shared with asgi.py. A batch is a JSON object like
+  {"requests": [{"ip": ..., "user": ..., "protocol": ...}, ...], "policies": ["fridayrule", ...]}
+where "policies" is optional and defaults to all of them. Every item gets the same body and
+status from each policy as the single endpoints would return, as {"policy": {"status": ..., "body": ...}}.
+"""
+
+BATCH_POLICIES = ('fridayrule', 'random', 'rainorshine', 'businesshours')
+# policies that need the timezone of the item's IP
+TIMEZONE_POLICIES = ('fridayrule', 'rainorshine', 'businesshours')
+
+
+def parse_batch(data):
+  if not isinstance(data, dict) or not isinstance(data.get('requests'), list):
+    raise ValueError("expected a JSON object with a 'requests' list")
+  items = data['requests']
+  if len(items) > BATCH_MAX_ITEMS:
+    raise ValueError(f"at most {BATCH_MAX_ITEMS} requests per batch")
+  if not all(isinstance(item, dict) for item in items):
+    raise ValueError("every request must be a JSON object")
+
+  policies = data.get('policies') or list(BATCH_POLICIES)
+  if not isinstance(policies, list):
+    raise ValueError("'policies' must be a list")
+  unknown = [policy for policy in policies if policy not in BATCH_POLICIES]
+  if unknown:
+    raise ValueError(f"unknown policies: {', '.join(map(str, unknown))}")
+  return items, policies
+
+
+def batch_ips(items, policies):
+  if not any(policy in TIMEZONE_POLICIES for policy in policies):
+    return set()
+  return {item['ip'] for item in items if isinstance(item.get('ip'), str)}
+
+
+def batch_locations(policies, timezones):
+  if 'rainorshine' not in policies or WEATHER_API_KEY == '':
+    return set()
+  return {weather_location(tz_info) for tz_info in timezones.values() if not isinstance(tz_info, Exception)}
+
+
+def batch_decisions(item, policies, timezones, weather):
+  decisions = {}
+  for policy in policies:
+    try:
+      body, status = batch_decision(policy, item, timezones, weather)
+    except Exception as e:
+      # same error bodies as the single endpoints
+      body, status = {'error2' if policy == 'businesshours' else 'error': str(e)}, 400
+    decisions[policy] = {'status': status, 'body': body}
+  return {'decisions': decisions}
+
+
+def batch_decision(policy, item, timezones, weather):
+  if policy == 'random':
+    return random_decision(item['protocol'])
+
+  tz_info = resolved(timezones, item['ip'])
+  if policy == 'fridayrule':
+    return friday_rule_decision(tz_info)
+  if policy == 'businesshours':
+    return business_hours_decision(tz_info)
+  if WEATHER_API_KEY == '':
+    return {'error': "WEATHER_API_KEY not set, create one here https://www.weatherapi.com/my/"}, 400
+  return rain_or_shine_decision(resolved(weather, weather_location(tz_info)))
+
+
+def resolved(results, key):
+  result = results[key]
+  if isinstance(result, Exception):
+    raise result
+  return result
 
 
 
@@ -165,18 +684,319 @@ def auth_request():
     abort(response)
 
 
-@retry(stop_max_attempt_number=7)
+@app.route('/cachestats', methods=['GET'])
+def cache_stats():
+  auth_request()
+  return jsonify({
+    'tzcache': tzcache.stats(),
+    'weathercache': weathercache.stats(),
+    'decisioncache': decisioncache.stats(),
+    'tz_lookups': tz_lookups.stats(),
+    'weather_lookups': weather_lookups.stats(),
+    'upstream': {'ip-api': ipapi_stats.stats(), 'weatherapi': weatherapi_stats.stats()},
+  }), 200
+
+
+# not behind auth_request(), so Prometheus can scrape it; it only exposes counters and timings
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+  return app.response_class(metrics.render(), status=200, content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+  # not behind auth_request() either, for load balancer and orchestrator health checks
+  if not ready.is_set():
+    return jsonify({'ready': False}), 503
+  return jsonify({'ready': True}), 200
+
+
+def is_transient_error(exception):
+  return isinstance(exception, (requests.ConnectionError, requests.Timeout))
+
+
+def timezone_retry_wait(attempt_number, delay_since_first_attempt_ms):
+  # only called when another attempt follows: 200ms, then 400ms, at most a second
+  UPSTREAM_RETRIES.inc('ip-api')
+  return min(100 * 2 ** attempt_number, 1000)
+
+
+# only network errors are worth retrying, and only briefly since a policy check is waiting on us
+@retry(stop_max_attempt_number=3, wait_func=timezone_retry_wait, retry_on_exception=is_transient_error)
+def fetch_timezone(ip):
+  try:
+    response = requests.get(IPAPI_URL.format(ip=ip), timeout=UPSTREAM_TIMEOUT)
+    response.raise_for_status()
+    tz_info = response.json()
+  except (requests.RequestException, ValueError):
+    ipapi_stats.record(error=True)
+    raise
+  ipapi_stats.record()
+  return tz_info
+
+
 def get_timezone(ip):
+  tz_info = known_timezone(ip)
+  if tz_info is not None:
+    return tz_info
+  return tz_lookups.do(ip, resolve_timezone, ip)
+
+
+def resolve_timezone(ip):
+  # another request may have filled the cache while we were waiting to become the leader
+  tz_info = tzcache.peek(ip)
+  if tz_info is not None:
+    return tz_info
+
+  try:
+    tz_info = fetch_timezone(ip)
+  except (requests.RequestException, ValueError) as e:
+    raise timezone_lookup_failed(ip, e)
+  return cache_timezone(ip, tz_info)
+
+
+"""
+Cache handling shared with the async lookups in asgi.py, which only differ in how they reach the upstream APIs.
+"""
+
+def known_timezone(ip):
+  # a local database answers in microseconds, ip-api.com is only asked about addresses it doesn't know
+  if geoip_db is not None:
+    tz_info = geoip_db.lookup(ip)
+    if tz_info is not None:
+      return tz_info
+    if not GEOIP_HTTP_FALLBACK:
+      raise LookupFailed(f"timezone lookup for {ip} failed: not in {GEOIP_DATABASE}")
+
   # we use a little cache, to make sure we dont hit the upstream API too hard
-  global tzcache
-  
-  if ip in tzcache:
-    return tzcache[ip]
-  else:
-    tz_info = requests.get(f'http://ip-api.com/json/{ip}').json()
-    tzcache[ip] = tz_info
+  return tzcache.get(ip)
+
+
+def timezone_lookup_failed(ip, error):
+  # remember the failure for a little while, so a flapping upstream isn't hit on every request
+  error = f"timezone lookup for {ip} failed: {error}"
+  tzcache.set_failure(ip, error)
+  return LookupFailed(error)
+
+
+def cache_timezone(ip, tz_info):
+  # ip-api.com answers 200 with status 'fail' for private and reserved ranges
+  if tz_info.get('status') == 'fail':
+    raise timezone_lookup_failed(ip, tz_info.get('message', 'unknown error'))
+  tzcache.set(ip, tz_info)
+  return tz_info
+
+
+def weather_lookup_failed(location, error):
+  error = f"weather lookup for {location} failed: {error}"
+  weathercache.set_failure(location, error)
+  return LookupFailed(error)
+
+
+
+def get_weather(location):
+  # weather changes slowly: after the first lookup for a location, requests are answered from the
+  # cache, and a stale entry is refreshed in the background while it is still being served
+  weather_data, stale = weathercache.get_or_stale(location)
+  if weather_data is None:
+    return weather_lookups.do(location, resolve_weather, location)
+  if stale:
+    refresh_weather(location)
+  return weather_data
+
+
+def refresh_weather(location):
+  with weather_refreshing_lock:
+    if location in weather_refreshing:
+      return
+    weather_refreshing.add(location)
+  weather_refresher.submit(background_refresh_weather, location)
+
+
+def background_refresh_weather(location):
+  try:
+    weather_lookups.do(location, fetch_and_cache_weather, location)
+  except Exception as e:
+    # keep serving the stale entry, the next request past its ttl tries again
+    app.logger.warning(f"Refreshing weather for {location} failed: {str(e)}")
+  finally:
+    with weather_refreshing_lock:
+      weather_refreshing.discard(location)
+
+
+def resolve_weather(location):
+  # the miss was counted by get_weather(), this only checks whether another request filled the entry meanwhile
+  weather_data = weathercache.peek(location)
+  if weather_data is not None:
+    return weather_data
+  try:
+    return fetch_and_cache_weather(location)
+  except (requests.RequestException, ValueError) as e:
+    raise weather_lookup_failed(location, e)
+
+
+def fetch_and_cache_weather(location):
+  weather_data = fetch_weather(location)
+  weathercache.set(location, weather_data)
+  return weather_data
+
+
+def fetch_weather(location):
+  try:
+    response = requests.get(WEATHER_API_URL, params={'key': WEATHER_API_KEY, 'q': location}, timeout=UPSTREAM_TIMEOUT)
+    response.raise_for_status()
+    weather_data = response.json()
+  except (requests.RequestException, ValueError):
+    weatherapi_stats.record(error=True)
+    raise
+  weatherapi_stats.record()
+  return weather_data
+
+
+"""
+Cache persistence and warm-up. Only the timezone and weather caches are saved: they are the ones
+that cost an upstream call to fill, cached failures are left out. A snapshot is a JSON file that
+is replaced whole, so a crash mid-write leaves the previous one in place.
+"""
+
+SNAPSHOT_VERSION = 1
+snapshot_caches = {'timezone': tzcache, 'weather': weathercache}
+# set once the service can answer from warm caches, see /ready
+ready = threading.Event()
+
+
+def save_snapshot(path):
+  snapshot = {
+    'version': SNAPSHOT_VERSION,
+    'saved_at': time.time(),
+    'caches': {name: cache.dump() for name, cache in snapshot_caches.items()},
+  }
+  # several worker processes may save at the same time, each writes its own temporary file
+  tmp_path = f"{path}.{os.getpid()}.tmp"
+  with open(tmp_path, 'w') as f:
+    json.dump(snapshot, f)
+  os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+  try:
+    with open(path) as f:
+      snapshot = json.load(f)
+  except FileNotFoundError:
+    return
+  except ValueError as e:
+    app.logger.warning(f"Ignoring cache snapshot {path}: {str(e)}")
+    return
+  if snapshot.get('version') != SNAPSHOT_VERSION:
+    app.logger.warning(f"Ignoring cache snapshot {path}: unknown version {snapshot.get('version')}")
+    return
+  age = max(0, time.time() - snapshot['saved_at'])
+  for name, cache in snapshot_caches.items():
+    loaded = cache.load(snapshot['caches'].get(name, []), age)
+    app.logger.info(f"Loaded {loaded} {name} cache entries from {path}")
+
+
+def snapshot_periodically(path, interval):
+  while True:
+    time.sleep(interval)
+    try:
+      save_snapshot(path)
+    except OSError as e:
+      app.logger.warning(f"Saving cache snapshot {path} failed: {str(e)}")
+
+
+def read_ip_list(path):
+  """ IPs from a file (or stdin for '-'), one per line, skipping blank lines and # comments """
+  f = sys.stdin if path == '-' else open(path)
+  with f:
+    lines = [line.split('#', 1)[0].strip() for line in f]
+  return [line for line in lines if line]
+
+
+class Pacer(object):
+  """ Spaces out calls from any number of threads to at most `rate` per second, or not at all for rate 0 """
+
+  def __init__(self, rate):
+    self.interval = 1.0 / rate if rate > 0 else 0.0
+    self.lock = threading.Lock()
+    self.next_at = 0.0
+
+  def wait(self):
+    with self.lock:
+      now = time.monotonic()
+      at = max(now, self.next_at)
+      self.next_at = at + self.interval
+    if at > now:
+      time.sleep(at - now)
+
+
+def warm_up(ips):
+  """ Resolve the timezone of known client IPs, and the weather at their locations, ahead of their first policy check """
+  # upstream calls are paced, and a failed lookup is not cached: when ip-api.com still rate limits the
+  # warm-up, real requests for those IPs right after it get to try again instead of a cached failure
+  pacer = Pacer(WARMUP_RATE)
+
+  def timezone(ip):
+    tz_info = known_timezone(ip)
+    if tz_info is not None:
+      return tz_info
+    return tz_lookups.do(ip, warm_up_timezone, ip, pacer)
+
+  def weather(location):
+    weather_data = weathercache.peek(location)
+    if weather_data is not None:
+      return weather_data
+    return weather_lookups.do(location, warm_up_weather, location, pacer)
+
+  # its own threads, so the paced lookups don't hold up /batch requests in the meantime
+  with ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix='warm-up') as executor:
+    timezones = resolve_all(timezone, set(ips), executor)
+    weather = resolve_all(weather, batch_locations(['rainorshine'], timezones), executor)
+  failed = sum(isinstance(result, Exception) for result in list(timezones.values()) + list(weather.values()))
+  app.logger.info(f"Warm-up resolved {len(timezones)} IPs and {len(weather)} weather locations, {failed} lookups failed")
+  return failed
+
+
+def warm_up_timezone(ip, pacer):
+  tz_info = tzcache.peek(ip)
+  if tz_info is not None:
     return tz_info
+  pacer.wait()
+  tz_info = fetch_timezone(ip)
+  if tz_info.get('status') == 'fail':
+    raise LookupFailed(f"timezone lookup for {ip} failed: {tz_info.get('message', 'unknown error')}")
+  tzcache.set(ip, tz_info)
+  return tz_info
+
+
+def warm_up_weather(location, pacer):
+  weather_data = weathercache.peek(location)
+  if weather_data is not None:
+    return weather_data
+  pacer.wait()
+  return fetch_and_cache_weather(location)
+
 
+def warm_up_and_report_ready(path):
+  try:
+    warm_up(read_ip_list(path))
+  except Exception as e:
+    # a warm-up that fails only means a cold start, not a service that never becomes ready
+    app.logger.error(f"Warm-up from {path} failed: {str(e)}")
+  finally:
+    ready.set()
+
+
+def start_background_work():
+  if CACHE_SNAPSHOT_PATH:
+    load_snapshot(CACHE_SNAPSHOT_PATH)
+    threading.Thread(target=snapshot_periodically, args=(CACHE_SNAPSHOT_PATH, CACHE_SNAPSHOT_INTERVAL),
+                     name='cache-snapshot', daemon=True).start()
+    atexit.register(save_snapshot, CACHE_SNAPSHOT_PATH)
+  if WARMUP_IPS:
+    threading.Thread(target=warm_up_and_report_ready, args=(WARMUP_IPS,), name='warm-up', daemon=True).start()
+  else:
+    ready.set()
 
 
 """ 
@@ -191,9 +1011,20 @@ def get_remote_ip(request):
     return request.remote_addr
 
 
+start_background_work()
+
+
 # Main app starts here
 if __name__ == '__main__':
   logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+  if sys.argv[1:2] == ['warmup']:
+    # python app.py warmup ips.txt: fill the caches and write the snapshot the service starts from
+    if len(sys.argv) != 3 or not CACHE_SNAPSHOT_PATH:
+      print("usage: CACHE_SNAPSHOT_PATH=cache.json python app.py warmup ips.txt")
+      sys.exit(2)
+    failed = warm_up(read_ip_list(sys.argv[2]))
+    save_snapshot(CACHE_SNAPSHOT_PATH)
+    sys.exit(1 if failed else 0)
   app.run(host='0.0.0.0', debug=True)
@@ -0,0 +1,290 @@
+"""
+Async (ASGI) serving mode of the policy endpoints in app.py.
+
+The endpoints, policy decisions and caches are the same as in app.py, but upstream lookups go
+through one pooled httpx.AsyncClient per worker process, so thousands of policy checks can wait
+on ip-api.com or weatherapi.com at the same time without a thread each. Run it under gunicorn
+with uvicorn workers, one process per CPU core:
+
+  gunicorn asgi:app -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:5000
+
+or, for a single process, `uvicorn asgi:app --host 0.0.0.0 --port 5000`.
+"""
+import asyncio
+import contextlib
+import os
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+import app as sync_app
+import metrics
+
+# connections to the upstream APIs kept open per worker process
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get('UPSTREAM_MAX_CONNECTIONS', '100'))
+UPSTREAM_ATTEMPTS = 3
+
+logger = sync_app.app.logger
+
+
+class AsyncSingleFlight(object):
+  """ asyncio counterpart of app.SingleFlight: concurrent calls for the same key share one task """
+
+  def __init__(self):
+    self.calls = {}
+    self.executed = 0
+    self.coalesced = 0
+
+  async def do(self, key, fn, *args):
+    task = self.calls.get(key)
+    if task is not None:
+      self.coalesced += 1
+    else:
+      task = self.calls[key] = asyncio.ensure_future(fn(*args))
+      task.add_done_callback(lambda _: self.calls.pop(key, None))
+      self.executed += 1
+    # a caller that goes away must not cancel the lookup for everyone else waiting on it
+    return await asyncio.shield(task)
+
+  def stats(self):
+    return {'executed': self.executed, 'coalesced': self.coalesced, 'in_flight': len(self.calls)}
+
+
+tz_lookups = AsyncSingleFlight()
+weather_lookups = AsyncSingleFlight()
+sync_app.lookups.update(timezone=tz_lookups, weather=weather_lookups)
+weather_refreshing = set()
+background_tasks = set()
+client = None
+batch_lookup_slots = None
+
+
+async def upstream_get(upstream, url, params=None):
+  # like app.fetch_timezone: only network errors are retried, briefly
+  stats = sync_app.upstreams[upstream]
+  for attempt in range(UPSTREAM_ATTEMPTS):
+    try:
+      response = await client.get(url, params=params)
+      response.raise_for_status()
+      data = response.json()
+    except (httpx.ConnectError, httpx.TimeoutException):
+      stats.record(error=True)
+      if attempt == UPSTREAM_ATTEMPTS - 1:
+        raise
+      sync_app.UPSTREAM_RETRIES.inc(upstream)
+      await asyncio.sleep(min(0.2 * 2 ** attempt, 1.0))
+      continue
+    except (httpx.HTTPError, ValueError):
+      # a body that isn't JSON is as much an upstream failure as an error status
+      stats.record(error=True)
+      raise
+    stats.record()
+    return data
+
+
+async def get_timezone(ip):
+  tz_info = sync_app.known_timezone(ip)
+  if tz_info is not None:
+    return tz_info
+  return await tz_lookups.do(ip, resolve_timezone, ip)
+
+
+async def resolve_timezone(ip):
+  try:
+    tz_info = await upstream_get('ip-api', sync_app.IPAPI_URL.format(ip=ip))
+  except (httpx.HTTPError, ValueError) as e:
+    raise sync_app.timezone_lookup_failed(ip, e)
+  return sync_app.cache_timezone(ip, tz_info)
+
+
+async def get_weather(location):
+  weather_data, stale = sync_app.weathercache.get_or_stale(location)
+  if weather_data is None:
+    return await weather_lookups.do(location, resolve_weather, location)
+  if stale and location not in weather_refreshing:
+    # serve the stale entry now and refresh it for the next request
+    weather_refreshing.add(location)
+    task = asyncio.ensure_future(refresh_weather(location))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+  return weather_data
+
+
+async def refresh_weather(location):
+  try:
+    await weather_lookups.do(location, fetch_and_cache_weather, location)
+  except Exception as e:
+    logger.warning(f"Refreshing weather for {location} failed: {str(e)}")
+  finally:
+    weather_refreshing.discard(location)
+
+
+async def resolve_weather(location):
+  try:
+    return await fetch_and_cache_weather(location)
+  except (httpx.HTTPError, ValueError) as e:
+    raise sync_app.weather_lookup_failed(location, e)
+
+
+async def fetch_and_cache_weather(location):
+  weather_data = await upstream_get('weatherapi', sync_app.WEATHER_API_URL,
+                                    params={'key': sync_app.WEATHER_API_KEY, 'q': location})
+  sync_app.weathercache.set(location, weather_data)
+  return weather_data
+
+
+"""
+Request handling, with the same responses as the Flask routes in app.py
+"""
+
+def unauthorized(request):
+  auth = request.headers.get('Authorization', None)
+  if auth != sync_app.API_SECRET:
+    logger.info(f"Unauthorized access attempt from IP: {get_remote_ip(request)}, Authorization: {auth}")
+    return JSONResponse({'error': "Invalid Authorization key"}, 401)
+  return None
+
+
+def get_remote_ip(request):
+  forwarded_for = request.headers.get('X-Forwarded-For')
+  if forwarded_for:
+    return forwarded_for.split(',')[0].strip()
+  return request.client.host if request.client else None
+
+
+def policy_endpoint(policy, evaluate, error_key='error'):
+  """ Wrap an async evaluate(data) -> (body, status) or Decision into a POST handler """
+  async def endpoint(request):
+    with sync_app.REQUESTS_IN_FLIGHT.track(policy), sync_app.REQUEST_LATENCY.time(policy):
+      response = unauthorized(request)
+      if response is not None:
+        return response
+      try:
+        result = await evaluate(await request.json())
+      except Exception as e:
+        logger.error(f"Error occurred: {str(e)}")
+        return JSONResponse({error_key: str(e)}, 400)
+      if isinstance(result, sync_app.Decision):
+        # cached decisions come with their body already encoded
+        return Response(result.json_body, result.status, media_type='application/json')
+      body, status = result
+      return JSONResponse(body, status)
+  return endpoint
+
+
+async def friday_rule(data):
+  with sync_app.PHASE_LATENCY.time('fridayrule', 'timezone'):
+    tz_info = await get_timezone(data['ip'])
+  with sync_app.PHASE_LATENCY.time('fridayrule', 'decision'):
+    return sync_app.clock_decision('fridayrule', tz_info)
+
+
+async def random_score(data):
+  with sync_app.PHASE_LATENCY.time('random', 'decision'):
+    return sync_app.random_decision(data['protocol'])
+
+
+async def rain_or_shine(data):
+  with sync_app.PHASE_LATENCY.time('rainorshine', 'timezone'):
+    tz_info = await get_timezone(data['ip'])
+  if sync_app.WEATHER_API_KEY == '':
+    logger.error(f"Error occurred: WEATHER_API_KEY not set")
+    return {'error': "WEATHER_API_KEY not set, create one here https://www.weatherapi.com/my/"}, 400
+  with sync_app.PHASE_LATENCY.time('rainorshine', 'weather'):
+    weather_data = await get_weather(sync_app.weather_location(tz_info))
+  with sync_app.PHASE_LATENCY.time('rainorshine', 'decision'):
+    return sync_app.rain_or_shine_decision(weather_data)
+
+
+async def business_hours(data):
+  with sync_app.PHASE_LATENCY.time('businesshours', 'timezone'):
+    tz_info = await get_timezone(data['ip'])
+  with sync_app.PHASE_LATENCY.time('businesshours', 'decision'):
+    return sync_app.clock_decision('businesshours', tz_info)
+
+
+async def batch(request):
+  with sync_app.REQUESTS_IN_FLIGHT.track('batch'), sync_app.REQUEST_LATENCY.time('batch'):
+    response = unauthorized(request)
+    if response is not None:
+      return response
+    try:
+      items, policies = sync_app.parse_batch(await request.json())
+    except Exception as e:
+      logger.error(f"Error occurred: {str(e)}")
+      return JSONResponse({'error': str(e)}, 400)
+
+    # every IP and location is resolved once, however many items share it
+    with sync_app.PHASE_LATENCY.time('batch', 'timezone'):
+      timezones = await resolve_all(get_timezone, sync_app.batch_ips(items, policies))
+    with sync_app.PHASE_LATENCY.time('batch', 'weather'):
+      weather = await resolve_all(get_weather, sync_app.batch_locations(policies, timezones))
+    with sync_app.PHASE_LATENCY.time('batch', 'decision'):
+      results = [sync_app.batch_decisions(item, policies, timezones, weather) for item in items]
+    return JSONResponse({'results': results})
+
+
+async def resolve_all(lookup, keys):
+  # at most BATCH_LOOKUP_WORKERS lookups at a time across all batches, like the thread pool in app.py
+  async def bounded(key):
+    async with batch_lookup_slots:
+      return await lookup(key)
+
+  keys = list(keys)
+  results = await asyncio.gather(*(bounded(key) for key in keys), return_exceptions=True)
+  return dict(zip(keys, results))
+
+
+async def cache_stats(request):
+  response = unauthorized(request)
+  if response is not None:
+    return response
+  return JSONResponse({
+    'tzcache': sync_app.tzcache.stats(),
+    'weathercache': sync_app.weathercache.stats(),
+    'decisioncache': sync_app.decisioncache.stats(),
+    'tz_lookups': tz_lookups.stats(),
+    'weather_lookups': weather_lookups.stats(),
+    'upstream': {'ip-api': sync_app.ipapi_stats.stats(), 'weatherapi': sync_app.weatherapi_stats.stats()},
+  })
+
+
+async def readiness(request):
+  if not sync_app.ready.is_set():
+    return JSONResponse({'ready': False}, 503)
+  return JSONResponse({'ready': True})
+
+
+async def metrics_endpoint(request):
+  # not behind unauthorized(), like the /metrics route in app.py
+  return Response(metrics.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_):
+  global client, batch_lookup_slots
+  # created here rather than at import, so it belongs to the server's event loop
+  batch_lookup_slots = asyncio.Semaphore(sync_app.BATCH_LOOKUP_WORKERS)
+  limits = httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS, max_keepalive_connections=UPSTREAM_MAX_CONNECTIONS)
+  client = httpx.AsyncClient(limits=limits, timeout=sync_app.UPSTREAM_TIMEOUT)
+  # with WARMUP_IPS set, app.py warms the caches in a thread; don't take requests before it's done
+  await asyncio.get_running_loop().run_in_executor(None, sync_app.ready.wait)
+  try:
+    yield
+  finally:
+    await client.aclose()
+
+
+app = Starlette(
+  routes=[
+    Route('/fridayrule', policy_endpoint('fridayrule', friday_rule), methods=['POST']),
+    Route('/random', policy_endpoint('random', random_score), methods=['POST']),
+    Route('/rainorshine', policy_endpoint('rainorshine', rain_or_shine), methods=['POST']),
+    Route('/businesshours', policy_endpoint('businesshours', business_hours, error_key='error2'), methods=['POST']),
+    Route('/batch', batch, methods=['POST']),
+    Route('/cachestats', cache_stats, methods=['GET']),
+    Route('/ready', readiness, methods=['GET']),
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+  ],
+  lifespan=lifespan,
+)
@@ -0,0 +1,327 @@
+"""
+Load test for the policy endpoints, against stub upstreams instead of ip-api.com and weatherapi.com.
+
+The benchmark starts two local stubs that answer like ip-api.com and weatherapi.com, with a
+configurable latency and error rate. It then starts the service pointed at them (asgi.py under
+uvicorn, or app.py on the Flask server) and drives each endpoint for a while at a fixed
+concurrency. Client IPs follow a hot set plus long tail distribution: most requests come from a
+small set of addresses, the rest from a large pool, so the caches see realistic hit rates.
+
+Each endpoint gets a report with RPS, latency percentiles, status codes and the upstream calls it
+caused. The report is written as JSON, so runs before and after a change can be compared:
+
+  python benchmark.py --server asgi --workers 4 --concurrency 64 --duration 20 --output before.json
+
+Endpoints run one after another in the same service, so later endpoints find the caches as the
+earlier ones left them. Use --target to benchmark a service that is already running; its upstream
+call counts are only meaningful if it was started with IPAPI_URL and WEATHER_API_URL pointing at
+the stubs on a fixed --stub-port, and API_SECRET set to 'benchmark'.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+ENDPOINTS = ('fridayrule', 'random', 'rainorshine', 'businesshours', 'batch')
+API_SECRET = 'benchmark'
+# stub answers: a timezone, city and country per IP, picked by a hash of the address
+LOCATIONS = [
+  ('Europe/Amsterdam', 'Amsterdam', 'NL'),
+  ('America/New_York', 'New York', 'US'),
+  ('America/Los_Angeles', 'Los Angeles', 'US'),
+  ('Asia/Tokyo', 'Tokyo', 'JP'),
+  ('Australia/Sydney', 'Sydney', 'AU'),
+  ('Asia/Kolkata', 'Mumbai', 'IN'),
+  ('America/Sao_Paulo', 'Sao Paulo', 'BR'),
+  ('Europe/London', 'London', 'GB'),
+]
+CONDITIONS = ['Sunny', 'Partly cloudy', 'Light rain', 'Overcast', 'Moderate rain']
+
+
+class StubUpstreams(object):
+  """ ip-api.com (/json/<ip>) and weatherapi.com (/v1/current.json) in one threaded HTTP server """
+
+  def __init__(self, port, latency, error_rate):
+    self.latency = latency  # {'ip-api': seconds, 'weatherapi': seconds}
+    self.error_rate = error_rate
+    self.lock = threading.Lock()
+    self.calls = {'ip-api': 0, 'weatherapi': 0}
+    self.errors = {'ip-api': 0, 'weatherapi': 0}
+    self.server = ThreadingHTTPServer(('127.0.0.1', port), self.handler())
+    self.server.daemon_threads = True
+    self.port = self.server.server_address[1]
+
+  def handler(self):
+    stubs = self
+
+    class Handler(BaseHTTPRequestHandler):
+      # keep-alive, like the real APIs
+      protocol_version = 'HTTP/1.1'
+
+      def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/json/'):
+          upstream, body = 'ip-api', stubs.ipapi_answer(url.path[len('/json/'):])
+        elif url.path == '/v1/current.json':
+          upstream, body = 'weatherapi', stubs.weather_answer(parse_qs(url.query).get('q', [''])[0])
+        else:
+          self.send_error(404)
+          return
+        failed = stubs.record(upstream)
+        # jitter of +-50% around the configured latency
+        time.sleep(stubs.latency[upstream] * random.uniform(0.5, 1.5))
+        if failed:
+          self.send_error(503)
+          return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+      def log_message(self, format, *args):
+        pass
+
+    return Handler
+
+  def record(self, upstream):
+    failed = random.random() < self.error_rate[upstream]
+    with self.lock:
+      self.calls[upstream] += 1
+      if failed:
+        self.errors[upstream] += 1
+    return failed
+
+  def ipapi_answer(self, ip):
+    timezone, city, country_code = LOCATIONS[int(hashlib.md5(ip.encode()).hexdigest(), 16) % len(LOCATIONS)]
+    return {'status': 'success', 'timezone': timezone, 'city': city, 'countryCode': country_code, 'query': ip}
+
+  def weather_answer(self, location):
+    return {'location': {'name': location}, 'current': {'condition': {'text': random.choice(CONDITIONS)}}}
+
+  def counters(self):
+    with self.lock:
+      return {'calls': dict(self.calls), 'errors': dict(self.errors)}
+
+  def start(self):
+    threading.Thread(target=self.server.serve_forever, name='stub-upstreams', daemon=True).start()
+
+  def stop(self):
+    self.server.shutdown()
+
+
+class ClientIPs(object):
+  """ hot_fraction of the requests come from hot_size addresses, the rest from tail_size others """
+
+  def __init__(self, hot_size, tail_size, hot_fraction, seed):
+    self.random = random.Random(seed)
+    addresses = self.random.sample(range(2 ** 24, 2 ** 32 - 2 ** 28), hot_size + tail_size)
+    ips = [socket.inet_ntoa(address.to_bytes(4, 'big')) for address in addresses]
+    self.hot, self.tail = ips[:hot_size], ips[hot_size:]
+    self.hot_fraction = hot_fraction
+
+  def next(self):
+    if not self.tail or (self.hot and self.random.random() < self.hot_fraction):
+      return self.random.choice(self.hot)
+    return self.random.choice(self.tail)
+
+
+def percentile(values, p):
+  """ Nearest-rank percentile of sorted values """
+  if not values:
+    return None
+  return values[min(len(values) - 1, max(0, int(math.ceil(p / 100 * len(values))) - 1))]
+
+
+def request_body(endpoint, ips, batch_size):
+  if endpoint == 'batch':
+    return {'requests': [{'ip': ips.next(), 'user': 'bench', 'protocol': 'ssh'} for _ in range(batch_size)]}
+  return {'ip': ips.next(), 'user': 'bench', 'protocol': random.choice(['ssh', 'ssh', 'ssh', 'http'])}
+
+
+async def drive(target, endpoint, ips, concurrency, duration, batch_size):
+  """ Send requests from `concurrency` clients for `duration` seconds, returns (latencies, status codes, elapsed) """
+  latencies = []
+  statuses = {}
+  limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+  async with httpx.AsyncClient(base_url=target, limits=limits, timeout=30,
+                               headers={'Authorization': API_SECRET}) as client:
+    async def worker():
+      while time.monotonic() < deadline:
+        body = request_body(endpoint, ips, batch_size)
+        start = time.perf_counter()
+        try:
+          response = await client.post('/' + endpoint, json=body)
+          status = str(response.status_code)
+        except httpx.HTTPError as e:
+          status = type(e).__name__
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.monotonic()
+    deadline = started + duration
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+  return sorted(latencies), statuses, elapsed
+
+
+def endpoint_report(endpoint, latencies, statuses, elapsed, before, after, batch_size):
+  # 401 is a policy saying no, not an error
+  errors = sum(count for status, count in statuses.items() if status not in ('200', '401'))
+  report = {
+    'endpoint': endpoint,
+    'requests': len(latencies),
+    'errors': errors,
+    'status_codes': statuses,
+    'duration': round(elapsed, 3),
+    'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+    'latency_ms': {
+      'mean': round(1000 * sum(latencies) / len(latencies), 3) if latencies else None,
+      'p50': round(1000 * percentile(latencies, 50), 3) if latencies else None,
+      'p95': round(1000 * percentile(latencies, 95), 3) if latencies else None,
+      'p99': round(1000 * percentile(latencies, 99), 3) if latencies else None,
+      'max': round(1000 * latencies[-1], 3) if latencies else None,
+    },
+  }
+  if before is not None:
+    report['upstream_calls'] = {name: after['calls'][name] - before['calls'][name] for name in after['calls']}
+    report['upstream_errors'] = {name: after['errors'][name] - before['errors'][name] for name in after['errors']}
+  if endpoint == 'batch':
+    report['batch_size'] = batch_size
+    report['items_per_second'] = round(len(latencies) * batch_size / elapsed, 1) if elapsed else None
+  return report
+
+
+def free_port():
+  with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    return s.getsockname()[1]
+
+
+def start_service(args, stubs):
+  port = free_port()
+  env = dict(os.environ,
+             API_SECRET=API_SECRET,
+             WEATHER_API_KEY='benchmark',
+             IPAPI_URL=f'http://127.0.0.1:{stubs.port}/json/{{ip}}',
+             WEATHER_API_URL=f'http://127.0.0.1:{stubs.port}/v1/current.json')
+  if args.server == 'asgi':
+    command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+               '--workers', str(args.workers), '--log-level', 'warning']
+  else:
+    command = [sys.executable, '-c', f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+  # every failed lookup is logged, which would drown the progress lines
+  log = open(args.service_log, 'w') if args.service_log else subprocess.DEVNULL
+  process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                             stdout=log, stderr=log)
+  target = f'http://127.0.0.1:{port}'
+  wait_ready(target, process)
+  return process, target
+
+
+def wait_ready(target, process, timeout=30):
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    if process is not None and process.poll() is not None:
+      raise RuntimeError(f"service exited with status {process.returncode}")
+    try:
+      if httpx.get(target + '/ready', timeout=1).status_code == 200:
+        return
+    except httpx.HTTPError:
+      pass
+    time.sleep(0.2)
+  raise RuntimeError(f"service at {target} wasn't ready within {timeout} seconds")
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="Benchmark the policy endpoints against stub upstreams")
+  parser.add_argument('--server', choices=['asgi', 'flask'], default='asgi',
+                      help="serve asgi.py with uvicorn, or app.py with the Flask server (default: asgi)")
+  parser.add_argument('--workers', type=int, default=1, help="uvicorn worker processes (default: 1)")
+  parser.add_argument('--target', help="benchmark this running service instead of starting one, e.g. http://localhost:5000")
+  parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                      help=f"comma separated endpoints to drive, in order (default: {','.join(ENDPOINTS)})")
+  parser.add_argument('--concurrency', type=int, default=32, help="concurrent clients (default: 32)")
+  parser.add_argument('--duration', type=float, default=10, help="seconds per endpoint (default: 10)")
+  parser.add_argument('--batch-size', type=int, default=50, help="requests per /batch call (default: 50)")
+  parser.add_argument('--hot-ips', type=int, default=100, help="number of frequently seen client IPs (default: 100)")
+  parser.add_argument('--tail-ips', type=int, default=100000, help="number of rarely seen client IPs (default: 100000)")
+  parser.add_argument('--hot-fraction', type=float, default=0.9,
+                      help="share of requests coming from the hot IPs (default: 0.9)")
+  parser.add_argument('--ipapi-latency', type=float, default=50, help="stub ip-api.com latency in ms (default: 50)")
+  parser.add_argument('--weather-latency', type=float, default=80,
+                      help="stub weatherapi.com latency in ms (default: 80)")
+  parser.add_argument('--ipapi-error-rate', type=float, default=0.0,
+                      help="share of stub ip-api.com calls answered with a 503 (default: 0)")
+  parser.add_argument('--weather-error-rate', type=float, default=0.0,
+                      help="share of stub weatherapi.com calls answered with a 503 (default: 0)")
+  parser.add_argument('--stub-port', type=int, default=0, help="port of the stub upstreams (default: any free port)")
+  parser.add_argument('--seed', type=int, default=1, help="random seed of the client IPs (default: 1)")
+  parser.add_argument('--service-log', help="write the output of the started service to this file")
+  parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+  args = parser.parse_args()
+  args.endpoints = [endpoint.strip() for endpoint in args.endpoints.split(',') if endpoint.strip()]
+  unknown = [endpoint for endpoint in args.endpoints if endpoint not in ENDPOINTS]
+  if unknown:
+    parser.error(f"unknown endpoints: {', '.join(unknown)}")
+  return args
+
+
+def main():
+  args = parse_args()
+  stubs = StubUpstreams(args.stub_port,
+                        latency={'ip-api': args.ipapi_latency / 1000, 'weatherapi': args.weather_latency / 1000},
+                        error_rate={'ip-api': args.ipapi_error_rate, 'weatherapi': args.weather_error_rate})
+  stubs.start()
+  ips = ClientIPs(args.hot_ips, args.tail_ips, args.hot_fraction, args.seed)
+
+  process = None
+  try:
+    if args.target:
+      target = args.target.rstrip('/')
+      wait_ready(target, None)
+    else:
+      process, target = start_service(args, stubs)
+    print(f"Benchmarking {target}, stub upstreams on port {stubs.port}", file=sys.stderr)
+
+    results = []
+    for endpoint in args.endpoints:
+      before = stubs.counters()
+      latencies, statuses, elapsed = asyncio.run(
+        drive(target, endpoint, ips, args.concurrency, args.duration, args.batch_size))
+      report = endpoint_report(endpoint, latencies, statuses, elapsed, before, stubs.counters(), args.batch_size)
+      results.append(report)
+      latency = report['latency_ms']
+      print(f"{endpoint:>14}: {report['rps']} req/s, p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+            f"p99 {latency['p99']} ms, {report['errors']} errors, upstream calls {report['upstream_calls']}",
+            file=sys.stderr)
+  finally:
+    if process is not None:
+      process.terminate()
+      process.wait()
+    stubs.stop()
+
+  config = {key: value for key, value in vars(args).items() if key not in ('output', 'service_log')}
+  output = json.dumps({'config': config, 'results': results}, indent=2)
+  if args.output:
+    with open(args.output, 'w') as f:
+      f.write(output + '\n')
+  else:
+    print(output)
+
+
+if __name__ == '__main__':
+  main()
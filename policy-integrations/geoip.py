@@ -0,0 +1,175 @@
+"""
+Local IP geolocation for app.py, so timezone lookups don't need a round trip to ip-api.com.
+
+Two kinds of database are supported:
+
+- A CSV file of IP ranges, one per row: start_ip,end_ip,timezone,city,countryCode
+  Addresses are IPv4 or IPv6, in the usual notation or as integers, which is what the
+  "city" CSV exports of MaxMind, IP2Location or DB-IP reduce to. A header row is skipped.
+  The CSV is compiled once into a binary index next to it (<file>.idx): fixed width range
+  records sorted by start address, which are memory mapped and binary searched, so a lookup
+  is O(log n) and the ranges never have to be loaded into the Python heap.
+- A MaxMind .mmdb file, read with the optional maxminddb package.
+
+Both return the same fields as ip-api.com, so the rest of the app doesn't care where an
+answer came from. Build the index ahead of time (e.g. in a Docker build step) with:
+
+  python geoip.py build ranges.csv
+"""
+import bisect
+import csv
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import sys
+
+try:
+  import maxminddb
+except ImportError:  # only needed for .mmdb databases
+  maxminddb = None
+
+INDEX_MAGIC = b'B0GEOIP1'
+# magic, number of ranges, offset of the JSON location table
+INDEX_HEADER = struct.Struct('>8sQQ')
+# start and end address as 128 bit big endian integers (IPv4 mapped into ::ffff:0:0/96), location number
+INDEX_RECORD = struct.Struct('>16s16sI')
+IPV4_MAPPED = 0xffff << 32
+
+
+def address_key(ip):
+  """ 16 byte big endian key of an address, ordered the same way as the address """
+  if isinstance(ip, int) or ip.isdigit():
+    value = int(ip)
+    # plain integers below 2^32 are IPv4 addresses
+    address = ipaddress.IPv4Address(value) if value < 2 ** 32 else ipaddress.IPv6Address(value)
+  else:
+    address = ipaddress.ip_address(ip.strip())
+  if address.version == 4:
+    return (IPV4_MAPPED | int(address)).to_bytes(16, 'big')
+  if address.ipv4_mapped is not None:
+    return (IPV4_MAPPED | int(address.ipv4_mapped)).to_bytes(16, 'big')
+  return int(address).to_bytes(16, 'big')
+
+
+def build_index(csv_path, index_path=None):
+  """ Compile a CSV range file into a binary index, returns the index path """
+  index_path = index_path or csv_path + '.idx'
+  ranges = []
+  locations = []
+  location_numbers = {}
+  with open(csv_path, newline='') as f:
+    for row in csv.reader(f):
+      if len(row) < 5 or row[0].startswith('#'):
+        continue
+      try:
+        start, end = address_key(row[0]), address_key(row[1])
+      except ValueError:
+        # header row, or a line we can't make sense of
+        continue
+      location = (row[2], row[3], row[4])
+      if location not in location_numbers:
+        location_numbers[location] = len(locations)
+        locations.append(location)
+      ranges.append((start, end, location_numbers[location]))
+  ranges.sort()
+
+  location_table = json.dumps(locations).encode()
+  tmp_path = index_path + '.tmp'
+  with open(tmp_path, 'wb') as f:
+    f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(ranges), INDEX_HEADER.size + len(ranges) * INDEX_RECORD.size))
+    for record in ranges:
+      f.write(INDEX_RECORD.pack(*record))
+    f.write(location_table)
+  # the index is swapped in whole, a running process never sees a half written file
+  os.replace(tmp_path, index_path)
+  return index_path
+
+
+class RangeIndex(object):
+  """ Memory mapped view of an index built by build_index() """
+
+  class Starts(object):
+    """ Sequence of range start keys, so bisect can search the mapped records in place """
+    def __init__(self, index):
+      self.index = index
+
+    def __len__(self):
+      return self.index.count
+
+    def __getitem__(self, i):
+      offset = INDEX_HEADER.size + i * INDEX_RECORD.size
+      return self.index.map[offset:offset + 16]
+
+  def __init__(self, path):
+    self.file = open(path, 'rb')
+    self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, self.count, locations_offset = INDEX_HEADER.unpack_from(self.map, 0)
+    if magic != INDEX_MAGIC:
+      raise ValueError(f"{path} is not a geolocation index")
+    self.locations = json.loads(self.map[locations_offset:])
+    self.starts = RangeIndex.Starts(self)
+
+  def lookup(self, ip):
+    try:
+      key = address_key(ip)
+    except ValueError:
+      return None
+    i = bisect.bisect_right(self.starts, key) - 1
+    if i < 0:
+      return None
+    _, end, location = INDEX_RECORD.unpack_from(self.map, INDEX_HEADER.size + i * INDEX_RECORD.size)
+    if key > end:
+      return None
+    timezone, city, country_code = self.locations[location]
+    return {'status': 'success', 'timezone': timezone, 'city': city, 'countryCode': country_code,
+            'query': ip, 'source': 'local'}
+
+  def close(self):
+    self.map.close()
+    self.file.close()
+
+
+class MaxMindDatabase(object):
+  """ GeoIP2/GeoLite2 City database, which is memory mapped by maxminddb itself """
+
+  def __init__(self, path):
+    if maxminddb is None:
+      raise RuntimeError("reading .mmdb files requires maxminddb, install it with: pip install maxminddb")
+    self.reader = maxminddb.open_database(path, maxminddb.MODE_MMAP)
+
+  def lookup(self, ip):
+    try:
+      record = self.reader.get(ip)
+    except ValueError:
+      return None
+    if not record or 'time_zone' not in record.get('location', {}):
+      return None
+    return {'status': 'success', 'timezone': record['location']['time_zone'],
+            'city': record.get('city', {}).get('names', {}).get('en', ''),
+            'countryCode': record.get('country', {}).get('iso_code', ''),
+            'query': ip, 'source': 'local'}
+
+  def close(self):
+    self.reader.close()
+
+
+def open_database(path):
+  """ Open a .mmdb database, a binary index, or a CSV range file (building its index if it is missing or stale) """
+  if path.endswith('.mmdb'):
+    return MaxMindDatabase(path)
+  if path.endswith('.idx'):
+    return RangeIndex(path)
+  index_path = path + '.idx'
+  if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(path):
+    build_index(path, index_path)
+  return RangeIndex(index_path)
+
+
+if __name__ == '__main__':
+  if len(sys.argv) not in (3, 4) or sys.argv[1] != 'build':
+    print("usage: python geoip.py build ranges.csv [ranges.csv.idx]")
+    sys.exit(2)
+  index_path = build_index(*sys.argv[2:])
+  print(f"Wrote {index_path}")
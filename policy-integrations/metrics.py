@@ -0,0 +1,138 @@
+"""
+Just enough of Prometheus for app.py and asgi.py: labelled counters, gauges and histograms,
+plus metrics whose samples are read from elsewhere (e.g. cache counters) when scraped.
+render() returns everything in the Prometheus text exposition format.
+
+Metrics live in the process that records them, so with several gunicorn workers each scrape
+shows the worker that happened to answer it.
+"""
+import contextlib
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+registry = []
+
+
+def escape(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+  pairs = [f'{name}="{escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+  return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+  if value == float('inf'):
+    return '+Inf'
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+  type = 'untyped'
+
+  def __init__(self, name, documentation, labels=()):
+    self.name = name
+    self.documentation = documentation
+    self.labels = tuple(labels)
+    self.lock = threading.Lock()
+    self.values = {}
+    registry.append(self)
+
+  def samples(self):
+    """ (suffix, label values, extra labels, value) tuples """
+    with self.lock:
+      return [('', key, (), value) for key, value in sorted(self.values.items())]
+
+
+class Counter(Metric):
+  type = 'counter'
+
+  def inc(self, *labels, amount=1):
+    with self.lock:
+      self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+  type = 'gauge'
+
+  def inc(self, *labels, amount=1):
+    with self.lock:
+      self.values[labels] = self.values.get(labels, 0) + amount
+
+  def dec(self, *labels, amount=1):
+    self.inc(*labels, amount=-amount)
+
+  @contextlib.contextmanager
+  def track(self, *labels):
+    """ Count what runs inside the block for as long as it runs """
+    self.inc(*labels)
+    try:
+      yield
+    finally:
+      self.dec(*labels)
+
+
+class Histogram(Metric):
+  type = 'histogram'
+
+  def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+    super().__init__(name, documentation, labels)
+    self.buckets = tuple(buckets) + (float('inf'),)
+
+  def observe(self, value, *labels):
+    with self.lock:
+      counts, total = self.values.get(labels, ([0] * len(self.buckets), 0.0))
+      for i, bound in enumerate(self.buckets):
+        if value <= bound:
+          counts[i] += 1
+          break
+      self.values[labels] = (counts, total + value)
+
+  @contextlib.contextmanager
+  def time(self, *labels):
+    """ Observe how long the block takes """
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(time.perf_counter() - start, *labels)
+
+  def samples(self):
+    with self.lock:
+      values = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+    samples = []
+    for key, (counts, total) in values:
+      cumulative = 0
+      for bound, count in zip(self.buckets, counts):
+        cumulative += count
+        samples.append(('_bucket', key, (('le', format_value(bound)),), cumulative))
+      samples.append(('_sum', key, (), total))
+      samples.append(('_count', key, (), cumulative))
+    return samples
+
+
+class Collected(Metric):
+  """ A metric whose samples come from `collect()`, a function returning [(label values, value), ...] """
+
+  def __init__(self, name, documentation, type, labels, collect):
+    super().__init__(name, documentation, labels)
+    self.type = type
+    self.collect = collect
+
+  def samples(self):
+    return [('', tuple(key), (), value) for key, value in self.collect()]
+
+
+def render():
+  lines = []
+  for metric in registry:
+    lines.append(f'# HELP {metric.name} {metric.documentation}')
+    lines.append(f'# TYPE {metric.name} {metric.type}')
+    for suffix, key, extra, value in metric.samples():
+      lines.append(f'{metric.name}{suffix}{format_labels(metric.labels, key, extra)} {format_value(value)}')
+  return '\n'.join(lines) + '\n'
@@ -0,0 +1,43 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import app
+import asgi
+
+
+class UpstreamGetTest(unittest.IsolatedAsyncioTestCase):
+
+  async def get(self, handler):
+    stats = app.UpstreamStats()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with mock.patch.object(asgi, 'client', client), mock.patch.dict(app.upstreams, {'ip-api': stats}):
+      try:
+        return await asgi.upstream_get('ip-api', 'http://upstream.test/json'), stats
+      except Exception as e:
+        return e, stats
+      finally:
+        await client.aclose()
+
+  async def test_json_body_is_a_success(self):
+    result, stats = await self.get(lambda request: httpx.Response(200, json={'status': 'success'}))
+    self.assertEqual(result, {'status': 'success'})
+    self.assertEqual((stats.calls, stats.errors), (1, 0))
+
+  async def test_body_that_is_not_json_is_an_error(self):
+    result, stats = await self.get(lambda request: httpx.Response(200, text='<html>'))
+    self.assertIsInstance(result, ValueError)
+    self.assertEqual((stats.calls, stats.errors), (1, 1))
+
+  async def test_error_status_is_an_error(self):
+    result, stats = await self.get(lambda request: httpx.Response(503))
+    self.assertIsInstance(result, httpx.HTTPStatusError)
+    self.assertEqual((stats.calls, stats.errors), (1, 1))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import app
+
+
+class BatchTest(unittest.TestCase):
+
+  def setUp(self):
+    self.client = app.app.test_client()
+    for name, value in (('tzcache', app.TTLCache(10, 60, 60)), ('tz_lookups', app.SingleFlight()),
+                        ('geoip_db', None)):
+      patcher = mock.patch.object(app, name, value)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def post(self, body, auth=app.API_SECRET):
+    return self.client.post('/batch', json=body, headers={'Authorization': auth})
+
+  def test_every_ip_is_resolved_once(self):
+    fetch = mock.Mock(return_value={'status': 'success', 'timezone': 'UTC'})
+    items = [{'ip': '192.0.2.1', 'protocol': 'ssh'}, {'ip': '192.0.2.1', 'protocol': 'http'},
+             {'ip': '192.0.2.2', 'protocol': 'ssh'}]
+    with mock.patch.object(app, 'fetch_timezone', fetch):
+      response = self.post({'requests': items, 'policies': ['fridayrule', 'random']})
+    self.assertEqual(response.status_code, 200)
+    results = response.get_json()['results']
+    self.assertEqual(len(results), 3)
+    self.assertEqual(fetch.call_count, 2)
+    self.assertEqual(results[1]['decisions']['random'], {'status': 401, 'body': {'confidence_score': 0}})
+    self.assertIn(results[0]['decisions']['fridayrule']['status'], (200, 401))
+
+  def test_failed_lookup_only_fails_its_items(self):
+    def fetch(ip):
+      if ip == '10.0.0.1':
+        return {'status': 'fail', 'message': 'private range'}
+      return {'status': 'success', 'timezone': 'UTC'}
+
+    with mock.patch.object(app, 'fetch_timezone', fetch):
+      response = self.post({'requests': [{'ip': '10.0.0.1'}, {'ip': '192.0.2.1'}], 'policies': ['businesshours']})
+    results = response.get_json()['results']
+    self.assertEqual(results[0]['decisions']['businesshours']['status'], 400)
+    self.assertIn(results[1]['decisions']['businesshours']['status'], (200, 401))
+
+  def test_invalid_batches_are_rejected(self):
+    self.assertEqual(self.post({'requests': 'nope'}).status_code, 400)
+    self.assertEqual(self.post({'requests': [], 'policies': ['unknown']}).status_code, 400)
+    self.assertEqual(self.post({'requests': []}, auth='wrong').status_code, 401)
+
+
+if __name__ == '__main__':
+  unittest.main()
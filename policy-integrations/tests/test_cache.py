@@ -0,0 +1,86 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import app
+
+
+class FakeClock(object):
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+class TTLCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.clock = FakeClock()
+    patcher = mock.patch.object(app.time, 'monotonic', self.clock)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_hit_miss_and_expiry(self):
+    cache = app.TTLCache(10, ttl=60, negative_ttl=5)
+    self.assertIsNone(cache.get('a'))
+    cache.set('a', 1)
+    self.assertEqual(cache.get('a'), 1)
+    self.clock.now += 60
+    self.assertIsNone(cache.get('a'))
+    stats = cache.stats()
+    self.assertEqual((stats['hits'], stats['misses'], stats['expirations'], stats['size']), (1, 2, 1, 0))
+
+  def test_least_recently_used_entry_is_evicted(self):
+    cache = app.TTLCache(2, ttl=60, negative_ttl=5)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    self.assertEqual(cache.get('a'), 1)
+    self.assertIsNone(cache.get('b'))
+    self.assertEqual(cache.stats()['evictions'], 1)
+
+  def test_failures_are_cached_for_the_negative_ttl(self):
+    cache = app.TTLCache(10, ttl=60, negative_ttl=5)
+    cache.set_failure('a', 'upstream down')
+    with self.assertRaises(app.LookupFailed):
+      cache.get('a')
+    self.clock.now += 5
+    self.assertIsNone(cache.get('a'))
+    self.assertEqual(cache.stats()['negative_hits'], 1)
+
+  def test_stale_entries_are_only_served_by_get_or_stale(self):
+    cache = app.TTLCache(10, ttl=60, negative_ttl=5, stale_ttl=100)
+    cache.set('a', 1)
+    self.clock.now += 90
+    self.assertEqual(cache.get_or_stale('a'), (1, True))
+    self.assertIsNone(cache.get('a'))
+    self.assertEqual(cache.get_or_stale('a'), (1, True))
+    self.clock.now += 100
+    self.assertEqual(cache.get_or_stale('a'), (None, False))
+
+  def test_peek_is_not_counted(self):
+    cache = app.TTLCache(10, ttl=60, negative_ttl=5)
+    cache.set('a', 1)
+    self.assertEqual(cache.peek('a'), 1)
+    self.assertIsNone(cache.peek('b'))
+    stats = cache.stats()
+    self.assertEqual((stats['hits'], stats['misses']), (0, 0))
+
+  def test_dump_and_load_keep_the_remaining_ttl(self):
+    cache = app.TTLCache(10, ttl=60, negative_ttl=5)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=10)
+    cache.set_failure('c', 'down')
+    restored = app.TTLCache(10, ttl=60, negative_ttl=5)
+    self.assertEqual(restored.load(cache.dump(), age=20), 1)
+    self.assertEqual(restored.get('a'), 1)
+    self.assertIsNone(restored.get('b'))
+    self.clock.now += 40
+    self.assertIsNone(restored.get('a'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import geoip
+
+RANGES = """start_ip,end_ip,timezone,city,countryCode
+1.0.0.0,1.0.0.255,Australia/Brisbane,Brisbane,AU
+16777472,16778239,Asia/Shanghai,Fuzhou,CN
+# comment
+2001:db8::,2001:db8::ffff,Europe/Amsterdam,Amsterdam,NL
+8.8.8.0,8.8.8.255,America/Los_Angeles,Mountain View,US
+"""
+
+
+class RangeIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.csv_path = os.path.join(directory.name, 'ranges.csv')
+    with open(self.csv_path, 'w') as f:
+      f.write(RANGES)
+    self.db = geoip.open_database(self.csv_path)
+    self.addCleanup(self.db.close)
+
+  def test_lookup(self):
+    self.assertEqual(self.db.lookup('1.0.0.7')['timezone'], 'Australia/Brisbane')
+    self.assertEqual(self.db.lookup('1.0.1.0')['city'], 'Fuzhou')
+    self.assertEqual(self.db.lookup('8.8.8.8')['countryCode'], 'US')
+    self.assertEqual(self.db.lookup('2001:db8::1')['timezone'], 'Europe/Amsterdam')
+    # IPv4 mapped IPv6 addresses are the IPv4 address
+    self.assertEqual(self.db.lookup('::ffff:8.8.8.8')['timezone'], 'America/Los_Angeles')
+    self.assertEqual(self.db.lookup('8.8.8.8')['source'], 'local')
+
+  def test_addresses_outside_every_range(self):
+    self.assertIsNone(self.db.lookup('0.255.255.255'))
+    self.assertIsNone(self.db.lookup('1.0.4.0'))
+    self.assertIsNone(self.db.lookup('255.255.255.255'))
+    self.assertIsNone(self.db.lookup('2001:db8::1:0'))
+    self.assertIsNone(self.db.lookup('not an address'))
+
+  def test_index_is_reused_until_the_csv_changes(self):
+    index_path = self.csv_path + '.idx'
+    built_at = os.path.getmtime(index_path)
+    geoip.open_database(self.csv_path).close()
+    self.assertEqual(os.path.getmtime(index_path), built_at)
+    os.utime(self.csv_path, (built_at + 10, built_at + 10))
+    geoip.open_database(self.csv_path).close()
+    self.assertGreater(os.path.getmtime(index_path), built_at)
+
+
+if __name__ == '__main__':
+  unittest.main()
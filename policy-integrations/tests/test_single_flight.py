@@ -0,0 +1,148 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import app
+import asgi
+
+
+class SingleFlightTest(unittest.TestCase):
+
+  def run_concurrently(self, flight, fn, callers=8):
+    results, errors = [], []
+
+    def call():
+      try:
+        results.append(flight.do('key', fn))
+      except Exception as e:
+        errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+      thread.start()
+    # let every caller arrive while the leader is still running
+    deadline = time.monotonic() + 2
+    while flight.stats()['coalesced'] < callers - 1 and time.monotonic() < deadline:
+      time.sleep(0.001)
+    return threads, results, errors
+
+  def test_concurrent_calls_share_one_execution(self):
+    flight = app.SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+      calls.append(1)
+      release.wait(2)
+      return 'result'
+
+    threads, results, errors = self.run_concurrently(flight, fn)
+    release.set()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(len(calls), 1)
+    self.assertEqual(results, ['result'] * 8)
+    self.assertEqual(flight.stats(), {'executed': 1, 'coalesced': 7, 'in_flight': 0})
+
+  def test_error_is_shared_and_not_kept(self):
+    flight = app.SingleFlight()
+    release = threading.Event()
+
+    def fn():
+      release.wait(2)
+      raise ValueError('boom')
+
+    threads, results, errors = self.run_concurrently(flight, fn)
+    release.set()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(len(errors), 8)
+    self.assertTrue(all(isinstance(e, ValueError) for e in errors))
+    # the next call runs again instead of getting the old error
+    self.assertEqual(flight.do('key', lambda: 'ok'), 'ok')
+
+class TimezoneLookupTest(unittest.TestCase):
+
+  def setUp(self):
+    for name, value in (('tzcache', app.TTLCache(10, 60, 60)), ('tz_lookups', app.SingleFlight()),
+                        ('geoip_db', None)):
+      patcher = mock.patch.object(app, name, value)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def test_concurrent_cold_lookups_fetch_once_and_count_one_miss_each(self):
+    release = threading.Event()
+    fetches = []
+
+    def fetch(ip):
+      fetches.append(ip)
+      release.wait(2)
+      return {'status': 'success', 'timezone': 'Europe/Amsterdam'}
+
+    with mock.patch.object(app, 'fetch_timezone', fetch):
+      threads = [threading.Thread(target=app.get_timezone, args=('192.0.2.1',)) for _ in range(5)]
+      for thread in threads:
+        thread.start()
+      deadline = time.monotonic() + 2
+      while app.tz_lookups.stats()['coalesced'] < 4 and time.monotonic() < deadline:
+        time.sleep(0.001)
+      release.set()
+      for thread in threads:
+        thread.join()
+      self.assertEqual(app.get_timezone('192.0.2.1')['timezone'], 'Europe/Amsterdam')
+    self.assertEqual(fetches, ['192.0.2.1'])
+    stats = app.tzcache.stats()
+    self.assertEqual((stats['misses'], stats['hits']), (5, 1))
+
+  def test_failed_lookup_is_cached(self):
+    fetch = mock.Mock(return_value={'status': 'fail', 'message': 'private range'})
+    with mock.patch.object(app, 'fetch_timezone', fetch):
+      for _ in range(2):
+        with self.assertRaises(app.LookupFailed):
+          app.get_timezone('10.0.0.1')
+    self.assertEqual(fetch.call_count, 1)
+
+class AsyncSingleFlightTest(unittest.IsolatedAsyncioTestCase):
+
+  async def test_concurrent_calls_share_one_task(self):
+    flight = asgi.AsyncSingleFlight()
+    release = asyncio.Event()
+    calls = []
+
+    async def fn():
+      calls.append(1)
+      await release.wait()
+      return 'result'
+
+    waiters = [asyncio.ensure_future(flight.do('key', fn)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    self.assertEqual(await asyncio.gather(*waiters), ['result'] * 5)
+    self.assertEqual(len(calls), 1)
+    self.assertEqual(flight.stats(), {'executed': 1, 'coalesced': 4, 'in_flight': 0})
+
+  async def test_cancelled_caller_does_not_cancel_the_others(self):
+    flight = asgi.AsyncSingleFlight()
+    release = asyncio.Event()
+
+    async def fn():
+      await release.wait()
+      return 'result'
+
+    first = asyncio.ensure_future(flight.do('key', fn))
+    second = asyncio.ensure_future(flight.do('key', fn))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+    self.assertEqual(await second, 'result')
+    with self.assertRaises(asyncio.CancelledError):
+      await first
+
+
+if __name__ == '__main__':
+  unittest.main()